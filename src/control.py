@@ -0,0 +1,151 @@
+import json
+import os
+import socket
+import sys
+import threading
+from logger_config import logger
+from settings import settings
+
+# 控制接口协议：客户端连接 UNIX 套接字，每行发送一条命令 (纯文本 "pause 600" 或 JSON {"cmd": "pause", "args": ["600"]})，
+# 服务端每条命令回复一行 JSON ({"ok": true, ...} 或 {"ok": false, "error": "..."})。
+# 命令只读取内存中的状态或把任务交给调度器，不在连接线程中执行探测或登录，因此查询成本极低。
+CLIENT_TIMEOUT = 5  # 单个连接空闲超过该秒数后断开
+MAX_LINE = 4096
+
+
+def parse_command(line):
+    """解析一行命令，返回 (命令名, 参数列表)。"""
+    line = line.strip()
+    if line.startswith(('{', '[')):
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("JSON 命令必须是对象")
+        args = request.get('args', [])
+        if not isinstance(args, list):
+            raise ValueError("args 必须是数组")
+        return str(request.get('cmd', '')).lower(), [str(a) for a in args]
+    name, *args = line.split()
+    return name.lower(), args
+
+
+class ControlServer:
+    """本机 UNIX 套接字控制接口 ([control] socket)。
+
+    handlers 为 {命令名: func(args) -> dict}；处理函数抛出的 ValueError 作为错误信息返回给客户端，
+    其他异常记录日志后返回通用错误。套接字权限为 0660，只有同一用户 (或同组) 的进程可以连接。
+    """
+
+    def __init__(self, path, handlers):
+        self.path = path
+        self.handlers = dict(handlers)
+        self.handlers.setdefault('help', lambda args: {'commands': sorted(self.handlers)})
+        self._sock = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if not hasattr(socket, 'AF_UNIX'):
+            logger.info("当前平台不支持 UNIX 套接字，控制接口未启用。")
+            return False
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # 上一次运行遗留的套接字文件
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(self.path)
+            os.chmod(self.path, 0o660)
+            sock.listen(16)
+        except OSError as e:
+            logger.error(f"控制接口启动失败 ({self.path}): {e}")
+            return False
+        self._sock = sock
+        threading.Thread(target=self._serve, name='snaf-control', daemon=True).start()
+        logger.info(f"控制接口已启动: {self.path}")
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._sock is not None:
+            self._sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                if self._stopped.is_set():
+                    return
+                continue
+            threading.Thread(target=self._handle, args=(conn,), name='snaf-control-conn', daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            conn.settimeout(CLIENT_TIMEOUT)
+            reader = conn.makefile('rb')
+            try:
+                while True:
+                    # 限制单行读取长度，避免客户端发送不带换行的超长数据占满内存
+                    line = reader.readline(MAX_LINE + 1)
+                    if not line:
+                        return
+                    if len(line) > MAX_LINE and not line.endswith(b'\n'):
+                        self._reply(conn, {'ok': False, 'error': f"命令过长 (超过 {MAX_LINE} 字节)"})
+                        return  # 剩余数据无法与命令边界对齐，直接断开
+                    line = line.decode('utf-8', errors='replace')
+                    if line.strip():
+                        self._reply(conn, self.dispatch(line))
+            except OSError:
+                pass  # 客户端断开或超时
+
+    @staticmethod
+    def _reply(conn, reply):
+        conn.sendall((json.dumps(reply, ensure_ascii=False) + '\n').encode('utf-8'))
+
+    def dispatch(self, line):
+        """执行一条命令并返回回复对象。"""
+        try:
+            name, args = parse_command(line)
+        except ValueError as e:
+            return {'ok': False, 'error': f"无法解析的命令: {e}"}
+        handler = self.handlers.get(name)
+        if handler is None:
+            return {'ok': False, 'error': f"未知命令: {name}", 'commands': sorted(self.handlers)}
+        try:
+            return dict({'ok': True}, **(handler(args) or {}))
+        except ValueError as e:
+            return {'ok': False, 'error': str(e)}
+        except Exception as e:
+            logger.error(f"控制命令 '{name}' 执行失败: {e}", exc_info=True)
+            return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+
+def request(command, path=None, timeout=CLIENT_TIMEOUT):
+    """向运行中的实例发送一条命令并返回回复对象 (供运维脚本使用)。"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path or settings.control.socket)
+        sock.sendall(command.encode('utf-8') + b'\n')
+        reply = sock.makefile('r', encoding='utf-8').readline()
+    return json.loads(reply)
+
+
+def main(argv=None):
+    """命令行客户端: python control.py [--socket PATH] {status,check,relogin,stats,pause [秒],resume,ping,help}"""
+    import argparse
+    parser = argparse.ArgumentParser(description='向运行中的 Snaf 发送控制命令')
+    parser.add_argument('--socket', default=None, help='控制套接字路径 (默认 [control] socket)')
+    parser.add_argument('command', nargs='+', help='命令及参数，例如 status、check、pause 600')
+    args = parser.parse_args(argv)
+    try:
+        reply = request(' '.join(args.command), args.socket)
+    except OSError as e:
+        print(f"无法连接控制接口 ({args.socket or settings.control.socket}): {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(reply, ensure_ascii=False, indent=2))
+    return 0 if reply.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+from logger_config import log_file_path, logger
+from settings import settings
+
+# 与上一次已发送的诊断包相同的部分只保留一行说明；摘要保存在发件箱目录中 (不以 .json 结尾，发件箱不会把它当作通知)
+STATE_FILE = 'diagnostics.state'
+HISTORY_ROWS = 50  # 附带最近多少条探测/登录事件
+LOG_TAIL_BYTES = 256 * 1024  # 读取日志末尾的最大字节数
+TIMING = re.compile(r'\d+(\.\d+)? ms')  # 比较是否变化时忽略耗时数字
+
+
+def _run(cmd, encoding):
+    """执行一个命令并返回输出 (不弹出控制台窗口)。"""
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding=encoding, errors='replace',
+                            timeout=settings.email.diag_budget, creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+    return result.stdout or result.stderr
+
+
+# --- 诊断项 --- START
+def _interfaces():
+    from iface_utils import campus_interfaces, get_interfaces
+    interfaces = get_interfaces(refresh=True)
+    campus = {i.address for i in campus_interfaces(interfaces=interfaces)}
+    lines = [f"{i.name:<16} {i.address:<16} {i.netmask or '?':<16} {'up' if i.up else 'down'}"
+             f"{'  (校园网)' if i.address in campus else ''}" for i in interfaces]
+    if sys.platform == 'win32':
+        # Windows 上的进程内接口表只有地址，完整信息仍需 ipconfig /all
+        lines += ['', _run(['ipconfig', '/all'], 'gbk')]
+    return '\n'.join(lines) or '没有可用的网络接口'
+
+
+def _routes():
+    if sys.platform.startswith('linux'):
+        lines = []
+        with open('/proc/net/route') as f:
+            next(f)
+            for row in f:
+                fields = row.split()
+                dest, gateway, mask = (socket.inet_ntoa(int(fields[i], 16).to_bytes(4, 'little')) for i in (1, 2, 7))
+                lines.append(f"{dest}/{mask} via {gateway} dev {fields[0]} metric {fields[6]}")
+        return '\n'.join(lines)
+    if sys.platform == 'win32':
+        return _run(['route', 'print', '-4'], 'gbk')
+    return _run(['netstat', '-rn'], 'utf-8')
+
+
+def _dns():
+    """系统解析器对各目标的解析耗时 (并行，绕过进程内缓存)，以及进程内缓存的内容。"""
+    import dns_cache
+    import probe_utils
+    hosts = {urlsplit(p.target).hostname if '://' in p.target else p.target.rpartition(':')[0] or p.target
+             for p in probe_utils.PROBES if p.kind != 'portal'}
+    hosts.add(settings.email.smtp_server)
+    hosts = sorted(h for h in hosts if h)
+
+    def lookup(host):
+        start = time.perf_counter()
+        try:
+            addresses = sorted({info[4][0] for info in socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)})
+            outcome = ', '.join(addresses)
+        except OSError as e:
+            outcome = f"失败: {e}"
+        return f"{host:<32} {(time.perf_counter() - start) * 1000:7.1f} ms  {outcome}"
+
+    with ThreadPoolExecutor(max_workers=max(1, len(hosts)), thread_name_prefix='snaf-diag-dns') as pool:
+        lines = list(pool.map(lookup, hosts))
+    lines += ['', '进程内缓存:']
+    for host, (addresses, ttl) in sorted(dns_cache.resolver.snapshot().items()):
+        lines.append(f"{host:<32} {', '.join(addresses)}  ({'剩余' if ttl >= 0 else '已过期'} {abs(ttl):.0f} 秒)")
+    return '\n'.join(lines)
+
+
+def _portal():
+    """认证网关的 TCP 可达性和在线状态查询。"""
+    from network_utils import get_portal_client
+    login = urlsplit(settings.network.login_url)
+    port = login.port or (443 if login.scheme == 'https' else 80)
+    start = time.perf_counter()
+    try:
+        socket.create_connection((login.hostname, port), timeout=2).close()
+        reach = f"TCP {login.hostname}:{port} 可达 ({(time.perf_counter() - start) * 1000:.1f} ms)"
+    except OSError as e:
+        reach = f"TCP {login.hostname}:{port} 不可达: {e}"
+    status = get_portal_client().status(timeout=2)
+    return f"{reach}\n在线状态查询: online={status.online} {status.message}"
+
+
+def _history():
+    from event_store import EventStore
+    if not settings.history.enabled or not os.path.exists(settings.history.db_file):
+        return '事件历史未启用'
+    store = EventStore(settings.history.db_file)
+    try:
+        rows = store.events(kinds=('probe', 'login', 'diagnosis'), days=1)[-HISTORY_ROWS:]
+    finally:
+        store.close()
+    return '\n'.join(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts_ms / 1000))}  {kind:<9} "
+                     f"{'-' if ok is None else ('成功' if ok else '失败')}" for ts_ms, kind, ok in rows)
+
+
+def _log_tail():
+    lines = settings.email.diag_log_lines
+    with open(log_file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - LOG_TAIL_BYTES))
+        return b'\n'.join(f.read().splitlines()[-lines:]).decode('utf-8', errors='replace')
+
+
+SECTIONS = (
+    ('interfaces', '网络接口', _interfaces),
+    ('routes', '路由表', _routes),
+    ('dns', 'DNS 解析耗时', _dns),
+    ('portal', '认证网关', _portal),
+    ('history', '最近的探测/登录记录', _history),
+    ('log', '日志末尾', _log_tail),
+)
+# --- 诊断项 --- END
+
+
+def collect(budget=None):
+    """并行收集所有诊断项，总耗时不超过 budget 秒 (默认 [Email] diag_budget)。
+
+    返回 [(键, 标题, 内容, 耗时毫秒)]；超时或出错的诊断项内容为说明文字，不影响其他项。
+    """
+    budget = settings.email.diag_budget if budget is None else budget
+    pool = ThreadPoolExecutor(max_workers=len(SECTIONS), thread_name_prefix='snaf-diag')
+    start = time.perf_counter()
+
+    def timed(func):
+        began = time.perf_counter()
+        return func(), (time.perf_counter() - began) * 1000
+
+    futures = [pool.submit(timed, func) for _, _, func in SECTIONS]
+    wait(futures, timeout=budget)
+    pool.shutdown(wait=False)  # 超时的诊断项在后台自行结束，不再等待
+    results = []
+    for (key, title, _), future in zip(SECTIONS, futures):
+        if not future.done():
+            text, elapsed = f"(未在 {budget:g} 秒内完成)", budget * 1000
+        elif future.exception() is not None:
+            text, elapsed = f"(收集失败: {type(future.exception()).__name__}: {future.exception()})", 0.0
+        else:
+            text, elapsed = future.result()
+        results.append((key, title, text, elapsed))
+    logger.debug(f"诊断信息收集完成，耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+    return results
+
+
+class Bundle:
+    """一次收集的诊断包：gzip 压缩的文本附件，以及发送成功后需要保存的各部分摘要。"""
+
+    def __init__(self, filename, data, digests, unchanged, elapsed_ms):
+        self.filename = filename
+        self.data = data
+        self.digests = digests
+        self.unchanged = unchanged
+        self.elapsed_ms = elapsed_ms
+
+    def summary(self):
+        text = f"诊断信息见附件 {self.filename} ({len(self.data) / 1024:.1f} KB，收集耗时 {self.elapsed_ms:.0f} ms)"
+        if self.unchanged:
+            text += f"；与上次发送的诊断包相同而省略的部分: {', '.join(self.unchanged)}"
+        return text
+
+    def mark_sent(self):
+        """邮件发送成功后调用：记录各部分摘要，下一次相同的部分只保留一行说明。"""
+        path = os.path.join(settings.email.spool_dir, STATE_FILE)
+        try:
+            os.makedirs(settings.email.spool_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.digests, f)
+        except OSError as e:
+            logger.warning(f"保存诊断包摘要失败: {e}")
+
+
+def _load_state():
+    try:
+        with open(os.path.join(settings.email.spool_dir, STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_bundle(budget=None):
+    """收集诊断信息并生成压缩附件，未变化的部分与上一次已发送的诊断包去重。"""
+    start = time.perf_counter()
+    sent = _load_state()
+    moment = time.strftime('%Y-%m-%d %H:%M:%S')
+    digests, unchanged, parts = {}, [], []
+    for key, title, text, elapsed in collect(budget):
+        digest = hashlib.sha256(TIMING.sub('ms', text).encode('utf-8')).hexdigest()
+        previous = sent.get(key)
+        if previous and previous[0] == digest:
+            digests[key] = previous
+            unchanged.append(title)
+            text = f"(与 {previous[1]} 发送的诊断包相同，已省略)"
+        else:
+            digests[key] = [digest, moment]
+        parts.append(f"===== {title} ({elapsed:.0f} ms) =====\n{text}\n")
+    body = f"Snaf 诊断信息 {moment}\n\n" + '\n'.join(parts)
+    data = gzip.compress(body.encode('utf-8'), compresslevel=9)
+    filename = f"snaf-diag-{time.strftime('%Y%m%d-%H%M%S')}.txt.gz"
+    return Bundle(filename, data, digests, unchanged, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,104 @@
+import enum
+import socket
+from logger_config import logger
+from settings import settings
+import metrics
+from iface_utils import campus_interfaces, get_interfaces
+from network_utils import get_portal_client
+from probe_utils import HTTP_KINDS
+
+
+class Diagnosis(enum.Enum):
+    """断网原因分类。"""
+    LINK_DOWN = 'link_down'                    # 没有已启用的网络接口 (网线拔出、无线未连接)
+    NO_ADDRESS = 'no_address'                  # 链路正常但没有校园网地址 (DHCP 未完成)
+    CAPTIVE_PORTAL = 'captive_portal'          # 被认证网关拦截，本机未认证
+    PORTAL_UNREACHABLE = 'portal_unreachable'  # 认证网关不可达
+    DNS_FAILURE = 'dns_failure'                # 已认证、IP 层可达，只有域名解析失败
+    UPSTREAM_OUTAGE = 'upstream_outage'        # 网关显示已认证，但外网不通
+    UNKNOWN = 'unknown'                        # 无法判断
+
+
+# 只有这些情况值得尝试登录；无法判断时保持原有行为 (尝试登录)
+LOGIN_FIXABLE = frozenset({Diagnosis.CAPTIVE_PORTAL, Diagnosis.UNKNOWN})
+
+DIAGNOSIS_LABELS = {
+    Diagnosis.LINK_DOWN: '网络链路断开 (网线未连接或无线未连接)',
+    Diagnosis.NO_ADDRESS: '没有获取到校园网地址 (DHCP 未完成)',
+    Diagnosis.CAPTIVE_PORTAL: '被校园网认证网关拦截 (未认证)',
+    Diagnosis.PORTAL_UNREACHABLE: '校园网认证网关不可达',
+    Diagnosis.DNS_FAILURE: '域名解析失败 (已认证，IP 层可达)',
+    Diagnosis.UPSTREAM_OUTAGE: '校园网出口故障 (已认证，但外网不通)',
+    Diagnosis.UNKNOWN: '原因未知',
+}
+
+# 各探测后端在域名解析失败时的错误描述片段
+_RESOLVE_ERRORS = ('gaierror', 'NameResolutionError', 'Failed to resolve', 'Name or service not known',
+                   'getaddrinfo failed', 'nodename nor servname')
+
+
+def _intercepted(results):
+    """外网 HTTP 探测收到了重定向或非预期内容，说明请求被网关劫持。"""
+    for result in results:
+        if result.probe.kind in HTTP_KINDS and not result.ok and result.detail.startswith('HTTP 3'):
+            return True
+        if result.probe.kind == 'http204' and result.detail == 'HTTP 200':
+            return True
+    return False
+
+
+def _resolve_failed(results):
+    return any(any(marker in result.detail for marker in _RESOLVE_ERRORS) for result in results if not result.ok)
+
+
+def _upstream_reachable(timeout):
+    """绕过 DNS，直接向 [Network] upstream_ip 建立 TCP 连接，判断外网在 IP 层是否可达。"""
+    host, _, port = settings.network.upstream_ip.rpartition(':')
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            return True
+    except (OSError, ValueError):
+        return False
+
+
+def diagnose(report, timeout=None):
+    """根据失败的探测报告和本机状态判断断网原因，返回 (Diagnosis, 说明)。
+
+    依次检查：本机链路 -> 校园网地址 -> 认证网关状态 -> 域名解析 / 外网出口。
+    除认证网关状态查询 (局域网内，约 1 ms) 和一次 TCP 连接外不产生额外网络请求。
+    """
+    timeout = settings.network.probe_timeout if timeout is None else timeout
+    results = report.results
+    interfaces = [i for i in get_interfaces() if not i.address.startswith('127.')]
+    if not any(i.up for i in interfaces):
+        return Diagnosis.LINK_DOWN, "没有已启用的网络接口"
+    campus = campus_interfaces(interfaces=interfaces)
+    if not campus:
+        return Diagnosis.NO_ADDRESS, f"没有 {settings.network.campus_prefix}x.x 地址"
+    if not any(i.up for i in campus):
+        return Diagnosis.LINK_DOWN, f"校园网接口 {campus[0].name} 未启用"
+
+    status = get_portal_client().status(timeout=timeout)
+    if status.online is None:
+        if _intercepted(results):
+            return Diagnosis.CAPTIVE_PORTAL, f"外网请求被重定向，网关状态查询失败: {status.message}"
+        return Diagnosis.PORTAL_UNREACHABLE, status.message
+    if not status.online:
+        return Diagnosis.CAPTIVE_PORTAL, "网关显示本机未认证"
+    if _resolve_failed(results) and _upstream_reachable(timeout):
+        return Diagnosis.DNS_FAILURE, "域名解析失败，但外网 IP 可达"
+    return Diagnosis.UPSTREAM_OUTAGE, f"网关显示已认证 ({status.account or '未知账号'})，外网探测未达到法定数"
+
+
+def run_diagnosis(report):
+    """执行诊断并记录日志和指标，任何异常都视为无法判断。"""
+    if not settings.schedule.diagnose:
+        return Diagnosis.UNKNOWN, "诊断已关闭"
+    try:
+        diagnosis, detail = diagnose(report)
+    except Exception as e:
+        logger.error(f"断网诊断时发生错误: {e}", exc_info=True)
+        diagnosis, detail = Diagnosis.UNKNOWN, str(e)
+    metrics.diagnosis_results.inc(cause=diagnosis.value)
+    logger.info(f"断网诊断: {DIAGNOSIS_LABELS[diagnosis]} ({detail})")
+    return diagnosis, detail
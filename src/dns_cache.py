@@ -0,0 +1,208 @@
+import collections
+import concurrent.futures
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+from logger_config import logger
+from settings import settings
+import metrics
+
+# addresses: 解析结果 (IPv4 在前)；expires: 过期时间；stale_until: 解析失败时仍可使用旧结果的截止时间 (monotonic)
+Entry = collections.namedtuple('Entry', ['addresses', 'expires', 'stale_until'])
+
+# A 和 AAAA 记录分别查询，互不等待
+FAMILIES = (socket.AF_INET, socket.AF_INET6)
+
+
+def _is_literal(host):
+    for family in FAMILIES:
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except OSError:
+            pass
+    return False
+
+
+def parse_pins(spec):
+    """解析 [Network] dns_pins ('主机=地址, 主机=地址')，同一主机可以出现多次，返回 {主机: (地址, ...)}。"""
+    pins = {}
+    for item in spec.split(','):
+        host, sep, address = item.strip().partition('=')
+        host, address = host.strip().lower(), address.strip()
+        if not item.strip():
+            continue
+        if not sep or not host or not _is_literal(address):
+            logger.warning(f"忽略无法识别的 DNS 固定解析: '{item.strip()}'")
+            continue
+        pins[host] = pins.get(host, ()) + (address,)
+    return pins
+
+
+class Resolver:
+    """进程内 DNS 缓存，位于探测、登录和 SMTP 建连之下。
+
+    - 解析结果缓存 ttl 秒；系统解析器超时或失败时，在 stale 秒内继续使用旧结果 (校园网半断时 DNS 往往最先超时)。
+    - A/AAAA 并行查询，整体等待不超过 timeout 秒；同一主机的并发查询合并为一次。
+    - 固定解析的主机 (dns_pins 和 Portal/SMTP 主机) 永远直接返回已知地址，过期后在后台刷新，不阻塞调用方。
+    """
+
+    def __init__(self, ttl, stale, timeout, pins=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale = stale
+        self.timeout = timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pins = dict(pins or {})
+        self._pinned = set()  # 启动时预解析、过期后在后台刷新的主机
+        self._inflight = {}
+        # 查询任务和其中的 getaddrinfo 调用分属两个线程池，查询任务等待 getaddrinfo 时不会占满同一个池而互相等死
+        self._lookups = ThreadPoolExecutor(max_workers=4, thread_name_prefix='snaf-dns')
+        self._queries = ThreadPoolExecutor(max_workers=8, thread_name_prefix='snaf-dns-query')
+
+    def configure(self, ttl, stale, timeout, pins):
+        with self._lock:
+            self.ttl, self.stale, self.timeout = ttl, stale, timeout
+            self._pins = dict(pins)
+
+    def resolve(self, host):
+        """返回主机的地址列表 (IPv4 在前)；无法解析且没有可用的旧结果时抛出 socket.gaierror。"""
+        if _is_literal(host):
+            return [host]
+        key = host.lower().rstrip('.')
+        now = self.clock()
+        with self._lock:
+            if key in self._pins:
+                metrics.dns_cache_results.inc(result='pinned')
+                return list(self._pins[key])
+            entry = self._entries.get(key)
+            pinned = key in self._pinned
+        if entry is not None and (now < entry.expires or pinned):
+            if now >= entry.expires:
+                self._refresh(key)
+            metrics.dns_cache_results.inc(result='hit')
+            return list(entry.addresses)
+        metrics.dns_cache_results.inc(result='miss')
+        try:
+            return list(self._wait(self._refresh(key)))
+        except OSError as e:
+            if entry is not None and now < entry.stale_until:
+                logger.warning(f"解析 {key} 失败 ({e})，继续使用 {now - entry.expires + self.ttl:.0f} 秒前的解析结果。")
+                metrics.dns_cache_results.inc(result='stale')
+                return list(entry.addresses)
+            raise
+
+    def preresolve(self, hosts):
+        """在后台预解析并固定这些主机：之后即使记录过期也直接返回已知地址，同时在后台刷新。"""
+        for host in hosts:
+            if host and not _is_literal(host):
+                key = host.lower().rstrip('.')
+                with self._lock:
+                    self._pinned.add(key)
+                self._refresh(key)
+
+    def snapshot(self):
+        """当前缓存内容 {主机: (地址元组, 距过期的秒数，负数表示已过期)}，供诊断信息使用。"""
+        now = self.clock()
+        with self._lock:
+            return {host: (entry.addresses, entry.expires - now) for host, entry in self._entries.items()}
+
+    def create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+        """与 socket.create_connection 相同，但主机名经本缓存解析；依次尝试每个地址。"""
+        host, port = address
+        last_error = None
+        for ip in self.resolve(host):
+            family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+            if source_address and (':' in source_address[0]) != (family == socket.AF_INET6):
+                continue  # 绑定的源地址与目标地址族不同
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect((ip, port))
+                return sock
+            except OSError as e:
+                sock.close()
+                last_error = e
+        raise last_error or socket.gaierror(socket.EAI_NONAME, f"{host} 没有可用的地址")
+
+    def _refresh(self, key):
+        """发起 (或加入已在进行的) 一次查询，返回其 Future。"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._lookups.submit(self._lookup, key)
+        return future
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise socket.timeout(f"DNS 查询超过 {self.timeout:g} 秒") from None
+
+    def _lookup(self, key):
+        """A/AAAA 并行查询，写入缓存并返回地址元组。"""
+        start = time.perf_counter()
+        try:
+            futures = [self._queries.submit(socket.getaddrinfo, key, None, family, socket.SOCK_STREAM)
+                       for family in FAMILIES]
+            done, _ = wait(futures, timeout=self.timeout)
+            addresses, errors = [], []
+            for future in futures:  # 保持 A 在前
+                if future not in done:
+                    continue
+                try:
+                    addresses.extend(info[4][0] for info in future.result() if info[4][0] not in addresses)
+                except OSError as e:
+                    errors.append(e)
+            elapsed = time.perf_counter() - start
+            if not addresses:
+                metrics.dns_latency.observe(elapsed, result='fail')
+                raise errors[0] if errors else socket.timeout(f"DNS 查询超过 {self.timeout:g} 秒")
+            metrics.dns_latency.observe(elapsed, result='ok')
+            logger.debug(f"解析 {key} -> {', '.join(addresses)} ({elapsed * 1000:.1f} ms)")
+            now = self.clock()
+            with self._lock:
+                self._entries[key] = Entry(tuple(addresses), now + self.ttl, now + self.ttl + self.stale)
+            return tuple(addresses)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+resolver = Resolver(settings.network.dns_ttl, settings.network.dns_stale, settings.network.dns_timeout,
+                    parse_pins(settings.network.dns_pins))
+
+
+def _on_config_change(changed):
+    if any(section == 'Network' and key.startswith('dns_') for section, key in changed):
+        network = settings.network
+        resolver.configure(network.dns_ttl, network.dns_stale, network.dns_timeout, parse_pins(network.dns_pins))
+        logger.info("DNS 缓存配置已更新。")
+
+
+settings.add_listener(_on_config_change)
+
+
+def resolve(host):
+    """经进程内缓存解析主机名，返回地址列表。"""
+    return resolver.resolve(host)
+
+
+def create_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """经进程内缓存解析后建立 TCP 连接，用法同 socket.create_connection。"""
+    return resolver.create_connection(address, timeout, source_address)
+
+
+def preresolve_service_hosts():
+    """预解析并固定 Portal 和 SMTP 服务器的主机名，断网期间登录和发信不再依赖 DNS。"""
+    network, email = settings.network, settings.email
+    hosts = {urlsplit(url).hostname for url in (network.login_url, network.status_url) if url}
+    if email.smtp_security != 'file':
+        hosts.add(email.smtp_server)
+    resolver.preresolve(sorted(h for h in hosts if h))
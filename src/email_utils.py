@@ -1,62 +1,40 @@
-import smtplib
-import ssl
-import configparser
-import subprocess
-import platform
-import os
-import sys
+import threading
 import time # Import time for formatting
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.header import Header
 from logger_config import logger
+from settings import settings
+import metrics
 
-# --- Determine base path and config path (Windows Only) ---
-if getattr(sys, 'frozen', False):
-    base_path = os.path.dirname(sys.executable)
-else:
-    base_path = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_path, 'config.ini')
-# --- Determine base path and config path --- END
-
-config = configparser.ConfigParser()
-# Read config using the absolute path
-if not config.read(config_path, encoding='utf-8'):
-    logger.critical(f"错误：无法找到或读取配置文件 {config_path}")
-    sys.exit(f"配置文件未找到: {config_path}")
-
-# --- Email Configuration Loading ---
-SENDER_EMAIL = config.get('Email', 'sender_email')
-SENDER_PASSWORD = config.get('Email', 'sender_password') # QQ邮箱通常是授权码
-RECEIVER_EMAIL = config.get('Email', 'receiver_email')
-SMTP_SERVER = config.get('Email', 'smtp_server')
-SMTP_PORT = config.getint('Email', 'smtp_port', fallback=587) # Read as int, fallback 587
-logger.info("邮件配置加载完成。")
-# --- Email Configuration Loading End ---
-
-def get_ipconfig_output():
-    """获取 Windows ipconfig /all 命令的完整输出，用于诊断邮件。"""
-    logger.debug("准备执行 'ipconfig /all' 获取详细网络信息...")
-    output = "无法获取 Windows 的网络配置信息。"
-    cmd = ['ipconfig', '/all']
-    encoding = 'gbk'
+# smtplib / ssl / email.mime 只在真正发送邮件时才导入，平时不占用启动时间和内存
 
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding=encoding, errors='replace', check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        output = result.stdout
-        logger.debug(f"成功获取 'ipconfig /all' 输出。")
-    except FileNotFoundError:
-        logger.error(f"'{cmd[0]}' 命令未找到。")
-        output = f"'{cmd[0]}' 命令未找到。"
-    except subprocess.CalledProcessError as e:
-        logger.error(f"执行 '{' '.join(cmd)}' 命令失败: {e}")
-        output = f"执行 '{' '.join(cmd)}' 命令失败: {e}"
-    except Exception as e:
-        logger.error(f"获取ipconfig /all 输出时发生错误: {e}", exc_info=True)
-        output = f"获取ipconfig /all 输出时发生错误: {e}"
-    return output
+# 进程内共享的 SMTP 传输，跨多次发送复用同一个已认证连接；第一次发送时才创建
+transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """返回共享的 SMTP 传输，不存在时按当前 [Email] 配置创建。"""
+    global transport
+    with _transport_lock:
+        if transport is None:
+            from smtp_transport import create_transport
+            email = settings.email
+            transport = create_transport(email.smtp_security, email.smtp_server, email.smtp_port, email.sender_email,
+                                         email.sender_password, sink_dir=email.sink_dir,
+                                         keepalive=email.smtp_keepalive)
+        return transport
+
+def _on_config_change(changed):
+    """[Email] 中的服务器或账号变化时丢弃旧传输，下次发送时按新配置重建。"""
+    global transport
+    if any(section == 'Email' and key.startswith(('smtp_', 'sender_', 'sink_')) for section, key in changed):
+        with _transport_lock:
+            old, transport = transport, None
+        if old is not None:
+            old.close()
+        logger.info("邮件配置已更新，SMTP 连接将在下次发送时按新配置建立。")
+
+settings.add_listener(_on_config_change)
 
-def send_notification_email(subject, body, user_ip=None, disconnect_time=None, reconnect_time=None):
+def send_notification_email(subject, body, user_ip=None, disconnect_time=None, reconnect_time=None, diagnostics=False):
     """发送邮件通知。
 
     Args:
@@ -65,12 +43,45 @@ def send_notification_email(subject, body, user_ip=None, disconnect_time=None, r
         user_ip (str, optional): 重连成功时的用户IP。如果提供，邮件内容会更简洁。
         disconnect_time (str, optional): 检测到断开连接的时间。
         reconnect_time (str, optional): 重连成功的时间。
+        diagnostics (bool, optional): 是否附带诊断包，只有断网和失败邮件才需要。
 
     Returns:
         bool: 发送成功返回 True，否则 False。
     """
+    return send_notifications([(subject, body, {'user_ip': user_ip, 'disconnect_time': disconnect_time,
+                                                'reconnect_time': reconnect_time, 'diagnostics': diagnostics})])
+
+def send_notifications(notifications):
+    """在同一个 SMTP 会话中批量发送多封通知邮件 (发件箱积压较多时使用)。
+
+    Args:
+        notifications (list): (subject, body, kwargs) 列表，kwargs 与 send_notification_email 的参数相同。
+            同一批次最多收集一次诊断包，附在第一封需要诊断信息的邮件中。
+
+    Returns:
+        bool: 全部发送成功返回 True，否则 False。
+    """
+    messages, bundle = [], None
+    for subject, body, kwargs in notifications:
+        kwargs = dict(kwargs)
+        if bundle is not None:
+            kwargs['diagnostics'] = False
+        message, message_bundle = _build_message(subject, body, **kwargs)
+        messages.append(message)
+        bundle = bundle or message_bundle
+
+    ok = send_messages(messages)
+    if ok and bundle is not None:
+        bundle.mark_sent()
+    return ok
+
+def _build_message(subject, body, user_ip=None, disconnect_time=None, reconnect_time=None, diagnostics=False):
+    """构建一封通知邮件，返回 (message, bundle)；没有附带诊断包时 bundle 为 None。"""
+    from email.header import Header
+    from email.mime.text import MIMEText
     logger.info(f"准备发送邮件: 主题 '{subject}'")
     final_body = body
+    bundle = None
 
     # 如果是重连成功邮件，构建简洁正文
     if user_ip and disconnect_time and reconnect_time:
@@ -79,41 +90,54 @@ def send_notification_email(subject, body, user_ip=None, disconnect_time=None, r
         final_body += f" - 自动重连时间: {reconnect_time}\n"
         final_body += f" - 当前获取IP地址: {user_ip}\n"
         logger.info("邮件内容已格式化为简洁重连成功信息。")
-    else:
-        # 对于其他情况（初始连接成功、失败），附加完整的ipconfig /all信息
-        logger.info("邮件将附加详细的 ipconfig /all 输出用于诊断。")
-        final_body += "\n\n--- 网络诊断信息 (ipconfig /all) ---\n"
-        final_body += get_ipconfig_output()
+    elif diagnostics and settings.email.diag_budget > 0:
+        # 断网、失败邮件：并行收集诊断信息，作为压缩附件发送
+        from diag_bundle import build_bundle
+        bundle = build_bundle()
+        logger.info(f"邮件将附带诊断包 {bundle.filename} ({len(bundle.data)} 字节，收集耗时 {bundle.elapsed_ms:.0f} ms)。")
+        final_body += f"\n\n--- 网络诊断信息 ---\n{bundle.summary()}\n"
 
     message = MIMEText(final_body, 'plain', 'utf-8')
-    message['From'] = SENDER_EMAIL
-    message['To'] = Header(f"管理员 <{RECEIVER_EMAIL}>", 'utf-8')
+    if bundle is not None:
+        from email.mime.application import MIMEApplication
+        from email.mime.multipart import MIMEMultipart
+        text, message = message, MIMEMultipart()
+        message.attach(text)
+        attachment = MIMEApplication(bundle.data, 'gzip')
+        attachment.add_header('Content-Disposition', 'attachment', filename=bundle.filename)
+        message.attach(attachment)
+    message['From'] = settings.email.sender_email
+    message['To'] = Header(f"管理员 <{settings.email.receiver_email}>", 'utf-8')
     message['Subject'] = Header(subject, 'utf-8')
+    return message, bundle
+
+def send_messages(messages):
+    """在同一个 SMTP 会话中批量发送已构建好的邮件。
+
+    Args:
+        messages (list): email.message.Message 对象列表。
+
+    Returns:
+        bool: 全部发送成功返回 True，否则 False。
+    """
+    ok = _send_messages(messages)
+    metrics.smtp_results.inc(result='ok' if ok else 'fail')
+    return ok
 
+def _send_messages(messages):
+    import smtplib
+    email = settings.email
     try:
-        logger.info(f"连接到 SMTP 服务器: {SMTP_SERVER}:{SMTP_PORT}...")
-        context = ssl.create_default_context()
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=20) as server: # Increased timeout
-            logger.info("连接成功，尝试启动 TLS 加密 (STARTTLS)...")
-            server.starttls(context=context)
-            logger.info("TLS 加密已启动，尝试登录...")
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            logger.info(f"SMTP 登录成功 ({SENDER_EMAIL})，尝试发送邮件...")
-            server.sendmail(SENDER_EMAIL, [RECEIVER_EMAIL], message.as_bytes())
-            logger.info(f"邮件已成功发送至 {RECEIVER_EMAIL}")
-            try:
-                logger.debug("尝试发送 QUIT 命令...")
-                server.quit()
-                logger.debug("SMTP 连接已正常关闭。")
-            except Exception as quit_err:
-                logger.warning(f"发送 QUIT 命令时出现异常 (邮件可能已发送): {quit_err}")
-            return True
+        with metrics.timed(metrics.smtp_latency):
+            get_transport().send([(email.sender_email, [email.receiver_email], message.as_bytes()) for message in messages])
+        logger.info(f"{len(messages)} 封邮件已成功发送至 {email.receiver_email}")
+        return True
 
     except smtplib.SMTPAuthenticationError:
-        logger.critical(f"SMTP 认证失败! 请检查发件人邮箱 {SENDER_EMAIL} 的授权码是否正确或已过期。")
+        logger.critical(f"SMTP 认证失败! 请检查发件人邮箱 {email.sender_email} 的授权码是否正确或已过期。")
         return False
     except smtplib.SMTPConnectError as e:
-        logger.error(f"无法连接到 SMTP 服务器 {SMTP_SERVER}:{SMTP_PORT}。错误: {e}")
+        logger.error(f"无法连接到 SMTP 服务器 {email.smtp_server}:{email.smtp_port}。错误: {e}")
         return False
     except smtplib.SMTPServerDisconnected as e:
         logger.error(f"SMTP 服务器意外断开连接。错误: {e}")
@@ -128,4 +152,4 @@ def send_notification_email(subject, body, user_ip=None, disconnect_time=None, r
         logger.error(f"发送邮件时发生未知错误: {e}", exc_info=True)
         return False
 
-# Removed __main__ test block 
\ No newline at end of file
+# Removed __main__ test block
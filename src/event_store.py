@@ -0,0 +1,313 @@
+import glob
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from logger_config import logger
+from settings import base_path, settings
+
+# --- History Configuration Loading ---
+HISTORY_ENABLED = settings.history.enabled
+HISTORY_DB = settings.history.db_file
+# --- History Configuration Loading End ---
+
+BUCKET_MS = 3600 * 1000  # 汇总粒度: 1 小时
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts_ms INTEGER NOT NULL,
+    kind TEXT NOT NULL,          -- probe / login / state
+    ok INTEGER,
+    latency_ms REAL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_kind_ts ON events (kind, ts_ms);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    bucket_ms INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    ok_count INTEGER NOT NULL,
+    latency_sum REAL NOT NULL,
+    PRIMARY KEY (bucket_ms, kind)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS outages (
+    start_ms INTEGER PRIMARY KEY,
+    end_ms INTEGER,              -- NULL 表示断网仍在持续
+    reconnect_ms INTEGER         -- end_ms - start_ms，单独存放以便建立索引
+);
+CREATE INDEX IF NOT EXISTS idx_outages_end ON outages (end_ms);
+CREATE INDEX IF NOT EXISTS idx_outages_reconnect ON outages (reconnect_ms);
+"""
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class EventStore:
+    """只追加的事件库 (SQLite)：记录每次探测、登录和状态变化，并维护按小时汇总和断网区间表。
+
+    统计查询只访问汇总表和断网区间表 (都有索引)，不需要扫描明细事件，
+    因此在数百万条事件上也能在毫秒级返回。
+    """
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- 写入 --- START
+    def record(self, kind, ok=None, latency=None, detail=None, ts_ms=None):
+        """追加一条事件，同时更新所在小时的汇总。latency 单位为秒。"""
+        ts_ms = _now_ms() if ts_ms is None else ts_ms
+        latency_ms = None if latency is None else latency * 1000
+        try:
+            with self._lock, self._conn:  # 异常时回滚
+                self._conn.execute('BEGIN')
+                self._insert(kind, ok, latency_ms, detail, ts_ms)
+        except sqlite3.Error as e:
+            # 历史记录只是辅助功能，写入失败不能影响检查流水线
+            logger.warning(f"写入事件历史失败 ({kind}): {e}")
+
+    def _insert(self, kind, ok, latency_ms, detail, ts_ms):
+        self._conn.execute(
+            'INSERT INTO events (ts_ms, kind, ok, latency_ms, detail) VALUES (?, ?, ?, ?, ?)',
+            (ts_ms, kind, None if ok is None else int(bool(ok)), latency_ms, detail))
+        self._conn.execute(
+            'INSERT INTO rollups (bucket_ms, kind, total, ok_count, latency_sum) VALUES (?, ?, 1, ?, ?) '
+            'ON CONFLICT (bucket_ms, kind) DO UPDATE SET total = total + 1, ok_count = ok_count + excluded.ok_count, '
+            'latency_sum = latency_sum + excluded.latency_sum',
+            (ts_ms - ts_ms % BUCKET_MS, kind, int(bool(ok)), latency_ms or 0.0))
+
+    def _open_outage(self, ts_ms):
+        # 同一时间只有一个未结束的断网区间；重连尝试期间再次进入 offline 不会新开区间
+        self._conn.execute('INSERT OR IGNORE INTO outages (start_ms) SELECT ? '
+                           'WHERE NOT EXISTS (SELECT 1 FROM outages WHERE end_ms IS NULL)', (ts_ms,))
+
+    def _close_outage(self, ts_ms):
+        self._conn.execute('UPDATE outages SET end_ms = ?, reconnect_ms = ? - start_ms WHERE end_ms IS NULL',
+                           (ts_ms, ts_ms))
+
+    def outage_started(self, ts_ms=None):
+        with self._lock:
+            self._open_outage(_now_ms() if ts_ms is None else ts_ms)
+
+    def outage_ended(self, ts_ms=None):
+        """结束未结束的断网区间。"""
+        with self._lock:
+            self._close_outage(_now_ms() if ts_ms is None else ts_ms)
+
+    def on_transition(self, old_state, new_state, timestamp):
+        """ConnectionStateMachine 的监听回调：记录状态变化并维护断网区间。"""
+        ts_ms = int(timestamp * 1000)
+        self.record('state', detail=f"{old_state.value}->{new_state.value}", ts_ms=ts_ms)
+        try:
+            if new_state.value == 'offline':
+                self.outage_started(ts_ms)
+            elif new_state.value == 'online':
+                self.outage_ended(ts_ms)
+        except sqlite3.Error as e:
+            logger.warning(f"更新断网区间失败: {e}")
+    # --- 写入 --- END
+
+    # --- 查询 --- START
+    def downtime_ms(self, since_ms, until_ms):
+        """[since_ms, until_ms) 窗口内的累计断网毫秒数 (与窗口边界相交的区间按重叠部分计算)。"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COALESCE(SUM(MIN(COALESCE(end_ms, :until), :until) - MAX(start_ms, :since)), 0) '
+                'FROM outages WHERE start_ms < :until AND (end_ms IS NULL OR end_ms > :since)',
+                {'since': since_ms, 'until': until_ms}).fetchone()
+        return max(0, row[0])
+
+    def uptime(self, days):
+        """返回最近 days 天的可用率 (0~1) 和断网毫秒数。"""
+        until_ms = _now_ms()
+        since_ms = until_ms - int(days * 86400 * 1000)
+        down = self.downtime_ms(since_ms, until_ms)
+        return 1 - down / (until_ms - since_ms), down
+
+    def outages(self, min_minutes=0, days=None):
+        """返回持续时间不少于 min_minutes 分钟的断网区间 [(start_ms, end_ms 或 None, duration_ms)]。"""
+        now = _now_ms()
+        since_ms = 0 if days is None else now - int(days * 86400 * 1000)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT start_ms, end_ms, COALESCE(end_ms, :now) - start_ms AS duration FROM outages '
+                'WHERE start_ms >= :since AND COALESCE(end_ms, :now) - start_ms >= :min ORDER BY start_ms',
+                {'now': now, 'since': since_ms, 'min': int(min_minutes * 60000)}).fetchall()
+        return rows
+
+    def reconnect_percentile(self, percentile=95, days=None):
+        """已结束断网区间的重连时间分位数 (毫秒)，利用 reconnect_ms 索引直接定位。"""
+        since_ms = 0 if days is None else _now_ms() - int(days * 86400 * 1000)
+        with self._lock:
+            count = self._conn.execute(
+                'SELECT COUNT(*) FROM outages WHERE reconnect_ms IS NOT NULL AND start_ms >= ?',
+                (since_ms,)).fetchone()[0]
+            if not count:
+                return None
+            offset = min(count - 1, max(0, int(round(percentile / 100 * count + 0.5)) - 1))
+            return self._conn.execute(
+                'SELECT reconnect_ms FROM outages WHERE reconnect_ms IS NOT NULL AND start_ms >= ? '
+                'ORDER BY reconnect_ms LIMIT 1 OFFSET ?', (since_ms, offset)).fetchone()[0]
+
+    def events(self, kinds=('probe', 'login'), days=None):
+        """按时间顺序返回明细事件 [(ts_ms, kind, ok)] (供策略模拟器回放)。"""
+        since_ms = 0 if days is None else _now_ms() - int(days * 86400 * 1000)
+        marks = ', '.join('?' * len(kinds))
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT ts_ms, kind, ok FROM events WHERE kind IN ({marks}) AND ts_ms >= ? ORDER BY ts_ms',
+                (*kinds, since_ms)).fetchall()
+
+    def rollup(self, kind, days):
+        """按小时汇总的 (bucket_ms, total, ok_count, avg_latency_ms)。"""
+        since_ms = _now_ms() - int(days * 86400 * 1000)
+        with self._lock:
+            return self._conn.execute(
+                'SELECT bucket_ms, total, ok_count, latency_sum / total FROM rollups '
+                'WHERE kind = ? AND bucket_ms >= ? ORDER BY bucket_ms', (kind, since_ms)).fetchall()
+
+    def recent(self, kind, seconds):
+        """最近 seconds 秒 (滑动窗口，不按整点分桶) 的 (total, ok_count, avg_latency_ms)；没有事件时平均耗时为 None。"""
+        since_ms = _now_ms() - int(seconds * 1000)
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(ok), 0), AVG(latency_ms) FROM events WHERE kind = ? AND ts_ms >= ?',
+                (kind, since_ms)).fetchone()
+    # --- 查询 --- END
+
+    # --- 导入旧日志 --- START
+    def import_logs(self, paths):
+        """从 logs/app.log* (文本或 JSON 行，可为 .gz) 中重建探测、登录和断网记录，返回导入的事件数。"""
+        count = 0
+        offline_since = None
+        for path in sorted(paths, key=_log_sort_key):
+            opener = gzip.open if path.endswith('.gz') else open
+            # 每个文件一个事务，避免逐行提交
+            with opener(path, 'rt', encoding='utf-8', errors='replace') as f, self._lock, self._conn:
+                self._conn.execute('BEGIN')
+                for line in f:
+                    parsed = parse_log_line(line)
+                    if parsed is None:
+                        continue
+                    ts_ms, kind, ok = parsed
+                    self._insert(kind, ok, None, 'imported', ts_ms)
+                    count += 1
+                    if kind == 'probe' and not ok and offline_since is None:
+                        offline_since = ts_ms
+                        self._open_outage(ts_ms)
+                    elif kind == 'probe' and ok and offline_since is not None:
+                        offline_since = None
+                        self._close_outage(ts_ms)
+        return count
+    # --- 导入旧日志 --- END
+
+
+# 日志中能识别的事件 (与 main.py / network_utils.py 输出的文案一致)
+LOG_PATTERNS = (
+    ('网络连接当前状态：正常', 'probe', True),
+    ('再次检查确认网络已恢复连接', 'probe', True),
+    ('网络连接当前状态：断开', 'probe', False),
+    ('步骤 3 成功', 'login', True),
+    ('步骤 3 注意', 'login', True),
+    ('步骤 3 失败', 'login', False),
+)
+TEXT_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[\w+\s*\] (.*)$')
+
+
+def parse_log_line(line):
+    """解析一行日志，返回 (ts_ms, kind, ok)，不相关的行返回 None。"""
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+            ts = time.mktime(time.strptime(entry['ts'][:19], '%Y-%m-%dT%H:%M:%S'))
+            message = entry['msg']
+        except (ValueError, KeyError):
+            return None
+    else:
+        match = TEXT_LINE.match(line)
+        if not match:
+            return None
+        ts = time.mktime(time.strptime(match.group(1), '%Y-%m-%d %H:%M:%S'))
+        message = match.group(2)
+    for needle, kind, ok in LOG_PATTERNS:
+        if needle in message:
+            return int(ts * 1000), kind, ok
+    return None
+
+
+def _log_sort_key(path):
+    # 旧版 RotatingFileHandler: app.log.2 比 app.log.1 更旧；新版归档按时间戳命名；app.log 最新
+    suffix = os.path.basename(path)[len('app.log'):].lstrip('.')
+    if not suffix:
+        return (2, '')
+    if suffix.split('.')[0].isdigit() and len(suffix.split('.')[0]) < 4:
+        return (0, f"{-int(suffix.split('.')[0]):08d}")
+    return (1, suffix)
+
+
+def _format_ms(ts_ms):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts_ms / 1000))
+
+
+def main(argv=None):
+    """命令行查询入口: python event_store.py {uptime,outages,reconnect,rollup,import-log} ..."""
+    import argparse
+    parser = argparse.ArgumentParser(description='Snaf 网络事件历史查询')
+    parser.add_argument('--db', default=HISTORY_DB, help='事件库路径')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('uptime', help='最近 N 天的可用率')
+    p.add_argument('--days', type=float, default=7)
+    p = sub.add_parser('outages', help='列出持续时间超过 N 分钟的断网')
+    p.add_argument('--min-minutes', type=float, default=0)
+    p.add_argument('--days', type=float, default=None)
+    p = sub.add_parser('reconnect', help='重连时间分位数')
+    p.add_argument('--percentile', type=float, default=95)
+    p.add_argument('--days', type=float, default=None)
+    p = sub.add_parser('rollup', help='按小时汇总的探测/登录成功率')
+    p.add_argument('--kind', default='probe', choices=('probe', 'login'))
+    p.add_argument('--days', type=float, default=1)
+    p = sub.add_parser('import-log', help='导入 logs/app.log* 历史日志')
+    p.add_argument('paths', nargs='*', help='日志文件，默认导入 logs/app.log*')
+    args = parser.parse_args(argv)
+
+    store = EventStore(args.db)
+    if args.command == 'uptime':
+        ratio, down = store.uptime(args.days)
+        print(f"最近 {args.days:g} 天可用率: {ratio * 100:.3f}%  (累计断网 {down / 60000:.1f} 分钟)")
+    elif args.command == 'outages':
+        rows = store.outages(args.min_minutes, args.days)
+        for start_ms, end_ms, duration in rows:
+            end = _format_ms(end_ms) if end_ms is not None else '持续中'
+            print(f"{_format_ms(start_ms)} -> {end}  {duration / 60000:.1f} 分钟")
+        print(f"共 {len(rows)} 次断网")
+    elif args.command == 'reconnect':
+        value = store.reconnect_percentile(args.percentile, args.days)
+        print('没有已结束的断网记录' if value is None else f"p{args.percentile:g} 重连时间: {value} ms")
+    elif args.command == 'rollup':
+        for bucket_ms, total, ok_count, avg_latency in store.rollup(args.kind, args.days):
+            print(f"{_format_ms(bucket_ms)}  {ok_count}/{total} 成功  平均耗时 {avg_latency:.0f} ms")
+    elif args.command == 'import-log':
+        paths = args.paths or glob.glob(os.path.join(base_path, 'logs', 'app.log*'))
+        print(f"已导入 {store.import_logs(paths)} 条事件 (来自 {len(paths)} 个文件)")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import threading
+import time
+import types
+from logger_config import logger
+from settings import settings
+import metrics
+from network_utils import EPortalClient, PortalCode
+from retry_policy import ConnectionState, ConnectionStateMachine, create_policy
+from login_admission import LoginAdmission
+from iface_utils import get_interfaces
+
+TASK_PREFIX = 'fleet:'  # 成员在调度器中的任务名前缀
+VERIFY_DELAY = 5  # 登录成功后等待多少秒再确认
+SLOT_RETRY = 1  # 并发名额已满时多少秒后重试 (不在调度器线程中阻塞等待)
+
+
+def fleet_schedule():
+    """成员的重连策略参数：沿用 [schedule]，在线时的检查间隔改为 [fleet] interval。"""
+    values = {k: v for k, v in vars(settings.schedule).items() if not k.startswith('_')}
+    values['interval'] = settings.fleet.interval / 60
+    return types.SimpleNamespace(**values)
+
+
+class FleetMember:
+    """集群中的一个账号/IP：独立的状态机、重连策略和登录准入，共享 Portal 连接池。
+
+    IP 是本机地址时，从该地址发出网关状态查询来判断是否在线；IP 属于下游机器时在状态查询中指定该地址，
+    只有确认掉线后才发送登录请求。网关不支持按地址查询时 (答复的是本机的状态) 才退回用登录请求确认
+    (已在线时网关答复 "已经在线"，不会产生新会话)。
+    """
+
+    def __init__(self, entry, local):
+        self.entry = entry
+        self.local = local
+        network = settings.network
+        self.client = EPortalClient(entry.username, entry.password, network.login_url, network.status_url,
+                                    network.portal_ac_ip, network.portal_js_version)
+        self.state = ConnectionStateMachine()
+        self.policy = create_policy(settings.schedule.retry_policy, fleet_schedule())
+        self.admission = LoginAdmission()
+        self.query_by_address = True  # 网关能否按地址答复下游成员的状态，首次发现不能时置为 False
+
+    @property
+    def label(self):
+        return f"[{self.entry.name} {self.entry.username}@{self.entry.ip}]"
+
+    def _probe(self):
+        """返回 (是否在线, 登录结果)；登录结果只在网关不支持按地址查询、通过登录请求确认状态时给出。"""
+        if self.local or self.query_by_address:
+            if self.local:
+                status = self.client.status(timeout=settings.network.probe_timeout, source=self.entry.ip)
+            else:
+                status = self.client.status(timeout=settings.network.probe_timeout, user_ip=self.entry.ip)
+            if self.local or status.user_ip in (None, self.entry.ip):
+                if status.online is None:
+                    logger.warning(f"集群成员 {self.label} 状态查询失败: {status.message}")
+                return bool(status.online), None
+            logger.info(f"网关不支持按地址查询下游成员 (答复的是 {status.user_ip})，集群成员 {self.label} 改用登录请求确认状态。")
+            self.query_by_address = False
+        result = self.client.login(self.entry.ip)
+        self.admission.record(result)
+        metrics.login_results.inc(code=result.code.value)
+        return result.code is PortalCode.ALREADY_ONLINE, result
+
+    def run(self):
+        """执行一轮检查 (必要时登录)，返回 (下一次执行前的秒数, 事件)；事件为 'offline'/'online' 或 None。"""
+        was_offline = self.state.is_offline
+        if was_offline and not self.local and not self.query_by_address:
+            # 退回用登录请求确认状态时，检查本身就是登录请求，断网期间同样要经过准入
+            wait, reason = self.admission.acquire()
+            if wait > 0:
+                logger.info(f"集群成员 {self.label} 暂缓检查 {wait:.0f} 秒 ({reason})。")
+                return wait, None
+        self.state.transition(ConnectionState.PROBING)
+        online, result = self._probe()
+        if online:
+            self.state.transition(ConnectionState.ONLINE)
+            self.admission.reset()
+            metrics.fleet_online.set(1, member=self.entry.name)
+            return self.policy.online_delay(), 'online' if was_offline else None
+
+        self.state.transition(ConnectionState.OFFLINE)
+        metrics.fleet_online.set(0, member=self.entry.name)
+        event = None if was_offline else 'offline'
+        if result is not None and result.code is PortalCode.SUCCESS:
+            # 用登录请求确认状态时顺带完成了认证
+            logger.info(f"集群成员 {self.label} 已掉线，检查时已重新认证。")
+            self.state.transition(ConnectionState.LOGGING_IN)
+            self.state.transition(ConnectionState.VERIFYING)
+            return VERIFY_DELAY, event
+        if result is None:
+            wait, reason = self.admission.acquire()
+            if wait > 0:
+                logger.info(f"集群成员 {self.label} 暂缓登录 {wait:.0f} 秒 ({reason})。")
+                return wait, event
+            self.state.transition(ConnectionState.LOGGING_IN)
+            result = self.client.login(self.entry.ip, source=self.entry.ip if self.local else None)
+            self.admission.release(result)
+            metrics.login_results.inc(code=result.code.value)
+            if result.ok:
+                logger.info(f"集群成员 {self.label} 登录成功 [{result.code.value}]，{VERIFY_DELAY} 秒后确认。")
+                self.state.transition(ConnectionState.VERIFYING)
+                return VERIFY_DELAY, event
+            self.state.transition(ConnectionState.OFFLINE)
+        logger.warning(f"集群成员 {self.label} 登录失败 [{result.code.value}]: {result.message}")
+        return self.policy.next_delay(self.state.attempts, self.state.offline_for()), event
+
+
+class Fleet:
+    """集群模式：在同一个进程中为 [fleet:<名称>] 列出的多个账号/IP 保持认证。
+
+    每个成员是调度器中的一个独立任务 (各自的检查周期和重连节奏)，首次检查在一个检查周期内错开；
+    同时执行检查/登录的成员数不超过 [fleet] concurrency，所有成员共享 Portal 连接池。
+    配置热加载时按名称增删成员，账号或 IP 变化的成员会被重建。
+    """
+
+    def __init__(self, scheduler, notify=None):
+        self.scheduler = scheduler
+        self.notify = notify
+        self.members = {}
+        self._slots = threading.BoundedSemaphore(settings.fleet.concurrency)
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.update(settings.fleet.entries)
+        settings.add_listener(self._on_config_change)
+
+    def _on_config_change(self, changed):
+        if ('fleet', 'entries') in changed:
+            self.update(settings.fleet.entries)
+        elif any(section in ('schedule', 'fleet') for section, _ in changed):
+            for member in list(self.members.values()):
+                member.policy = create_policy(settings.schedule.retry_policy, fleet_schedule())
+
+    def update(self, entries):
+        """按新的成员列表增删任务。"""
+        local = {i.address for i in get_interfaces()}
+        with self._lock:
+            wanted = {entry.name: entry for entry in entries}
+            for name in list(self.members):
+                if name not in wanted or self.members[name].entry != wanted[name]:
+                    self.scheduler.cancel(TASK_PREFIX + name)
+                    del self.members[name]
+            added = [entry for name, entry in wanted.items() if name not in self.members]
+            for index, entry in enumerate(added):
+                member = FleetMember(entry, entry.ip in local)
+                self.members[entry.name] = member
+                # 首次检查在一个检查周期内均匀错开，避免所有成员同时请求网关
+                delay = settings.fleet.interval * index / len(added)
+                self.scheduler.schedule(TASK_PREFIX + entry.name, delay, self._run, member)
+        if added:
+            logger.info(f"集群模式: 新增 {len(added)} 个成员，共 {len(self.members)} 个 "
+                        f"(并发上限 {settings.fleet.concurrency}，检查间隔 {settings.fleet.interval:.0f} 秒)")
+
+    def _run(self, member):
+        if self.members.get(member.entry.name) is not member:
+            return  # 成员已被移除或重建
+        if not self._slots.acquire(blocking=False):
+            # 不占着调度器的工作线程等名额，否则大量成员同时到期时会挤掉检查流水线和看门狗等任务
+            self.scheduler.schedule(TASK_PREFIX + member.entry.name, SLOT_RETRY, self._run, member)
+            return
+        try:
+            delay, event = member.run()
+        except Exception as e:
+            logger.error(f"集群成员 {member.label} 检查时发生错误: {e}", exc_info=True)
+            delay, event = member.policy.next_delay(member.state.attempts, member.state.offline_for()), None
+        finally:
+            self._slots.release()
+        if event is not None and self.notify is not None:
+            moment = time.strftime('%Y-%m-%d %H:%M:%S')
+            if event == 'offline':
+                self.notify(f"集群成员断开: {member.entry.name}", f"{member.label} 于 {moment} 检测到未认证，正在重新登录。",
+                            diagnostics=True)
+            else:
+                self.notify(f"集群成员恢复: {member.entry.name}", f"{member.label} 于 {moment} 确认已恢复认证。")
+        if self.members.get(member.entry.name) is member:
+            self.scheduler.schedule(TASK_PREFIX + member.entry.name, delay, self._run, member)
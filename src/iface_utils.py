@@ -0,0 +1,174 @@
+import collections
+import hashlib
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from logger_config import logger
+from settings import settings
+
+Interface = collections.namedtuple('Interface', ['name', 'address', 'netmask', 'up'])
+
+# Linux ioctl 请求号 (见 <linux/sockios.h>)
+SIOCGIFFLAGS = 0x8913
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+IFF_UP = 0x1
+
+
+# --- 平台后端 --- START
+def _ioctl_ipv4(sock, request, name):
+    import fcntl
+    ifreq = struct.pack('256s', name.encode()[:15])
+    return socket.inet_ntoa(fcntl.ioctl(sock.fileno(), request, ifreq)[20:24])
+
+def _enumerate_linux():
+    """通过 if_nameindex + ioctl 在进程内枚举 IPv4 接口，无需启动子进程。"""
+    import fcntl
+    interfaces = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _, name in socket.if_nameindex():
+            try:
+                address = _ioctl_ipv4(sock, SIOCGIFADDR, name)
+            except OSError:
+                continue  # 接口没有 IPv4 地址
+            try:
+                netmask = _ioctl_ipv4(sock, SIOCGIFNETMASK, name)
+            except OSError:
+                netmask = None
+            flags_req = struct.pack('16sH', name.encode()[:15], 0)
+            flags = struct.unpack('16sH', fcntl.ioctl(sock.fileno(), SIOCGIFFLAGS, flags_req)[:18])[1]
+            interfaces.append(Interface(name, address, netmask, bool(flags & IFF_UP)))
+    return interfaces
+
+def _parse_ipconfig(output):
+    """解析 Windows ipconfig 文本输出 (中英文系统均可)，作为 Windows 上的兜底方案。"""
+    interfaces = []
+    name = None
+    for line in output.splitlines():
+        if line and not line[0].isspace() and line.rstrip().endswith(':'):
+            name = line.rstrip()[:-1].strip()
+        elif "IPv4 地址" in line or "IPv4 Address" in line:
+            address = line.split(':')[-1].strip().replace('(首选)', '').replace('(Preferred)', '').strip()
+            if address:
+                interfaces.append(Interface(name or '?', address, None, True))
+    return interfaces
+
+def _enumerate_windows():
+    """优先用 getaddrinfo 在进程内获取本机 IPv4 地址；失败时才回退到 ipconfig。"""
+    try:
+        infos = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        if addresses:
+            return [Interface('?', address, None, True) for address in addresses]
+    except OSError as e:
+        logger.debug(f"getaddrinfo 获取本机地址失败，回退到 ipconfig: {e}")
+
+    logger.debug("准备执行 'ipconfig' 获取网络信息...")
+    try:
+        result = subprocess.run(['ipconfig'], capture_output=True, text=True, encoding='gbk', errors='replace',
+                                check=True, creationflags=subprocess.CREATE_NO_WINDOW)  # Hide console window
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.error(f"执行 'ipconfig' 命令失败: {e}")
+        return []
+    return _parse_ipconfig(result.stdout)
+
+def _enumerate_generic():
+    try:
+        infos = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)
+    except OSError:
+        return []
+    return [Interface('?', address, None, True) for address in dict.fromkeys(info[4][0] for info in infos)]
+# --- 平台后端 --- END
+
+
+def _change_signature():
+    """Linux 上用接口列表和路由表计算一个廉价的变化签名；其他平台返回 None。"""
+    if not sys.platform.startswith('linux'):
+        return None
+    digest = hashlib.sha1(repr(socket.if_nameindex()).encode())
+    try:
+        with open('/proc/net/route', 'rb') as f:
+            digest.update(f.read())
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class InterfaceTable:
+    """缓存的本机接口表：只有签名变化、被显式失效或超过有效期时才重新枚举。
+
+    ttl 为 None 时使用 [Network] iface_cache_ttl 的当前值 (无法低成本检测变化的平台上缓存的最长有效期，单位: 秒)。
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._interfaces = None
+        self._signature = None
+        self._loaded_at = 0.0
+        if sys.platform.startswith('linux'):
+            self._backend = _enumerate_linux
+        elif sys.platform == 'win32':
+            self._backend = _enumerate_windows
+        else:
+            self._backend = _enumerate_generic
+
+    @property
+    def ttl(self):
+        return settings.network.iface_cache_ttl if self._ttl is None else self._ttl
+
+    def invalidate(self):
+        """标记缓存失效 (例如收到网络变化事件后)。"""
+        with self._lock:
+            self._interfaces = None
+
+    def get(self, refresh=False):
+        """返回当前接口列表。"""
+        with self._lock:
+            signature = _change_signature()
+            stale = (
+                refresh
+                or self._interfaces is None
+                or signature != self._signature
+                or (signature is None and time.monotonic() - self._loaded_at > self.ttl)
+            )
+            if stale:
+                try:
+                    self._interfaces = self._backend()
+                except Exception as e:
+                    logger.error(f"枚举网络接口时发生错误: {e}", exc_info=True)
+                    self._interfaces = []
+                self._signature = signature
+                self._loaded_at = time.monotonic()
+                logger.debug("网络接口表已刷新: %s", self._interfaces)
+            return list(self._interfaces)
+
+
+interface_table = InterfaceTable()
+
+
+def get_interfaces(refresh=False):
+    """返回本机 IPv4 接口列表 (使用缓存)。"""
+    return interface_table.get(refresh=refresh)
+
+
+def invalidate():
+    """使接口缓存失效。"""
+    interface_table.invalidate()
+
+
+def campus_interfaces(prefix=None, interfaces=None):
+    """按 "校园网地址" 策略筛选接口：地址以 prefix (默认 [Network] campus_prefix) 开头，已启用的排在前面，忽略 APIPA 地址。"""
+    prefix = settings.network.campus_prefix if prefix is None else prefix
+    interfaces = get_interfaces() if interfaces is None else interfaces
+    matched = [i for i in interfaces if i.address.startswith(prefix) and not i.address.startswith('169.254.')]
+    return sorted(matched, key=lambda i: not i.up)
+
+
+def pick_campus_address(prefix=None, interfaces=None):
+    """返回第一个校园网 IPv4 地址，找不到时返回 None。"""
+    matched = campus_interfaces(prefix, interfaces)
+    return matched[0].address if matched else None
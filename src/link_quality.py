@@ -0,0 +1,154 @@
+import array
+import math
+import time
+from urllib.parse import urlsplit
+from logger_config import logger
+from settings import settings
+import metrics
+import dns_cache
+import probe_utils
+
+LOST = math.nan  # 丢失的样本 (连接失败或超时)
+
+# --- Quality Configuration Loading ---
+# 每个目标保留的样本数 (环形缓冲区大小，修改后需重启)
+WINDOW = settings.quality.window
+# --- Quality Configuration Loading End ---
+
+
+class RingBuffer:
+    """定长环形缓冲区：样本存放在 array('d') 中 (每个 8 字节)，写满后覆盖最旧的样本，丢失记为 NaN。"""
+
+    __slots__ = ('_data', '_next', '_count')
+
+    def __init__(self, size):
+        self._data = array.array('d', bytes(8 * size))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % len(self._data)
+        self._count = min(self._count + 1, len(self._data))
+
+    def clear(self):
+        self._next = self._count = 0
+
+    def stats(self):
+        """返回 (样本数, 丢失率, p50, p95, p99)；没有成功样本时分位数为 None。"""
+        if not self._count:
+            return 0, 0.0, None, None, None
+        samples = sorted(v for v in self._data[:self._count] if v == v)  # NaN != NaN
+        loss = 1 - len(samples) / self._count
+        if not samples:
+            return self._count, loss, None, None, None
+        p50, p95, p99 = (samples[min(len(samples) - 1, int(q * len(samples)))] for q in (0.50, 0.95, 0.99))
+        return self._count, loss, p50, p95, p99
+
+
+def _endpoint(spec):
+    host, _, port = spec.rpartition(':')
+    return host, int(port)
+
+
+def default_targets():
+    """[quality] targets 为 auto 时：认证网关 (登录地址所在主机) 和第一个 tcp 探测目标 (或 [Network] upstream_ip)。"""
+    login = urlsplit(settings.network.login_url)
+    targets = [f"{login.hostname}:{login.port or (443 if login.scheme == 'https' else 80)}"]
+    external = [p.target for p in probe_utils.PROBES if p.kind == 'tcp'] or [settings.network.upstream_ip]
+    return targets + external[:1]
+
+
+def load_targets():
+    spec = settings.quality.targets
+    targets = default_targets() if spec == 'auto' else [t.strip() for t in spec.split(',') if t.strip()]
+    valid = []
+    for target in targets:
+        try:
+            _endpoint(target)
+        except ValueError:
+            logger.warning(f"忽略无法识别的链路质量采样目标: '{target}' (格式为 主机:端口)")
+            continue
+        valid.append(target)
+    return valid
+
+
+class LinkSampler:
+    """后台链路质量采样：每隔 [quality] interval 秒对每个目标测一次 TCP 建连耗时，写入各自的环形缓冲区。
+
+    最近 window 个样本的丢失率或 p95 超过阈值时调用 on_degraded(目标, 原因)，
+    由主流程提前执行一次检查 (必要时重新登录)，而不是等到完全断网后的下一个检查周期才发现。
+    触发后清空样本并冷却 cooldown 秒，同一段劣化只触发一次。
+    """
+
+    TASK = 'quality'
+
+    def __init__(self, scheduler, on_degraded, clock=time.monotonic):
+        self.scheduler = scheduler
+        self.on_degraded = on_degraded
+        self.clock = clock
+        self.buffers = {}
+        self._quiet_until = 0.0
+        self._update_targets()
+
+    def _update_targets(self):
+        targets = load_targets()
+        self.buffers = {t: self.buffers.get(t) or RingBuffer(WINDOW) for t in targets}
+
+    def start(self):
+        settings.add_listener(self._on_config_change)
+        if settings.quality.enabled:
+            logger.info(f"链路质量采样已启用: {', '.join(self.buffers)} "
+                        f"(每 {settings.quality.interval:g} 秒，窗口 {WINDOW} 个样本)")
+        self.scheduler.schedule(self.TASK, settings.quality.interval, self.sample)
+
+    def _on_config_change(self, changed):
+        if ('quality', 'targets') in changed or ('Network', 'probes') in changed:
+            self._update_targets()
+
+    def stats(self):
+        """{目标: (样本数, 丢失率, p50, p95, p99)}，RTT 单位为毫秒。"""
+        return {target: buffer.stats() for target, buffer in self.buffers.items()}
+
+    def _measure(self, target):
+        host, port = _endpoint(target)
+        start = time.perf_counter()
+        try:
+            dns_cache.create_connection((host, port), timeout=settings.quality.timeout).close()
+        except OSError:
+            return LOST
+        return (time.perf_counter() - start) * 1000
+
+    def sample(self):
+        quality = settings.quality
+        if quality.enabled:  # 关闭时只保留定时器，运行中重新开启即可恢复采样
+            for target, buffer in list(self.buffers.items()):
+                rtt = self._measure(target)
+                buffer.append(rtt)
+            self._evaluate(quality)
+        self.scheduler.schedule(self.TASK, quality.interval, self.sample)
+
+    def _evaluate(self, quality):
+        quiet = self.clock() < self._quiet_until
+        for target, (count, loss, p50, p95, p99) in self.stats().items():
+            metrics.link_loss.set(loss, target=target)
+            for quantile, value in (('0.5', p50), ('0.95', p95), ('0.99', p99)):
+                if value is not None:
+                    metrics.link_rtt.set(value / 1000, target=target, quantile=quantile)
+            if quiet or count < quality.min_samples:
+                continue
+            if loss >= quality.max_loss:
+                reason = f"丢失率 {loss:.0%} (最近 {count} 个样本)"
+            elif p95 is not None and p95 > quality.max_p95_ms:
+                reason = f"p95 {p95:.0f} ms (p50 {p50:.0f} ms，p99 {p99:.0f} ms)"
+            else:
+                continue
+            logger.warning(f"链路质量下降: {target} {reason}")
+            for buffer in self.buffers.values():
+                buffer.clear()
+            self._quiet_until = self.clock() + quality.cooldown
+            self.on_degraded(target, reason)
+            return
@@ -0,0 +1,162 @@
+import socket
+import struct
+import sys
+import threading
+from logger_config import logger
+from settings import settings
+
+# --- Watcher Configuration Loading ---
+LINK_WATCH = settings.schedule.link_watch
+# 一次网络变化通常伴随一串事件 (链路、地址、路由)，合并该秒数内的事件只触发一次检查
+LINK_DEBOUNCE = settings.schedule.link_debounce
+# --- Watcher Configuration Loading End ---
+
+# rtnetlink 常量 (见 <linux/rtnetlink.h>)
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTM_NEWLINK, RTM_DELLINK = 16, 17
+RTM_NEWADDR, RTM_DELADDR = 20, 21
+RTM_NEWROUTE, RTM_DELROUTE = 24, 25
+IFA_ADDRESS, IFA_LOCAL = 1, 2
+NLMSG_HDR = struct.Struct('=LHHLL')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTMSG = struct.Struct('=BBBBBBBBI')
+RTATTR = struct.Struct('=HH')
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _parse_rtattrs(data, offset, end):
+    attrs = {}
+    while offset + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[kind] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def parse_netlink_events(data, prefix=None):
+    """解析一批 rtnetlink 消息，返回值得触发检查的事件描述列表。
+
+    链路变化全部关注；地址变化只关注校园网地址 (prefix 默认取 [Network] campus_prefix)；路由变化只关注默认路由。
+    """
+    prefix = settings.network.campus_prefix if prefix is None else prefix
+    events = []
+    offset = 0
+    while offset + NLMSG_HDR.size <= len(data):
+        length, msg_type, _, _, _ = NLMSG_HDR.unpack_from(data, offset)
+        if length < NLMSG_HDR.size:
+            break
+        body = offset + NLMSG_HDR.size
+        end = offset + length
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+            events.append('链路' + ('变化' if msg_type == RTM_NEWLINK else '移除'))
+        elif msg_type in (RTM_NEWADDR, RTM_DELADDR) and body + IFADDRMSG.size <= end:
+            attrs = _parse_rtattrs(data, body + IFADDRMSG.size, end)
+            raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+            address = socket.inet_ntoa(raw) if raw and len(raw) == 4 else None
+            if address and address.startswith(prefix):
+                events.append(f"校园网地址{'新增' if msg_type == RTM_NEWADDR else '移除'} {address}")
+        elif msg_type in (RTM_NEWROUTE, RTM_DELROUTE) and body + RTMSG.size <= end:
+            dst_len = RTMSG.unpack_from(data, body)[1]
+            if dst_len == 0:
+                events.append('默认路由' + ('变化' if msg_type == RTM_NEWROUTE else '移除'))
+        offset += _align(length)
+    return events
+
+
+class LinkWatcher:
+    """订阅操作系统的网络变化事件，防抖后调用回调 (通常是立即安排一次检查)。
+
+    Linux 使用 rtnetlink 组播通知，Windows 使用 iphlpapi 的 NotifyAddrChange/NotifyRouteChange；
+    其他平台不支持事件订阅，只依赖定时轮询。
+    """
+
+    def __init__(self, callback, debounce=LINK_DEBOUNCE):
+        self.callback = callback
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._timer = None
+        self._reasons = []
+        self._stopped = threading.Event()
+        self._sock = None
+
+    def start(self):
+        """启动监听线程，返回是否成功订阅了系统事件。"""
+        if sys.platform.startswith('linux'):
+            try:
+                self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+                self._sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+            except OSError as e:
+                logger.warning(f"无法订阅 rtnetlink 网络事件，仅使用定时检查: {e}")
+                return False
+            self._spawn(self._watch_netlink)
+        elif sys.platform == 'win32':
+            self._spawn(self._watch_windows, 'NotifyAddrChange', '地址变化')
+            self._spawn(self._watch_windows, 'NotifyRouteChange', '路由变化')
+        else:
+            logger.info("当前平台不支持网络事件订阅，仅使用定时检查。")
+            return False
+        logger.info("网络变化监听已启动，检测到链路/地址/路由变化时将立即检查网络。")
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._sock is not None:
+            self._sock.close()
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+
+    def _spawn(self, target, *args):
+        threading.Thread(target=target, args=args, name='snaf-link-watcher', daemon=True).start()
+
+    def _watch_netlink(self):
+        while not self._stopped.is_set():
+            try:
+                data = self._sock.recv(65536)
+            except OSError:
+                if not self._stopped.is_set():
+                    logger.warning("rtnetlink 套接字读取失败，网络变化监听已停止。", exc_info=True)
+                return
+            for reason in parse_netlink_events(data):
+                self._notify(reason)
+
+    def _watch_windows(self, func_name, reason):
+        import ctypes
+        notify = getattr(ctypes.windll.iphlpapi, func_name)
+        while not self._stopped.is_set():
+            # 传入空句柄时调用会阻塞，直到发生变化
+            if notify(None, None) != 0:
+                logger.warning(f"{func_name} 调用失败，网络变化监听已停止。")
+                return
+            self._notify(reason)
+
+    def _notify(self, reason):
+        """记录事件，并在防抖窗口结束后合并触发一次回调。"""
+        logger.debug(f"收到网络事件: {reason}")
+        with self._lock:
+            self._reasons.append(reason)
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce, self._fire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            reasons = list(dict.fromkeys(self._reasons))
+            self._reasons.clear()
+            self._timer = None
+        if self._stopped.is_set():
+            return
+        logger.info(f"检测到网络变化 ({', '.join(reasons)})，立即安排网络检查。")
+        try:
+            self.callback(reasons)
+        except Exception as e:
+            logger.error(f"处理网络变化事件时发生错误: {e}", exc_info=True)
@@ -1,75 +1,158 @@
+import atexit
+import glob
+import gzip
+import json
 import logging
 import os
+import queue
+import shutil
 import sys
-import configparser
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-# --- Determine base path --- START
-if getattr(sys, 'frozen', False):
-    # If the application is run as a bundle (frozen), use the executable directory
-    base_path = os.path.dirname(sys.executable)
-else:
-    # If run from a normal Python environment, use the script's directory
-    base_path = os.path.dirname(os.path.abspath(__file__))
+from settings import base_path, settings
 
 # --- Read Configuration --- START
-config_path = os.path.join(base_path, 'config.ini')
-config = configparser.ConfigParser()
-log_level_str = 'INFO' # Default log level
-if config.read(config_path, encoding='utf-8'):
-    log_level_str = config.get('dev', 'log_level', fallback='INFO').upper()
-else:
-    print(f"警告：无法找到或读取配置文件 {config_path}，将使用默认日志级别 INFO")
-
-# Map string level to logging constant
-log_levels = {
-    'DEBUG': logging.DEBUG,
-    'INFO': logging.INFO,
-    'WARNING': logging.WARNING,
-    'ERROR': logging.ERROR,
-    'CRITICAL': logging.CRITICAL
-}
-log_level = log_levels.get(log_level_str, logging.INFO)
+log_format = settings.dev.log_format
+log_max_bytes = int(settings.dev.log_max_mb * 1024 * 1024)
+log_disk_budget = int(settings.dev.log_disk_budget_mb * 1024 * 1024)
+log_level = getattr(logging, settings.dev.log_level)
 # --- Read Configuration --- END
 
 # Construct paths relative to the base path
 log_dir = os.path.join(base_path, 'logs')
 log_file_path = os.path.join(log_dir, 'app.log')
-# --- Determine base path --- END
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，便于机器解析 (中文不转义，仍可直接阅读)。"""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'thread': record.threadName,
+            'module': record.module,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyQueueHandler(QueueHandler):
+    """只把日志记录放入队列，消息的格式化 (msg % args) 推迟到后台写入线程。
+
+    标准 QueueHandler 会在调用线程里格式化消息，这里跳过这一步；
+    本程序的队列只在进程内使用，不需要记录可序列化。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """按大小轮转的文件日志：轮转后的文件在独立线程中 gzip 压缩，并按总磁盘预算删除最旧的归档。
+
+    归档文件名带时间戳和序号 (app.log.20250101-120000-000.gz)，按文件名排序即按时间排序。
+    """
+
+    def __init__(self, filename, max_bytes, disk_budget, encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=0, encoding=encoding)
+        self.disk_budget = disk_budget
+        self._compress_queue = queue.Queue()
+        threading.Thread(target=self._compress_worker, name='snaf-log-compress', daemon=True).start()
+        # 上次退出时尚未压缩完的文件
+        for pending in sorted(glob.glob(self.baseFilename + '.*.pending')):
+            self._compress_queue.put(pending)
+
+    def shouldRollover(self, record):
+        # backupCount=0 时父类不会轮转，这里只按大小判断
+        if self.stream is None:
+            self.stream = self._open()
+        return self.maxBytes > 0 and self.stream.tell() >= self.maxBytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        sequence = 0
+        while True:
+            # 同一秒内多次轮转时递增序号，保证文件名唯一且仍按时间排序
+            pending = f"{self.baseFilename}.{stamp}-{sequence:03d}.pending"
+            if not (os.path.exists(pending) or os.path.exists(pending[:-len('.pending')] + '.gz')):
+                break
+            sequence += 1
+        if os.path.exists(self.baseFilename):
+            os.replace(self.baseFilename, pending)
+            self._compress_queue.put(pending)
+        self.stream = self._open()
+
+    def _compress_worker(self):
+        while True:
+            pending = self._compress_queue.get()
+            archive = pending[:-len('.pending')] + '.gz'
+            try:
+                with open(pending, 'rb') as src, gzip.open(archive, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(pending)
+                self._enforce_budget()
+            except OSError as e:
+                # 写日志的线程就是日志系统本身，这里只能输出到 stderr
+                print(f"压缩日志归档 {pending} 失败: {e}", file=sys.stderr)
+
+    def _enforce_budget(self):
+        archives = sorted(glob.glob(self.baseFilename + '.*.gz'))
+        sizes = {path: os.path.getsize(path) for path in archives}
+        total = sum(sizes.values())
+        while archives and total > self.disk_budget:
+            oldest = archives.pop(0)
+            os.remove(oldest)
+            total -= sizes[oldest]
+
+
+_listener = None
+
 
 def setup_logger(log_file=log_file_path, level=log_level):
-    """配置日志记录器，使用从配置或默认值设置的级别"""
+    """配置日志记录器，使用从配置或默认值设置的级别。
+
+    调用线程只把记录放入内存队列；格式化、写文件、压缩归档都在后台线程完成。
+    """
+    global _listener
     # Ensure log directory exists
     os.makedirs(log_dir, exist_ok=True)
 
     # Slightly improved formatter
-    log_formatter = logging.Formatter('%(asctime)s [%(levelname)-8s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    text_formatter = logging.Formatter('%(asctime)s [%(levelname)-8s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
-    log_handler = RotatingFileHandler(
-        log_file,
-        maxBytes=5*1024*1024, # 5 MB
-        backupCount=2,
-        encoding='utf-8'
-    )
-    log_handler.setFormatter(log_formatter)
+    log_handler = CompressingRotatingFileHandler(log_file, max_bytes=log_max_bytes, disk_budget=log_disk_budget)
+    log_handler.setFormatter(JsonLinesFormatter() if log_format == 'json' else text_formatter)
 
     # 控制台输出
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(log_formatter)
+    console_handler.setFormatter(text_formatter)
 
     logger = logging.getLogger('szu_network_fixer')
     logger.setLevel(level)
 
     # 避免重复添加handler
     if not logger.handlers:
-        logger.addHandler(log_handler)
-        logger.addHandler(console_handler)
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(LazyQueueHandler(log_queue))
+        _listener = QueueListener(log_queue, log_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # 退出前写完队列中剩余的日志
 
     return logger
 
-# 初始化logger
-# Removed: Log directory creation is now inside setup_logger
-# if not os.path.exists('logs'):
-#     os.makedirs('logs')
+def _on_config_change(changed):
+    if ('dev', 'log_level') in changed:
+        logger.setLevel(getattr(logging, settings.dev.log_level))
+        logger.info(f"日志级别已切换为 {settings.dev.log_level}")
+
 
-logger = setup_logger() 
\ No newline at end of file
+logger = setup_logger()
+settings.add_listener(_on_config_change)
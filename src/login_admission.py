@@ -0,0 +1,269 @@
+import json
+import os
+import random
+import socket
+import threading
+import time
+from logger_config import logger
+from settings import settings
+import metrics
+from network_utils import PortalCode
+
+# --- 登录准入 --- START
+# 网关过载的迹象：这些结果说明 Portal 忙不过来，应当退避而不是按原节奏重试
+OVERLOAD_CODES = frozenset({PortalCode.TIMEOUT, PortalCode.NETWORK_ERROR})
+# REJECTED 消息中表示服务器繁忙的关键字
+OVERLOAD_MESSAGES = ('繁忙', '稍后', '过多', '频繁', 'busy', 'too many', 'try again', 'limit')
+
+BROADCAST_ADDRESS = '255.255.255.255'
+LEASE_MAGIC = 'snaf-lease/1'
+LEASE_SETTLE = 0.3  # 广播申请后等待其他主机申请的秒数，用于裁决同时发起的申请
+
+
+class TokenBucket:
+    """令牌桶：最多积累 capacity 个令牌，每 refill 秒补充一个。"""
+
+    def __init__(self, capacity, refill, clock=time.monotonic):
+        self.capacity = capacity
+        self.refill = refill
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+
+    def take(self):
+        """取走一个令牌并返回 0；令牌不足时不取，返回需要等待的秒数。"""
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) / self.refill)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) * self.refill
+
+
+class LanLease:
+    """局域网登录租约：通过 UDP 广播协调，同一时刻最多 slots 台主机向 Portal 发送登录请求。
+
+    每台主机登录前广播 claim，等待 LEASE_SETTLE 秒收集同时发起的申请，按主机标识排序裁决；
+    获胜者广播 hold 并在登录结束后广播 release。租约最长保持 ttl 秒，持有者崩溃时自动过期。
+    时间都按本机收到消息的时间计算，不依赖各主机时钟同步。
+    """
+
+    def __init__(self, port, slots, ttl, host_id=None, clock=time.monotonic, rng=None):
+        self.port = port
+        self.slots = slots
+        self.ttl = ttl
+        self.host_id = host_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._peers = {}  # host_id -> (状态 'claim'/'hold', 本地过期时间)
+        self._stopped = threading.Event()
+        self._sock = None
+
+    def start(self):
+        """绑定广播端口并启动监听线程，返回是否成功。"""
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self._sock.bind(('', self.port))
+        except OSError as e:
+            logger.warning(f"无法绑定登录租约广播端口 {self.port}，不进行局域网协调: {e}")
+            self._sock = None
+            return False
+        threading.Thread(target=self._listen, name='snaf-lan-lease', daemon=True).start()
+        logger.info(f"局域网登录租约已启用 (UDP {self.port}，同时最多 {self.slots} 台主机登录)，本机标识 {self.host_id}")
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._sock is not None:
+            self._sock.close()
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                data, _ = self._sock.recvfrom(2048)
+            except OSError:
+                if not self._stopped.is_set():
+                    logger.warning("登录租约套接字读取失败，局域网协调已停止。", exc_info=True)
+                return
+            try:
+                message = json.loads(data)
+                if message.get('magic') != LEASE_MAGIC or message['host'] == self.host_id:
+                    continue
+                self._on_message(message['host'], message['op'], float(message.get('ttl', 0)))
+            except (ValueError, KeyError, TypeError):
+                logger.debug(f"忽略无效的登录租约消息: {data[:100]!r}")
+
+    def _on_message(self, host, op, ttl):
+        with self._lock:
+            if op == 'release':
+                self._peers.pop(host, None)
+            elif op in ('claim', 'hold'):
+                self._peers[host] = (op, self._clock() + min(ttl, self.ttl))
+
+    def _broadcast(self, op, ttl=0.0):
+        message = json.dumps({'magic': LEASE_MAGIC, 'host': self.host_id, 'op': op, 'ttl': ttl})
+        try:
+            self._sock.sendto(message.encode('utf-8'), (BROADCAST_ADDRESS, self.port))
+        except OSError as e:
+            logger.debug(f"发送登录租约广播失败: {e}")
+
+    def _active(self):
+        now = self._clock()
+        with self._lock:
+            self._peers = {host: entry for host, entry in self._peers.items() if entry[1] > now}
+            return dict(self._peers)
+
+    def acquire(self):
+        """申请租约：获得时返回 0，否则返回建议等待的秒数。未启动时总是获得。"""
+        if self._sock is None:
+            return 0.0
+        holders = [expires for op, expires in self._active().values() if op == 'hold']
+        if len(holders) >= self.slots:
+            # 等到最早的租约到期，再错开一点避免所有等待者同时重试
+            return min(holders) - self._clock() + self._rng.uniform(0, self.ttl / 2)
+        self._broadcast('claim', LEASE_SETTLE * 3)
+        time.sleep(LEASE_SETTLE)
+        peers = self._active()
+        free = self.slots - sum(1 for op, _ in peers.values() if op == 'hold')
+        contenders = sorted([self.host_id] + [host for host, (op, _) in peers.items() if op == 'claim'])
+        if contenders.index(self.host_id) < free:
+            self._broadcast('hold', self.ttl)
+            return 0.0
+        self._broadcast('release')
+        return self._rng.uniform(LEASE_SETTLE, self.ttl)
+
+    def release(self):
+        if self._sock is not None:
+            self._broadcast('release')
+
+
+class LoginAdmission:
+    """登录准入层：决定现在是否允许向 Portal 发送登录请求。
+
+    网关故障恢复时，机房里上百台运行本程序的电脑会按相同的重连节奏同时登录，把 Portal 压成 502。
+    准入层在每次登录前依次检查：
+      1. 断网后的第一次登录先随机等待 [login] jitter 秒，打散同时发现断网的主机；
+      2. 服务器反馈的退避：502/超时/繁忙消息后按指数退避 (带抖动)，账号密码错误后长时间暂停；
+      3. 本机令牌桶：限制单机的登录频率 (事件触发的检查再频繁也不会连续登录)；
+      4. (可选) 局域网租约：同一广播域内同时登录的主机数不超过 lease_slots。
+    clock 和 rng 可替换，便于在模拟器中回放。
+    """
+
+    def __init__(self, clock=time.monotonic, rng=None, lease=None):
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._bucket = None
+        self._failures = 0
+        self._backoff_until = 0.0
+        self._jittered = False
+        self._leased = False  # acquire() 是否取得了尚未释放的局域网租约
+        self.lease = lease
+
+    def start(self):
+        """按配置启动局域网租约 ([login] lan_lease)。"""
+        login = settings.login
+        if self.lease is None and login.lan_lease:
+            self.lease = LanLease(login.lease_port, login.lease_slots, login.lease_ttl, rng=self._rng)
+            if not self.lease.start():
+                self.lease = None
+
+    def stop(self):
+        if self.lease is not None:
+            self.lease.stop()
+
+    def _take_token(self):
+        login = settings.login
+        if self._bucket is None or (self._bucket.capacity, self._bucket.refill) != (login.bucket_size,
+                                                                                      login.bucket_refill):
+            self._bucket = TokenBucket(login.bucket_size, login.bucket_refill, self._clock)
+        return self._bucket.take()
+
+    def spread(self, delay):
+        """给断网期间的重试间隔加上随机抖动，避免各主机按相同节奏同步重试。"""
+        return delay + self._rng.uniform(0, settings.login.jitter)
+
+    def reset(self):
+        """网络恢复后调用：下一次断网重新做首次随机等待。"""
+        with self._lock:
+            self._jittered = False
+
+    def acquire(self, preemptive=False):
+        """申请一次登录，返回 (等待秒数, 原因)；等待秒数为 0 表示允许立即登录。
+
+        允许登录后，调用方在登录结束时调用 release() (没有经过 acquire() 的登录只调用 record())。
+        preemptive=True 用于会话过期前的主动重新认证：网络仍在线，不做断网后的随机错峰和服务器退避，
+        否则等待会吃掉 preempt_margin 留出的提前量；令牌桶和局域网租约照常生效。
+        """
+        with self._lock:
+            if not preemptive and not self._jittered and settings.login.jitter > 0:
+                self._jittered = True
+                return self._refuse('jitter', self._rng.uniform(0, settings.login.jitter), "断网后随机错峰")
+            wait = self._backoff_until - self._clock()
+            if not preemptive and wait > 0:
+                return self._refuse('backoff', wait, f"服务器反馈退避中 (连续 {self._failures} 次过载)")
+            wait = self._take_token()
+            if wait > 0:
+                return self._refuse('rate_limited', wait, "本机登录频率限制")
+        if self.lease is not None:
+            wait = self.lease.acquire()
+            if wait > 0:
+                return self._refuse('lease_busy', wait, "局域网内登录中的主机已满")
+            with self._lock:
+                self._leased = True
+        metrics.login_admission.inc(decision='admitted')
+        return 0.0, "允许登录"
+
+    def _refuse(self, decision, wait, reason):
+        metrics.login_admission.inc(decision=decision)
+        return wait, reason
+
+    def release(self, result):
+        """登录结束：释放 acquire() 取得的局域网租约，并根据结果调整退避。result 为 PortalResult。
+
+        没有持有租约时不广播 release，以免释放其他主机正在计算的名额。
+        """
+        with self._lock:
+            leased, self._leased = self._leased, False
+        if leased and self.lease is not None:
+            self.lease.release()
+        self.record(result)
+
+    def record(self, result):
+        """根据 Portal 的答复调整退避：过载时指数退避，账号密码错误时暂停 backoff_max 秒。"""
+        login = settings.login
+        with self._lock:
+            if result.ok:
+                self._failures = 0
+                self._backoff_until = 0.0
+                return
+            if result.code is PortalCode.BAD_CREDENTIALS:
+                # 反复用错误的密码登录可能导致账号被锁定
+                wait = login.backoff_max
+                logger.warning(f"登录准入: 账号或密码错误，{wait:.0f} 秒内不再尝试登录。")
+            elif is_overload(result):
+                self._failures += 1
+                ceiling = min(login.backoff_max, login.backoff_base * 2 ** (self._failures - 1))
+                wait = ceiling / 2 + self._rng.uniform(0, ceiling / 2)
+                logger.warning(f"登录准入: Portal 可能过载 [{result.code.value}] {result.message}，"
+                               f"第 {self._failures} 次退避 {wait:.0f} 秒。")
+            else:
+                return
+            self._backoff_until = self._clock() + wait
+
+
+def is_overload(result):
+    """PortalResult 是否表明网关过载 (502、超时、连接失败或繁忙类错误消息)。"""
+    if result.code in OVERLOAD_CODES:
+        return True
+    if result.code is PortalCode.HTTP_ERROR:
+        return result.message.startswith('HTTP 5')
+    message = (result.message or '').lower()
+    return result.code is PortalCode.REJECTED and any(keyword in message for keyword in OVERLOAD_MESSAGES)
+# --- 登录准入 --- END
@@ -1,190 +1,507 @@
-import schedule
+import signal
 import time
-import configparser
-import os
-import sys
-from network_utils import check_internet_connection, login_to_network
-from email_utils import send_notification_email
+from network_utils import login_to_network, monitored_interfaces, probe_network
+from outbox import Outbox
 from logger_config import logger
-
-# --- Determine base path and config path --- START
-if getattr(sys, 'frozen', False):
-    base_path = os.path.dirname(sys.executable)
-else:
-    base_path = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_path, 'config.ini')
-# --- Determine base path and config path --- END
+from scheduler import Scheduler
+from link_watcher import LINK_WATCH, LinkWatcher
+from retry_policy import ConnectionState, ConnectionStateMachine, load_policy
+from session_predictor import PREDICT_ENABLED, SessionPredictor
+from probe_utils import HTTP_KINDS, run_probe
+import probe_utils
+from event_store import HISTORY_ENABLED, EventStore
+from diagnosis import DIAGNOSIS_LABELS, LOGIN_FIXABLE, run_diagnosis
+from login_admission import LoginAdmission
+from fleet import Fleet
+from link_quality import LinkSampler
+import iface_utils
+import dns_cache
+import metrics
+import sd_notify
+from control import ControlServer
+from settings import settings
 
 # 全局变量
 email_sent_successfully = False  # 跟踪邮件发送状态，避免重复发送
-in_high_frequency_mode = False  # 是否处于高频重连模式
-high_frequency_start_time = None  # 高频重连模式开始时间
-high_frequency_job = None  # 高频重连的调度任务对象
-
-config = configparser.ConfigParser()
-# Read config using the absolute path
-if not config.read(config_path, encoding='utf-8'):
-    # Use logger if available, otherwise print and exit
-    try:
-        logger.critical(f"错误：无法找到或读取配置文件 {config_path}")
-    except NameError:
-        print(f"错误：无法找到或读取配置文件 {config_path}")
-    sys.exit(f"配置文件未找到: {config_path}")
-
-# 读取配置
-try:
-    # 正常检查间隔 (分钟)
-    interval = config.getint('schedule', 'interval', fallback=10)
-    # 高频重连间隔 (秒)
-    high_frequency_interval = config.getint('schedule', 'high_frequency_interval', fallback=30)
-    # 高频重连持续时间 (分钟)
-    high_frequency_duration = config.getint('schedule', 'high_frequency_duration', fallback=10)
-except (configparser.NoSectionError, configparser.NoOptionError, ValueError) as e:
-    logger.warning(f"无法从 config.ini 读取部分配置，将使用默认值。错误: {e}")
-    if 'interval' not in locals():
-        interval = 10
-    if 'high_frequency_interval' not in locals():
-        high_frequency_interval = 30
-    if 'high_frequency_duration' not in locals():
-        high_frequency_duration = 10
-        
+last_online_check = None  # 最近一次确认在线的时间，用于估算断网检测延迟
+last_report = None  # 最近一次探测的 ProbeReport，供控制接口查询延迟
+paused_until = None  # 控制接口暂停检查时为恢复时间 (无限期暂停为 float('inf'))，未暂停为 None
+
+CHECK_TASK = 'check'  # 检查流水线 (探测 -> 登录) 在调度器中的任务名
+VERIFY_TASK = 'verify'  # 登录后的验证步骤；与检查分开命名，触发检查不会替换掉尚未执行的验证
+PREEMPT_TASK = 'preempt'  # 预测会话过期前的主动重新认证
+KEEPALIVE_TASK = 'keepalive'  # 空闲保活流量
+IFACE_TASK = 'iface:'  # 多网卡主机上单个接口的后台重新认证 (后接接口地址)
+RELOGIN_TASK = 'relogin'  # 控制接口要求的强制重新登录
+RESUME_TASK = 'resume'  # 定时暂停到期后恢复检查
+WATCHDOG_TASK = 'watchdog'  # systemd 看门狗心跳
+VERIFY_DELAY = 5  # 登录成功后等待网络稳定再验证的秒数
+
+# 截止时间堆调度器：只在下一次检查到期时唤醒，阻塞操作在后台线程执行
+scheduler = Scheduler(max_workers=4 + settings.fleet.concurrency)
+# 通知发件箱：事件先落盘，网络可用时由后台线程发送
+outbox = Outbox()
+# 连接状态机 (online / probing / logging_in / verifying / offline)
+state = ConnectionStateMachine()
+# 会话寿命预测器：学习 Portal 的定时下线规律，在过期前主动处理
+predictor = SessionPredictor(settings.credentials.username) if PREDICT_ENABLED else None
+# 事件历史库：探测、登录和状态变化只追加写入 SQLite，供 event_store.py 命令行查询
+history = EventStore() if HISTORY_ENABLED else None
+if history is not None:
+    state.add_listener(history.on_transition)
+# 登录准入层：随机错峰、令牌桶限速、按服务器反馈退避，可选局域网租约，避免大量主机同时登录压垮 Portal
+admission = LoginAdmission()
+# 多网卡主机上每个接口独立的登录准入 (接口地址 -> LoginAdmission；Windows 上接口名不唯一，只能按地址区分)
+iface_admissions = {}
+
+# 读取配置：检查间隔与断网重连节奏都由 [schedule] 中选择的重连策略决定
+policy = load_policy()
+interval = policy.normal_interval // 60
+
 logger.info("主程序配置加载完成。")
-logger.info(f"网络检查间隔: {interval} 分钟; 高频重连间隔: {high_frequency_interval} 秒; 高频持续时间: {high_frequency_duration} 分钟")
-
-def start_high_frequency_mode():
-    """启动高频重连模式"""
-    global in_high_frequency_mode, high_frequency_start_time, high_frequency_job
-    
-    # 如果已经在高频模式，只更新开始时间
-    if in_high_frequency_mode:
-        high_frequency_start_time = time.time()
-        logger.info(f"已处于高频重连模式，重置计时器。将持续 {high_frequency_duration} 分钟。")
+logger.info(f"网络检查间隔: {interval} 分钟; 重连策略: {policy.describe()}")
+
+def on_config_change(changed):
+    """[schedule] 中的检查间隔或重连策略变化时重建策略；在线时按新间隔重新安排下一次检查。"""
+    global policy, interval
+    if not any(section == 'schedule' for section, _ in changed):
+        return
+    policy = load_policy()
+    interval = policy.normal_interval // 60
+    logger.info(f"检查间隔已更新为 {interval} 分钟; 重连策略: {policy.describe()}")
+    if state.state is ConnectionState.ONLINE:
+        scheduler.schedule(CHECK_TASK, policy.online_delay(), job)
+
+settings.add_listener(on_config_change)
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+def schedule_next_check():
+    """按连接状态和重连策略设置下一次检查的截止时间。"""
+    if state.is_offline:
+        delay = admission.spread(policy.next_delay(state.attempts, state.offline_for()))
+        logger.info(f"仍处于断网状态 (已持续 {state.offline_for() / 60:.1f} 分钟，已尝试 {state.attempts} 次)，"
+                    f"{delay:.0f} 秒后再次尝试。")
+    else:
+        delay = policy.online_delay()
+    scheduler.schedule(CHECK_TASK, delay, job)
+    logger.debug(f"下一次网络检查将在 {delay:.0f} 秒后执行。")
+
+def notify(subject, body, **kwargs):
+    """把通知放入发件箱，检查流水线不等待 SMTP；断网期间的事件会在网络恢复后补发。
+
+    Args:
+        subject (str): 邮件主题。
+        body (str): 邮件正文。
+        **kwargs: 透传给 send_notification_email 的参数。
+    """
+    return outbox.enqueue(subject, body, **kwargs)
+
+# 集群模式：为 [fleet:<名称>] 列出的其他账号/IP 保持认证 (没有成员时不产生任何任务)
+fleet = Fleet(scheduler, notify)
+
+def start_session():
+    """记录新会话开始，并按学习到的规律安排过期前重新认证和保活。"""
+    if predictor is None:
+        return
+    predictor.session_started()
+    schedule_session_tasks()
+
+def schedule_session_tasks():
+    """按当前会话的开始时间安排过期前重新认证和保活。"""
+    expiry = predictor.predicted_expiry()
+    if expiry is not None:
+        margin = settings.session.preempt_margin
+        delay = expiry - margin - time.time()
+        scheduler.schedule(PREEMPT_TASK, delay, preempt_session)
+        logger.info(f"根据历史会话规律，预计会话将于 {format_time(expiry)} 过期，将提前 {margin:.0f} 秒重新认证。")
+    # [session] keepalive_interval: 0 表示根据历史自动推断，负数表示关闭
+    keepalive_interval = settings.session.keepalive_interval or predictor.idle_keepalive_interval()
+    if keepalive_interval and keepalive_interval > 0:
+        scheduler.schedule(KEEPALIVE_TASK, keepalive_interval, keepalive, keepalive_interval)
+        logger.info(f"已启用会话保活，每 {keepalive_interval:.0f} 秒发送一次轻量请求。")
+
+def end_session(drop_time):
+    """记录会话掉线并取消与该会话相关的预测任务。"""
+    if predictor is None:
+        return
+    predictor.session_dropped(drop_time)
+    scheduler.cancel(PREEMPT_TASK)
+    scheduler.cancel(KEEPALIVE_TASK)
+
+def preempt_session():
+    """预测的过期时间前主动重新认证，并在过期窗口附近加密检查，把定时下线变为无缝切换。"""
+    if state.state is not ConnectionState.ONLINE or paused_until is not None:
+        return
+    wait, reason = admission.acquire(preemptive=True)
+    if wait > 0:
+        logger.info(f"登录准入: 主动重新认证推迟 {wait:.0f} 秒 ({reason})。")
+        scheduler.schedule(PREEMPT_TASK, wait, preempt_session)
+        return
+    logger.info("会话即将按规律过期，注销并主动重新认证...")
+    user_ip = login_and_record(relogin=True, login_admission=admission)
+    if user_ip:
+        logger.info(f"主动重新认证完成 (IP: {user_ip})。")
+        # 主动结束的会话不是真实寿命，不参与学习；从现在起记为新会话，并为它安排下一次主动重新认证
+        start_session()
+    # 在预测过期时间刚过时立即检查一次，而不是等到下一个正常周期
+    check_delay = settings.session.preempt_margin + 5
+    next_due = scheduler.next_due(CHECK_TASK)
+    if next_due is None or next_due > check_delay:
+        scheduler.schedule(CHECK_TASK, check_delay, job)
+
+def keepalive(interval):
+    """在线时发送一次轻量 HTTP 请求，避免 Portal 因空闲而注销会话。"""
+    if state.state is not ConnectionState.ONLINE:
+        return
+    http_probes = [p for p in probe_utils.PROBES if p.kind in HTTP_KINDS]
+    if http_probes:
+        # 多网卡时每个接口的会话都要保活，否则承载流量之外的接口会因空闲被注销而无人察觉
+        for source in [i.address for i in monitored_interfaces()] or [None]:
+            result = run_probe(http_probes[0], source=source)
+            logger.debug(f"保活请求 {http_probes[0].target} (源地址 {source or '默认'}): {result.detail}")
+    scheduler.schedule(KEEPALIVE_TASK, interval, keepalive, interval)
+
+def mark_online():
+    """切换到在线状态并更新指标，返回本次断网开始时间 (原本在线则为 None)。"""
+    global last_online_check
+    outage_start = state.offline_since
+    state.transition(ConnectionState.ONLINE)
+    outbox.set_online(True)
+    admission.reset()
+    last_online_check = time.time()
+    metrics.online_gauge.set(1)
+    if outage_start is not None:
+        outage = last_online_check - outage_start
+        metrics.time_to_reconnect.observe(outage)
+        metrics.downtime_total.inc(outage)
+    return outage_start
+
+def record_online():
+    """记录网络在线：唤醒发件箱，如有未结束的断网记录则补记一条恢复事件。"""
+    outage_start = mark_online()
+    if outage_start is None and predictor is not None and predictor.resume_session():
+        # 启动时已经在线：沿用上一次运行记录的会话开始时间
+        logger.info("启动时已在线，沿用上一次运行记录的会话开始时间。")
+        schedule_session_tasks()
+    if outage_start is not None:
+        start_session()
+        disconnect_time = format_time(outage_start)
+        notify("校园网恢复通知: 网络已恢复",
+               f"网络在 {disconnect_time} 断开后已恢复 (无需重新登录)。",
+               disconnect_time=disconnect_time,
+               reconnect_time=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+def record_offline(cause=None):
+    """记录网络断开：暂停发件箱发送，并在断网开始时写入一条断开事件 (网络恢复后发送)。
+
+    Args:
+        cause (str, optional): 断网诊断结果，写入通知正文。
+    """
+    was_offline = state.is_offline
+    state.transition(ConnectionState.OFFLINE)
+    outbox.set_online(False)
+    if not was_offline:
+        metrics.online_gauge.set(0)
+        if last_online_check is not None:
+            # 断网发生在上一次成功检查之后，这是检测延迟的上限
+            metrics.time_to_detect.observe(state.offline_since - last_online_check)
+        end_session(state.offline_since)
+        disconnect_time = format_time(state.offline_since)
+        logger.info(f"进入断网重连流程，重连策略: {policy.describe()}")
+        body = f"检测到校园网连接于 {disconnect_time} 中断，正在尝试自动重连。"
+        if cause:
+            body += f"\n诊断结果: {cause}"
+        notify("校园网断开通知: 检测到网络断开", body, disconnect_time=disconnect_time, diagnostics=True)
+
+def check_and_record():
+    """检查网络并把结果和耗时写入事件历史，返回 ProbeReport。"""
+    global last_report
+    start = time.perf_counter()
+    report = last_report = probe_network()
+    if history is not None:
+        history.record('probe', report.online, time.perf_counter() - start)
+    return report
+
+def login_and_record(relogin=False, user_ip=None, login_admission=None):
+    """登录校园网并写入事件历史，返回 user_ip 或 None。
+
+    login_admission 为本次登录通过的准入层 (acquire() 已允许)，登录结束后释放它；
+    没有经过准入的登录 (例如控制接口的强制重新登录) 只把结果反馈给主准入层调整退避。
+    """
+    start = time.perf_counter()
+    result = login_to_network(relogin, user_ip)
+    if login_admission is not None:
+        login_admission.release(result)
+    else:
+        admission.record(result)
+    if history is not None:
+        history.record('login', result.ok, time.perf_counter() - start, detail=result.code.value)
+    return result.user_ip if result.ok else None
+
+def failing_interfaces(report):
+    """逐接口探测时返回探测未通过的接口 [(接口名, 地址)]。"""
+    return [(name, address) for address, (name, iface_report) in (report.interfaces or {}).items()
+            if not iface_report.online]
+
+def relogin_interface(name, address, attempt=1):
+    """多网卡主机上单个接口的重新认证：其他接口正常时流量由它们承载，本接口在后台恢复，不影响整体在线状态。"""
+    if address not in {i.address for i in monitored_interfaces()}:
+        logger.info(f"接口 {name} ({address}) 已不存在或不再需要单独监测，停止重新认证。")
+        return
+    iface_admission = iface_admissions.setdefault(address, LoginAdmission())
+    wait, reason = iface_admission.acquire()
+    if wait > 0:
+        logger.info(f"接口 {name} 暂缓登录 {wait:.0f} 秒 ({reason})。")
+        scheduler.schedule(IFACE_TASK + address, wait, relogin_interface, name, address, attempt)
         return
-    
-    # 清除所有现有的调度
-    schedule.clear()
-    
-    # 启动高频模式
-    in_high_frequency_mode = True
-    high_frequency_start_time = time.time()
-    logger.info(f"启动高频重连模式: 每 {high_frequency_interval} 秒尝试一次，持续 {high_frequency_duration} 分钟...")
-    
-    # 创建新的高频任务
-    high_frequency_job = schedule.every(high_frequency_interval).seconds.do(job)
-
-def stop_high_frequency_mode():
-    """停止高频重连模式，恢复正常检查间隔"""
-    global in_high_frequency_mode, high_frequency_start_time, high_frequency_job
-    
-    if not in_high_frequency_mode:
+    logger.info(f"接口 {name} ({address}) 探测不通，从该接口重新认证 (第 {attempt} 次)...")
+    login_and_record(user_ip=address, login_admission=iface_admission)
+    scheduler.schedule(IFACE_TASK + address, VERIFY_DELAY, verify_interface, name, address, attempt)
+
+def verify_interface(name, address, attempt):
+    """从接口自身的地址确认认证是否生效，未恢复时按重连策略继续重试。"""
+    if probe_utils.run_probes(source=address).online:
+        logger.info(f"接口 {name} ({address}) 已恢复。")
+        iface_admissions[address].reset()
         return
-    
-    # 清除所有任务
-    schedule.clear()
-    in_high_frequency_mode = False
-    high_frequency_start_time = None
-    high_frequency_job = None
-    
-    logger.info(f"退出高频重连模式，恢复正常间隔: 每 {interval} 分钟检查一次。")
-    
-    # 创建新的正常间隔任务
-    schedule.every(interval).minutes.do(job)
-
-def check_high_frequency_timeout():
-    """检查高频模式是否超时"""
-    if not in_high_frequency_mode or high_frequency_start_time is None:
-        return False
-    
-    # 计算已经过去了多少分钟
-    elapsed_minutes = (time.time() - high_frequency_start_time) / 60
-    if elapsed_minutes >= high_frequency_duration:
-        logger.info(f"高频重连已达到最大持续时间 ({high_frequency_duration} 分钟)，切换回正常间隔。")
-        stop_high_frequency_mode()
-        return True
-    return False
+    delay = admission.spread(policy.next_delay(attempt, 0.0))
+    logger.warning(f"接口 {name} ({address}) 重新认证后仍不通，{delay:.0f} 秒后再试。")
+    scheduler.schedule(IFACE_TASK + address, delay, relogin_interface, name, address, attempt + 1)
+
+def on_link_change(reasons):
+    """网络变化事件回调：刷新接口缓存并立即执行一次检查，定时检查作为兜底继续保留。"""
+    iface_utils.invalidate()
+    scheduler.trigger(CHECK_TASK, job)
+
+def on_link_degraded(target, reason):
+    """链路质量采样发现劣化：在线时提前执行一次检查，会话已失效时由检查流水线诊断并重新登录。"""
+    if state.state is ConnectionState.ONLINE:
+        logger.info(f"链路质量下降 ({target}: {reason})，提前检查网络。")
+        scheduler.trigger(CHECK_TASK, job)
+
+sampler = LinkSampler(scheduler, on_link_degraded)
 
 def job():
-    """定时执行的任务：检查网络，如果断开则尝试重连并发送邮件通知。"""
-    global email_sent_successfully, in_high_frequency_mode
-    logger.info(f"---------- 网络状态检查开始{' (高频模式)' if in_high_frequency_mode else ''} ----------")
-    
-    # 检查高频模式是否超时
-    check_high_frequency_timeout()
-    
-    # 保存当前时间，用于记录断开时间
-    current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-    
-    if check_internet_connection():
+    """定时执行的任务：检查网络，如果断开则尝试重连，并安排验证与邮件通知。
+
+    登录成功后不再阻塞等待，而是把验证步骤作为延时任务交给调度器；邮件在后台线程发送。
+    """
+    global email_sent_successfully
+    if paused_until is not None:
+        logger.info("检查已通过控制接口暂停，跳过本次检查。")
+        return
+    if state.state is ConnectionState.VERIFYING:
+        logger.info("登录后的验证尚未完成，跳过本次检查 (验证结束后会安排下一次检查)。")
+        return
+    logger.info(f"---------- 网络状态检查开始{' (断网重连中)' if state.is_offline else ''} ----------")
+    state.transition(ConnectionState.PROBING)
+
+    report = check_and_record()
+    if report.online:
         logger.info("网络连接当前状态：正常。")
-        
-        # 如果网络恢复正常且处于高频模式，退出高频模式
-        if in_high_frequency_mode:
-            logger.info("网络已恢复正常，退出高频重连模式。")
-            stop_high_frequency_mode()
-        
+        record_online()
+        for name, address in failing_interfaces(report):
+            logger.warning(f"接口 {name} ({address}) 不通，流量由其他正常接口承载，在后台重新认证该接口。")
+            scheduler.trigger(IFACE_TASK + address, relogin_interface, name, address)
+
         # 发送首次成功连接邮件
         if not email_sent_successfully:
-            logger.info("首次检测到网络连接成功，尝试发送通知邮件...")
-            # 尝试发送邮件 (网络正常，可以发送)
-            if send_notification_email("校园网连接通知: 连接成功", "设备当前已连接到校园网并通过互联网检查。"):
+            logger.info("首次检测到网络连接成功，加入通知邮件...")
+            if notify("校园网连接通知: 连接成功", "设备当前已连接到校园网并通过互联网检查。"):
                 email_sent_successfully = True
-                logger.info("首次成功通知邮件已发送。")
-            else:
-                logger.error("发送首次成功通知邮件失败。")
         else:
             logger.info("网络状态稳定，无需操作。")
     else:
         logger.warning("网络连接当前状态：断开或无法访问互联网。")
-        disconnect_time = current_time
         email_sent_successfully = False  # 网络断开，重置邮件标志
-        
-        # 启动高频重连模式
-        if not in_high_frequency_mode:
-            start_high_frequency_mode()
-        
+        # 先判断断网原因，只有登录能解决的情况才去登录
+        diagnosis, detail = run_diagnosis(report)
+        if history is not None:
+            history.record('diagnosis', detail=diagnosis.value)
+        record_offline(f"{DIAGNOSIS_LABELS[diagnosis]} ({detail})")
+
+        if diagnosis not in LOGIN_FIXABLE:
+            logger.warning(f"{DIAGNOSIS_LABELS[diagnosis]}，重新登录无法解决，跳过本次登录。将继续按重连策略检查。")
+            schedule_next_check()
+            logger.info("---------- 网络状态检查结束 ----------\n")
+            return
+
+        wait, reason = admission.acquire()
+        if wait > 0:
+            logger.info(f"登录准入: 暂缓登录 {wait:.0f} 秒 ({reason})，届时重新检查网络。")
+            scheduler.schedule(CHECK_TASK, wait, job)
+            logger.info("---------- 网络状态检查结束 ----------\n")
+            return
+
         logger.info("尝试自动重新登录校园网...")
-        user_ip = login_to_network()  # 返回 user_ip 或 None
-        
+        state.transition(ConnectionState.LOGGING_IN)
+        # 多网卡时先从第一个接口登录，其余接口各自在后台重新认证
+        failing = failing_interfaces(report)
+        for name, address in failing[1:]:
+            scheduler.trigger(IFACE_TASK + address, relogin_interface, name, address)
+        user_ip = login_and_record(user_ip=failing[0][1] if failing else None, login_admission=admission)  # 返回 user_ip 或 None
+
         if user_ip:
-            logger.info(f"自动登录成功或设备已在线 (IP: {user_ip})。等待 5 秒后再次检查网络...")
-            time.sleep(5)  # 等待网络稳定
-            
-            if check_internet_connection():
-                reconnect_time = time.strftime('%Y-%m-%d %H:%M:%S')
-                logger.info(f"再次检查确认网络已恢复连接 (重连时间: {reconnect_time})。")
-                
-                # 网络恢复正常，退出高频模式
-                if in_high_frequency_mode:
-                    stop_high_frequency_mode()
-                
-                # 发送重连成功邮件 (网络已恢复，可以发送)
-                logger.info("尝试发送重连成功通知邮件...")
-                email_body = f"检测到校园网连接中断，已于 {reconnect_time} 自动重新连接成功。"
-                if send_notification_email(
-                    "校园网重连通知: 自动重连成功",
-                    email_body,
-                    user_ip=user_ip,
-                    disconnect_time=disconnect_time,
-                    reconnect_time=reconnect_time
-                ):
-                    email_sent_successfully = True
-                    logger.info("重连成功通知邮件已发送。")
-                else:
-                    logger.error("发送重连成功通知邮件失败。")
-            else:
-                logger.warning("登录成功后网络仍然无法访问。可能存在其他问题 (如 IP 冲突或网关故障)。")
-                # 网络仍有问题，继续高频模式
-                
-                # 不发送邮件，因为网络连接有问题
-                logger.warning("网络仍有问题，无法发送通知邮件。将继续尝试高频重连。")
+            logger.info(f"自动登录成功或设备已在线 (IP: {user_ip})。{VERIFY_DELAY} 秒后再次检查网络...")
+            state.transition(ConnectionState.VERIFYING)
+            # 等待网络稳定：验证期间触发的检查直接跳过 (见 job 开头)，由验证步骤安排下一次检查
+            scheduler.schedule(VERIFY_TASK, VERIFY_DELAY, verify_reconnect, user_ip)
+            logger.info("---------- 网络状态检查结束 (等待验证) ----------\n")
+            return
         else:
             logger.error("自动重新登录校园网失败。")
-            
-            # 不发送邮件，因为原始问题是网络断开
-            logger.warning("网络断开，登录失败，无法发送邮件通知。将继续尝试高频重连。")
-    
+            state.transition(ConnectionState.OFFLINE)
+            logger.warning("网络断开，登录失败，断网事件已保存在发件箱，网络恢复后发送。将继续按重连策略重试。")
+
+    schedule_next_check()
     logger.info("---------- 网络状态检查结束 ----------\n")
 
+def verify_reconnect(user_ip):
+    """登录后的验证步骤：确认网络恢复并发送重连通知。"""
+    global email_sent_successfully
+    logger.info("---------- 登录后验证开始 ----------")
+    disconnect_time = format_time(state.offline_since or time.time())
+    if check_and_record().online:
+        reconnect_time = time.strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"再次检查确认网络已恢复连接 (重连时间: {reconnect_time})。")
+        mark_online()
+        start_session()
+
+        # 重连成功通知放入发件箱，发件箱被唤醒后会一并补发断网期间的事件
+        logger.info("加入重连成功通知邮件...")
+        email_body = f"检测到校园网连接中断，已于 {reconnect_time} 自动重新连接成功。"
+        if notify(
+            "校园网重连通知: 自动重连成功",
+            email_body,
+            user_ip=user_ip,
+            disconnect_time=disconnect_time,
+            reconnect_time=reconnect_time
+        ):
+            email_sent_successfully = True
+    else:
+        logger.warning("登录成功后网络仍然无法访问。可能存在其他问题 (如 IP 冲突或网关故障)。")
+        state.transition(ConnectionState.OFFLINE)
+        # 通知保留在发件箱，网络恢复后再发送
+        logger.warning("网络仍有问题，通知将在网络恢复后发送。将继续按重连策略重试。")
+
+    schedule_next_check()
+    logger.info("---------- 登录后验证结束 ----------\n")
+
+# --- 控制接口 (UNIX 套接字) 与 systemd 集成 --- START
+def force_relogin():
+    """控制接口要求的强制重新登录：注销并重新认证 (不经过准入层的错峰等待)，随后立即验证网络。"""
+    logger.info("控制接口: 注销并强制重新登录...")
+    user_ip = login_and_record(relogin=True)
+    if user_ip:
+        logger.info(f"强制重新登录完成 (IP: {user_ip})，{VERIFY_DELAY} 秒后检查网络。")
+    if paused_until is None:
+        scheduler.schedule(CHECK_TASK, VERIFY_DELAY, job)
+
+def resume():
+    """恢复被暂停的检查，并立即检查一次。"""
+    global paused_until
+    if paused_until is None:
+        return
+    paused_until = None
+    scheduler.cancel(RESUME_TASK)
+    logger.info("控制接口: 恢复网络检查。")
+    scheduler.trigger(CHECK_TASK, job)
+
+def control_status(args):
+    """只读取内存中的状态，不发起任何探测。"""
+    now = time.time()
+    return {
+        'state': state.state.value,
+        'since': format_time(state.since),
+        'offline_since': format_time(state.offline_since) if state.offline_since else None,
+        'attempts': state.attempts,
+        'last_online_check': format_time(last_online_check) if last_online_check else None,
+        'next_check_in': scheduler.next_due(CHECK_TASK),
+        'paused': paused_until is not None,
+        'resume_in': None if paused_until in (None, float('inf')) else round(paused_until - now, 1),
+        'policy': policy.describe(),
+        'outbox_pending': outbox.pending_count(),
+        'fleet': {name: member.state.state.value for name, member in fleet.members.items()},
+    }
+
+def control_check(args):
+    if paused_until is not None:
+        raise ValueError("检查已暂停，请先执行 resume")
+    scheduler.trigger(CHECK_TASK, job)
+    return {'triggered': True}
+
+def control_relogin(args):
+    scheduler.trigger(RELOGIN_TASK, force_relogin)
+    return {'triggered': True}
+
+def control_stats(args):
+    """最近一次检查各探测的耗时、链路质量采样的分位数，以及事件库中最近 60 分钟的平均耗时 (单位: 毫秒)。"""
+    report = last_report
+    stats = {'last_check': None, 'link': {}, 'last_hour': {}}
+    if report is not None:
+        stats['last_check'] = {
+            'online': report.online,
+            'elapsed_ms': round(report.elapsed * 1000, 1),
+            'probes': [{'kind': r.probe.kind, 'target': r.probe.target, 'ok': r.ok,
+                        'latency_ms': round(r.latency * 1000, 1)} for r in report.results],
+        }
+    for target, (count, loss, p50, p95, p99) in sampler.stats().items():
+        stats['link'][target] = {'samples': count, 'loss': round(loss, 3), 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99}
+    if history is not None:
+        for kind in ('probe', 'login'):
+            total, ok_count, avg_ms = history.recent(kind, 3600)
+            if total:
+                stats['last_hour'][kind] = {'total': total, 'ok': ok_count,
+                                            'avg_ms': None if avg_ms is None else round(avg_ms, 1)}
+    return stats
+
+def control_pause(args):
+    """暂停检查与主动重新认证：pause [秒]，省略秒数表示直到 resume。"""
+    global paused_until
+    try:
+        seconds = float(args[0]) if args else None
+    except ValueError:
+        raise ValueError(f"暂停时长必须是秒数: {args[0]}") from None
+    if seconds is not None and seconds <= 0:
+        raise ValueError("暂停时长必须大于 0")
+    paused_until = float('inf') if seconds is None else time.time() + seconds
+    scheduler.cancel(CHECK_TASK)
+    scheduler.cancel(PREEMPT_TASK)
+    if seconds is None:
+        scheduler.cancel(RESUME_TASK)
+        logger.info("控制接口: 暂停网络检查，直到收到 resume。")
+    else:
+        scheduler.schedule(RESUME_TASK, seconds, resume)
+        logger.info(f"控制接口: 暂停网络检查 {seconds:.0f} 秒。")
+    return {'paused': True, 'resume_in': seconds}
+
+def control_resume(args):
+    was_paused = paused_until is not None
+    resume()
+    return {'resumed': was_paused}
+
+CONTROL_HANDLERS = {
+    'ping': lambda args: {'pong': True},
+    'status': control_status,
+    'check': control_check,
+    'relogin': control_relogin,
+    'stats': control_stats,
+    'pause': control_pause,
+    'resume': control_resume,
+}
+
+def watchdog(interval):
+    """systemd 看门狗心跳：作为调度器任务执行，调度器或线程池卡死时心跳中断，由 systemd 重启服务。"""
+    sd_notify.notify(WATCHDOG=1)
+    scheduler.schedule(WATCHDOG_TASK, interval, watchdog, interval)
+
+def on_state_for_systemd(old_state, new_state, timestamp):
+    """把连接状态写入 systemctl status 的状态行。"""
+    sd_notify.notify(STATUS=f"{new_state.value} (自 {format_time(timestamp)})")
+# --- 控制接口 (UNIX 套接字) 与 systemd 集成 --- END
+
 if __name__ == '__main__':
     logger.info("==================================================")
     logger.info("====   校园网自动登录/保活程序 (Windows)  ====")
@@ -195,22 +512,56 @@ if __name__ == '__main__':
     logger.info(" - [Credentials] username, password")
     logger.info(" - [Email] sender_email, sender_password (QQ授权码), receiver_email")
     logger.info(" - [dev] log_level (e.g., INFO, DEBUG)")
-    logger.info(" - [schedule] interval, high_frequency_interval, high_frequency_duration")
+    logger.info(" - [schedule] interval, retry_policy 及对应策略参数")
+    logger.info("运行中修改 config.ini 会自动生效 (少数选项需要重启，日志中会提示)。")
     logger.info("--------------------------------------------------")
 
-    # Run job once immediately on startup
+    # Run job once immediately on startup (the job schedules its own next run)
+    # Portal 和 SMTP 主机名在启动时预解析并固定，之后登录和发信不再等待 DNS
+    dns_cache.preresolve_service_hosts()
     logger.info("首次运行，立即执行一次检查...")
-    job()
-    logger.info("首次检查执行完毕。")
-    logger.info("--------------------------------------------------")
-
-    # Schedule the job with normal interval (will be adjusted if needed by high-frequency logic)
-    schedule.every(interval).minutes.do(job)
+    scheduler.trigger(CHECK_TASK, job)
+    outbox.start()
+    admission.start()
+    fleet.start()
+    sampler.start()
+    metrics.start_exporters(scheduler)
+    settings.watch(scheduler)
+    link_watcher = LinkWatcher(on_link_change) if LINK_WATCH else None
+    if link_watcher is not None:
+        link_watcher.start()
+    control = ControlServer(settings.control.socket, CONTROL_HANDLERS) if settings.control.socket else None
+    if control is not None:
+        control.start()
     logger.info(f"定时任务已设置，默认每 {interval} 分钟检查一次网络状态。")
-    logger.info(f"如果检测到网络问题，将启动高频重连 (每 {high_frequency_interval} 秒一次，持续 {high_frequency_duration} 分钟)。")
-    logger.info("程序正在后台运行，请保持此窗口开启。日志将记录在 logs/app.log")
+    logger.info(f"如果检测到网络问题，将按重连策略重试: {policy.describe()}。")
+    if sd_notify.enabled():
+        # 以 systemd 服务 (Type=notify) 运行：报告就绪、同步状态行，并按 WatchdogSec 发送心跳
+        state.add_listener(on_state_for_systemd)
+        watchdog_interval = sd_notify.watchdog_interval()
+        if watchdog_interval:
+            scheduler.trigger(WATCHDOG_TASK, watchdog, watchdog_interval)
+        sd_notify.notify(READY=1, STATUS="启动完成，正在检查网络")
+        logger.info("以 systemd 服务运行，日志将记录在 logs/app.log")
+    else:
+        logger.info("程序正在后台运行，请保持此窗口开启。日志将记录在 logs/app.log")
     logger.info("==================================================")
+    # systemctl stop 发送 SIGTERM：与 Ctrl+C 一样退出调度循环并执行下面的清理
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
 
-    while True:
-        schedule.run_pending()
-        time.sleep(1) 
\ No newline at end of file
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        logger.info("收到中断信号，程序退出。")
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # 清理期间不再被重复的停止信号打断
+        sd_notify.notify(STOPPING=1)
+        if control is not None:
+            control.stop()
+        if link_watcher is not None:
+            link_watcher.stop()
+        outbox.stop()
+        admission.stop()
+        scheduler.stop()
+        if history is not None:
+            history.close()
@@ -0,0 +1,260 @@
+import bisect
+import os
+import threading
+import time
+from logger_config import logger
+from settings import settings
+
+# --- Metrics Configuration Loading ---
+METRICS_ENABLED = settings.metrics.enabled
+# 仅监听本机地址，格式 host:port；留空则不启动 HTTP 端点
+METRICS_LISTEN = settings.metrics.listen
+# textfile (node_exporter textfile collector 使用的 .prom 文件路径) 和 textfile_interval
+# 每次导出时从 settings.metrics 读取，热加载后立即生效
+# --- Metrics Configuration Loading End ---
+
+# 默认延迟分桶 (秒)，覆盖局域网 Portal 的毫秒级到外网/SMTP 的十几秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+RECOVERY_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+class _Metric:
+    def __init__(self, name, help_text, kind):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """单调递增计数器，按标签区分。"""
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text, 'counter')
+        self._values = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值。"""
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text, 'gauge')
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = float(value)
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """固定分桶的直方图 (Prometheus 语义：累计桶 + sum + count)。"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, 'histogram')
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), series):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class _NullMetric:
+    """关闭指标时使用的空实现，调用开销只有一次方法分派。"""
+
+    def inc(self, amount=1.0, **labels):
+        pass
+
+    def set(self, value, **labels):
+        pass
+
+    def observe(self, value, **labels):
+        pass
+
+
+_NULL = _NullMetric()
+
+
+class Registry:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self._metrics = []
+
+    def _register(self, metric):
+        if not self.enabled:
+            return _NULL
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        """生成 Prometheus 文本格式 (0.0.4)。"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(METRICS_ENABLED)
+
+# --- 指标定义 --- START
+probe_latency = registry.histogram('snaf_probe_latency_seconds', '单个探测的耗时，按探测类型和目标区分')
+probe_results = registry.counter('snaf_probe_total', '探测次数，按类型、目标和结果区分')
+check_results = registry.counter('snaf_check_total', '网络检查次数，按结果区分')
+login_latency = registry.histogram('snaf_login_latency_seconds', '校园网登录请求耗时')
+login_results = registry.counter('snaf_login_total', '校园网登录次数，按结果代码区分')
+diagnosis_results = registry.counter('snaf_diagnosis_total', '断网诊断次数，按原因分类区分')
+login_admission = registry.counter('snaf_login_admission_total', '登录准入判定次数，按判定结果 (允许/错峰/退避/限速/租约已满) 区分')
+dns_latency = registry.histogram('snaf_dns_lookup_seconds', 'DNS 查询耗时 (A/AAAA 并行)，按结果区分')
+dns_cache_results = registry.counter('snaf_dns_cache_total', 'DNS 缓存命中情况 (命中/未命中/使用过期结果/固定解析)')
+smtp_latency = registry.histogram('snaf_smtp_send_latency_seconds', 'SMTP 发送耗时 (含建连与认证)')
+smtp_results = registry.counter('snaf_smtp_send_total', 'SMTP 发送次数，按结果区分')
+time_to_detect = registry.histogram('snaf_time_to_detect_seconds', '从上一次成功检查到发现断网的时间上限',
+                                    RECOVERY_BUCKETS)
+time_to_reconnect = registry.histogram('snaf_time_to_reconnect_seconds', '从发现断网到确认恢复的时间',
+                                       RECOVERY_BUCKETS)
+downtime_total = registry.counter('snaf_downtime_seconds_total', '累计断网时间')
+online_gauge = registry.gauge('snaf_online', '当前是否在线 (1/0)')
+link_rtt = registry.gauge('snaf_link_rtt_seconds', '链路质量采样：最近窗口内 TCP 建连耗时的分位数，按目标区分')
+link_loss = registry.gauge('snaf_link_loss_ratio', '链路质量采样：最近窗口内的丢失率，按目标区分')
+fleet_online = registry.gauge('snaf_fleet_online', '集群模式中各成员是否已认证 (1/0)')
+uptime_start = registry.gauge('snaf_start_time_seconds', '进程启动时间 (Unix 时间戳)')
+# --- 指标定义 --- END
+
+uptime_start.set(time.time())
+
+
+class timed:
+    """上下文管理器：把代码块耗时记录到直方图。关闭指标时不计时。"""
+
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter() if METRICS_ENABLED else 0.0
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if METRICS_ENABLED:
+            self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+# --- 导出 --- START
+def _serve_http(host, port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 不把抓取请求写入应用日志
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='snaf-metrics', daemon=True).start()
+    return server
+
+
+def write_textfile(path=None):
+    """把当前指标原子地写入 .prom 文件 (供 node_exporter textfile collector 读取)；默认为 [metrics] textfile。"""
+    path = path or settings.metrics.textfile
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_exporters(scheduler=None):
+    """按配置启动 HTTP 端点和/或 textfile 导出。未启用指标时什么都不做。"""
+    if not METRICS_ENABLED:
+        return
+    if METRICS_LISTEN:
+        host, _, port = METRICS_LISTEN.rpartition(':')
+        try:
+            _serve_http(host or '127.0.0.1', int(port))
+            logger.info(f"指标 HTTP 端点已启动: http://{host or '127.0.0.1'}:{port}/metrics")
+        except (OSError, ValueError) as e:
+            logger.error(f"无法启动指标 HTTP 端点 {METRICS_LISTEN}: {e}")
+    if scheduler is not None:
+        # 定时任务始终保留，运行中填写或清空 textfile 即可开始或停止写文件
+        def _export():
+            path = settings.metrics.textfile
+            if path:
+                try:
+                    write_textfile(path)
+                except OSError as e:
+                    logger.warning(f"写入指标文件 {path} 失败: {e}")
+            scheduler.schedule('metrics_textfile', settings.metrics.textfile_interval, _export)
+        scheduler.schedule('metrics_textfile', 0, _export)
+        if settings.metrics.textfile:
+            logger.info(f"指标将每 {settings.metrics.textfile_interval:.0f} 秒写入 {settings.metrics.textfile}")
+# --- 导出 --- END
@@ -1,212 +1,353 @@
-import requests
-import subprocess
-import platform
-import configparser
-import urllib.parse
+import base64
+import collections
+import enum
+import json
 import re
-import os
-import sys
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
 from logger_config import logger
+from settings import settings
+import metrics
+from iface_utils import campus_interfaces, get_interfaces, pick_campus_address
+import probe_utils
 
-# --- Determine base path and config path (Windows Only) ---
-if getattr(sys, 'frozen', False):
-    base_path = os.path.dirname(sys.executable)
-else:
-    base_path = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_path, 'config.ini')
-# --- Determine base path and config path --- END
-
-config = configparser.ConfigParser()
-if not config.read(config_path, encoding='utf-8'):
-    logger.critical(f"错误：无法找到或读取配置文件 {config_path}") # Use critical
-    sys.exit(f"配置文件未找到: {config_path}")
-
-# --- Configuration Loading ---
-LOGIN_URL = config.get('Network', 'login_url')
-CHECK_URL = config.get('Network', 'check_url')
-USERNAME = config.get('Credentials', 'username')
-PASSWORD = config.get('Credentials', 'password')
-logger.info("配置加载完成。")
-# --- Configuration Loading End ---
-
-def check_internet_connection(url=CHECK_URL, timeout=5):
-    """通过访问指定URL检查网络连接 (Windows)。"""
-    logger.info(f"开始检查网络连接 -> {url}")
+
+_iface_executor = None
+
+
+def monitored_interfaces():
+    """需要逐个探测的校园网接口 (已启用)；[Network] per_interface 为 auto 时只有多个接口才逐个探测。"""
+    mode = settings.network.per_interface
+    if mode == 'false':
+        return []
+    interfaces = [i for i in campus_interfaces() if i.up]
+    return interfaces if len(interfaces) > 1 or (mode == 'true' and interfaces) else []
+
+
+def probe_interfaces(interfaces, probes=None, timeout=None):
+    """从每个接口的地址分别发出探测，各接口并行，返回 {地址: (接口名, ProbeReport)}。"""
+    global _iface_executor
+    if _iface_executor is None:
+        _iface_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='snaf-iface')
+    futures = {i.address: (i.name, _iface_executor.submit(probe_utils.run_probes, probes, timeout=timeout,
+                                                           source=i.address))
+               for i in interfaces}
+    return {address: (name, future.result()) for address, (name, future) in futures.items()}
+
+
+def _combine(reports, elapsed):
+    """合并逐接口的探测结果：任一接口在线即判定在线 (流量可以由该接口承载)。"""
+    online = any(report.online for _, report in reports.values())
+    results = [result for _, report in reports.values() for result in report.results]
+    for address, (name, report) in reports.items():
+        logger.info(f"接口 {name} ({address}): {'正常' if report.online else '不通'}")
+    return probe_utils.ProbeReport(online, results, elapsed, reports)
+
+
+def probe_network(probes=None, timeout=None):
+    """并行执行多个轻量探测检查网络连接，达到法定数即返回完整的 ProbeReport (供断网诊断使用)。
+
+    多网卡主机上逐个校园网接口绑定源地址探测，report.interfaces 给出每个接口的结果。
+    """
+    targets = probes if probes is not None else probe_utils.PROBES
+    logger.info(f"开始检查网络连接 -> {len(targets)} 个探测目标 (法定数 {settings.network.probe_quorum})")
     try:
-        response = requests.get(url, timeout=timeout)
-        if response.status_code == 200:
-            logger.info(f"网络连接正常，成功访问 {url}")
-            return True
+        interfaces = monitored_interfaces()
+        if interfaces:
+            start = time.perf_counter()
+            report = _combine(probe_interfaces(interfaces, targets, timeout), time.perf_counter() - start)
         else:
-            logger.warning(f"访问 {url} 状态码异常: {response.status_code}")
-            return False
-    except requests.ConnectionError:
-        logger.warning(f"无法连接到 {url}，网络可能未连接。")
-        return False
-    except requests.Timeout:
-        logger.warning(f"访问 {url} 超时。")
-        return False
+            report = probe_utils.run_probes(targets, timeout=timeout)
     except Exception as e:
         logger.error(f"检查网络连接时发生未知错误: {e}", exc_info=True)
-        return False
+        return probe_utils.ProbeReport(False, [], 0.0)
+
+    succeeded = sum(1 for r in report.results if r.ok)
+    metrics.check_results.inc(result='online' if report.online else 'offline')
+    if report.online:
+        logger.info(f"网络连接正常，{succeeded}/{len(targets)} 个探测成功 (耗时 {report.elapsed * 1000:.0f} ms)")
+        return report
+    failed = [f"{r.probe.kind}={r.probe.target} ({r.detail})" for r in report.results if not r.ok]
+    logger.warning(f"网络连接检查未通过，{succeeded}/{len(targets)} 个探测成功。失败: {'; '.join(failed) or '无结果 (超时)'}")
+    return report
+
+def check_internet_connection(probes=None, timeout=None):
+    """检查网络连接，在线返回 True。"""
+    return probe_network(probes, timeout).online
 
 def get_ip_address():
-    """获取 Windows ipconfig 命令的完整输出。"""
-    logger.debug("准备执行 'ipconfig' 获取网络信息...")
-    output = None
-    cmd = ['ipconfig']
-    encoding = 'gbk' # Windows 命令行通常使用 GBK
+    """从缓存的本机接口表中选出校园网 IPv4 地址 (172.30.x.x)，找不到返回 None。"""
+    user_ip = pick_campus_address()
+    if user_ip is None:
+        # 缓存可能已过时 (例如刚获取到 DHCP 地址)，强制刷新一次再判断
+        logger.debug("接口缓存中未找到校园网地址，强制刷新接口表...")
+        get_interfaces(refresh=True)
+        user_ip = pick_campus_address()
+    return user_ip
+
+class PortalCode(enum.Enum):
+    """ePortal 操作的结果代码，同时用作 snaf_login_total 指标的 code 标签。"""
+    SUCCESS = 'success'                  # 认证/注销成功
+    ALREADY_ONLINE = 'already_online'    # 设备已经在线，无需再次认证
+    BAD_CREDENTIALS = 'bad_credentials'  # 账号或密码错误
+    REJECTED = 'rejected'                # 服务器拒绝，原因见 message
+    NO_IP = 'no_ip'                      # 本机没有校园网地址
+    HTTP_ERROR = 'http_error'            # 非 200 响应 (如 502)
+    TIMEOUT = 'timeout'
+    NETWORK_ERROR = 'network_error'
+    BAD_RESPONSE = 'bad_response'        # 响应无法解析
+    ERROR = 'error'                      # 其他未知错误
 
+
+class PortalResult(collections.namedtuple('PortalResult', ['code', 'message', 'user_ip', 'data'])):
+    """登录/注销的结构化结果。data 为服务器返回的 JSON 对象 (无法解析时为 None)。"""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.code in (PortalCode.SUCCESS, PortalCode.ALREADY_ONLINE)
+
+
+# online: True/False 为网关给出的明确答复，None 表示查询失败 (原因见 message)
+PortalStatus = collections.namedtuple('PortalStatus', ['online', 'user_ip', 'account', 'message'])
+
+_JSONP = re.compile(r'^\s*[\w$.]+\((.*)\)\s*;?\s*$', re.S)
+
+# 失败消息中的关键字 -> 结果代码；Dr.COM 有时把英文原因 base64 编码后放在 msg 中
+_FAILURE_MESSAGES = (
+    ('已经在线', PortalCode.ALREADY_ONLINE),
+    ('已在线', PortalCode.ALREADY_ONLINE),
+    ('ldap auth error', PortalCode.BAD_CREDENTIALS),
+    ('userid error', PortalCode.BAD_CREDENTIALS),
+    ('密码错误', PortalCode.BAD_CREDENTIALS),
+    ('账号不存在', PortalCode.BAD_CREDENTIALS),
+)
+_RET_CODES = {2: PortalCode.ALREADY_ONLINE}
+
+
+def parse_jsonp(text):
+    """解析 dr1003({...}) 形式的 JSONP 响应 (也接受纯 JSON)，格式不符时抛出 ValueError。"""
+    match = _JSONP.match(text)
+    payload = json.loads(match.group(1) if match else text)
+    if not isinstance(payload, dict):
+        raise ValueError("响应不是 JSON 对象")
+    return payload
+
+
+def _decode_message(message):
+    """尝试还原 base64 编码的英文消息，不是 base64 时原样返回。"""
+    if not message or not re.fullmatch(r'[A-Za-z0-9+/]+={0,2}', message) or len(message) % 4:
+        return message
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding=encoding, check=True, creationflags=subprocess.CREATE_NO_WINDOW) # Hide console window
-        output = result.stdout
-        logger.debug(f"成功获取 'ipconfig' 输出。")
-    except FileNotFoundError:
-        logger.error(f"'{cmd[0]}' 命令未找到，请确保 ipconfig 在系统 PATH 中。")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"执行 '{cmd[0]}' 命令失败: {e}")
-    except Exception as e:
-        logger.error(f"获取ipconfig输出时发生未知错误: {e}", exc_info=True)
+        decoded = base64.b64decode(message).decode('ascii')
+    except (ValueError, UnicodeDecodeError):
+        return message
+    return decoded if decoded.isprintable() else message
+
+
+def classify_response(payload):
+    """把 Portal 的 JSON 答复映射为 (结果代码, 可读消息)。"""
+    message = _decode_message(str(payload.get('msg', '')))
+    if str(payload.get('result')) == '1':
+        return PortalCode.SUCCESS, message or '成功'
+    try:
+        ret_code = int(payload.get('ret_code'))
+    except (TypeError, ValueError):
+        ret_code = None
+    if ret_code in _RET_CODES:
+        return _RET_CODES[ret_code], message
+    for keyword, code in _FAILURE_MESSAGES:
+        if keyword in message:
+            return code, message
+    return PortalCode.REJECTED, message or f"result={payload.get('result')}"
+
+
+class EPortalClient:
+    """Dr.COM ePortal 协议客户端：登录、注销和在线状态查询。
+
+    请求参数模板在构造时按账号预先生成，每次操作只填入本机 IP；登录/注销复用 Portal 连接池，
+    状态查询走探测后端 (精简模式下不需要 requests)，可以作为局域网内的低成本在线探测。
+    """
+
+    CALLBACK = 'dr1003'         # 登录/注销的 JSONP 回调名
+    STATUS_CALLBACK = 'dr1002'  # chkstatus 的 JSONP 回调名
+    LOGIN_TIMEOUT = 15
+
+    def __init__(self, username, password, login_url, status_url='', ac_ip='', js_version='4.1.3'):
+        self.username = username
+        self.login_url = login_url
+        self.logout_url = login_url.rsplit('/', 1)[0] + '/logout'
+        portal = urlsplit(login_url)
+        # 状态查询在网关的 80 端口: http://<网关>/drcom/chkstatus
+        self.status_url = status_url or f"{portal.scheme}://{portal.hostname}/drcom/chkstatus"
+        self.headers = {
+            "Accept": "*/*",
+            "Accept-Encoding": "gzip, deflate",
+            "Accept-Language": "zh-CN,zh;q=0.9",
+            "Cache-Control": "no-cache",
+            "Pragma": "no-cache",
+            "Referer": f"{portal.scheme}://{portal.hostname}/",
+        }
+        common = {
+            'callback': self.CALLBACK,
+            'login_method': '1',
+            'wlan_user_ipv6': '',
+            'wlan_user_mac': '000000000000',
+            'wlan_ac_ip': ac_ip,
+            'wlan_ac_name': '',
+            'jsVersion': js_version,
+            'lang': 'zh-cn',
+            'v': '795',
+        }
+        self._login_template = dict(common, user_account=f",1,{username}", user_password=password, terminal_type='2')
+        self._logout_template = dict(common, user_account='drcom', user_password='123', ac_logout='1',
+                                     register_mode='1', wlan_vlan_id='0')
+        self._status_query = urlencode({'callback': self.STATUS_CALLBACK, 'jsVersion': js_version, 'lang': 'zh'})
+
+    def _call(self, url, template, user_ip, timeout, source=None):
+        params = dict(template, wlan_user_ip=user_ip)
+        if source:
+            return self._call_bound(url, params, user_ip, timeout, source)
+        import requests
+        from session_utils import PORTAL_POOL, get_session
+        try:
+            response = get_session(PORTAL_POOL).request('GET', url, params=params, headers=self.headers, timeout=timeout)
+        except requests.exceptions.Timeout:
+            return PortalResult(PortalCode.TIMEOUT, f"请求超时 ({url})", user_ip, None)
+        except requests.exceptions.RequestException as e:
+            return PortalResult(PortalCode.NETWORK_ERROR, f"{type(e).__name__}: {e}", user_ip, None)
+        logger.debug("最终请求 URL: %s", response.request.url)
+        logger.debug("原始响应内容 (HTTP %s):\n%s", response.status_code, response.text)
+        if response.status_code != 200:
+            return PortalResult(PortalCode.HTTP_ERROR, f"HTTP {response.status_code} {response.reason}", user_ip, None)
+        return self._result(response.text, user_ip)
+
+    def _call_bound(self, url, params, user_ip, timeout, source):
+        """从 source 地址发出请求 (多网卡主机上保证登录请求走被认证的接口)。"""
+        try:
+            status, body = probe_utils.http_fetch('GET', f"{url}?{urlencode(params)}", timeout, source=source)
+        except socket.timeout:
+            return PortalResult(PortalCode.TIMEOUT, f"请求超时 ({url}，源地址 {source})", user_ip, None)
+        except OSError as e:
+            return PortalResult(PortalCode.NETWORK_ERROR, f"{type(e).__name__}: {e}", user_ip, None)
+        if status != 200:
+            return PortalResult(PortalCode.HTTP_ERROR, f"HTTP {status}", user_ip, None)
+        return self._result(body.decode('utf-8', errors='replace'), user_ip)
+
+    @staticmethod
+    def _result(text, user_ip):
+        try:
+            payload = parse_jsonp(text)
+        except ValueError:
+            return PortalResult(PortalCode.BAD_RESPONSE, f"无法解析的响应: {text[:200]}", user_ip, None)
+        code, message = classify_response(payload)
+        return PortalResult(code, message, user_ip, payload)
+
+    def login(self, user_ip, timeout=LOGIN_TIMEOUT, source=None):
+        """以本账号为 user_ip 认证，返回 PortalResult。source 指定从本机哪个地址发出请求。"""
+        return self._call(self.login_url, self._login_template, user_ip, timeout, source)
+
+    def logout(self, user_ip, timeout=LOGIN_TIMEOUT, source=None):
+        """注销 user_ip 的在线会话，返回 PortalResult。"""
+        return self._call(self.logout_url, self._logout_template, user_ip, timeout, source)
+
+    def status(self, timeout=3, url=None, source=None, user_ip=None):
+        """查询网关上本机的认证状态 (drcom chkstatus)，返回 PortalStatus，不抛出网络异常。
+
+        网关按请求的来源地址判断，source 指定从本机的哪个地址发出查询 (多地址主机)；
+        user_ip 查询其他地址 (下游机器) 的状态，不支持的网关会忽略它并答复请求来源的状态 (见 PortalStatus.user_ip)。
+        """
+        url = url or self.status_url
+        query = self._status_query if user_ip is None else f"{self._status_query}&{urlencode({'wlan_user_ip': user_ip})}"
+        try:
+            status, body = probe_utils.http_fetch('GET', f"{url}?{query}", timeout, source=source)
+        except OSError as e:
+            return PortalStatus(None, None, None, f"{type(e).__name__}: {e}")
+        if status != 200:
+            return PortalStatus(None, None, None, f"HTTP {status}")
+        try:
+            payload = parse_jsonp(body.decode('utf-8', errors='replace'))
+        except ValueError:
+            return PortalStatus(None, None, None, "无法解析的状态响应")
+        online = str(payload.get('result')) == '1'
+        user_ip = payload.get('v46ip') or payload.get('v4ip') or None
+        account = payload.get('uid') or None
+        return PortalStatus(online, user_ip, account, f"已认证 ({account or '未知账号'})" if online else "未认证")
 
-    if output is None:
-        logger.error("未能获取到 ipconfig 命令输出。")
 
-    return output
+_client = None
+_client_key = None
 
-def login_to_network():
-    """执行校园网登录 (Windows 专用)，成功返回 user_ip，失败返回 None。"""
+
+def get_portal_client():
+    """返回按当前配置构造的 Portal 客户端；账号或 Portal 配置热加载后自动重建。"""
+    global _client, _client_key
+    network = settings.network
+    key = (settings.credentials.username, settings.credentials.password, network.login_url,
+           network.status_url, network.portal_ac_ip, network.portal_js_version)
+    if key != _client_key:
+        _client = EPortalClient(*key)
+        _client_key = key
+    return _client
+
+
+def login_to_network(relogin=False, user_ip=None):
+    """执行校园网登录，返回 PortalResult；result.ok 为真 (成功或设备已在线) 时 result.user_ip 为本机 IP。
+
+    relogin=True 时先注销当前会话再重新认证，用于在预测的会话过期前主动续期。
+    指定 user_ip (多网卡主机上某个接口的地址) 时为该地址认证，请求也从该地址发出。
+    """
+    start = time.perf_counter()
+    result = _login_to_network(relogin, user_ip)
+    metrics.login_latency.observe(time.perf_counter() - start)
+    metrics.login_results.inc(code=result.code.value)
+    return result
+
+def _login_to_network(relogin=False, source=None):
+    """登录流程本体，返回 PortalResult。"""
     logger.info("==================== 开始尝试校园网登录 ====================")
 
-    # 1. 获取 ipconfig 输出
+    # 1. 从本机接口表获取校园网 IP 地址 (172.30.x.x)
     logger.info("步骤 1: 获取本地 IP 地址...")
-    user_ip_output = get_ip_address()
-    if not user_ip_output:
-        logger.error("无法获取 ipconfig 输出，登录中止。")
-        return None # Return None on failure
-    logger.debug(f"获取到的 ipconfig 原始输出:\n{user_ip_output}")
-
-    # 2. 从 ipconfig 输出中解析校园网 IP 地址 (172.30.x.x)
-    user_ip = None
     try:
-        logger.debug("正在解析 Windows ipconfig 输出...")
-        lines = user_ip_output.split('\n')
-        for i, line in enumerate(lines):
-            if "IPv4 地址" in line or "IPv4 Address" in line:
-                ip_line = line.strip()
-                found_ip = ip_line.split(':')[-1].strip()
-                if found_ip and found_ip.startswith('172.30.'):
-                    user_ip = found_ip
-                    logger.info(f"步骤 1 完成: 成功解析到校园网 IP 地址 -> {user_ip}")
-                    break
-                elif found_ip and not found_ip.startswith('169.254'):
-                    logger.debug(f"找到非 172.30. 的 IP 地址: {found_ip} (已忽略)")
-                else:
-                    logger.debug(f"忽略无效或APIPA IP: {found_ip}")
-
-        if not user_ip:
-            logger.error("步骤 1 失败: 未能在 ipconfig 输出中找到 172.30.x.x 格式的校园网 IPv4 地址。")
-            return None # Return None on failure
-
+        user_ip = source or get_ip_address()
     except Exception as e:
-        logger.error(f"解析 IP 地址时出错: {e}", exc_info=True)
-        return None # Return None on failure
-
-    # 3. 准备登录参数
-    logger.info("步骤 2: 准备登录参数...")
-    formatted_username = f",1,{USERNAME}" # 根据观察到的格式
-    logger.debug(f"使用账号: {formatted_username}, IP: {user_ip}")
-
-    params = {
-        'callback': 'dr1003',
-        'login_method': '1',
-        'user_account': formatted_username,
-        'user_password': PASSWORD,
-        'wlan_user_ip': user_ip,
-        'wlan_user_ipv6': '',
-        'wlan_user_mac': '000000000000',
-        'wlan_ac_ip': '172.30.255.41', # 通常固定
-        'wlan_ac_name': '',
-        'jsVersion': '4.1.3',
-        'terminal_type': '2',
-        'lang': 'zh-cn',
-        'v': '795',
-    }
-    logger.debug(f"请求参数 (params): {params}")
-
-    headers = {
-        "Accept": "*/*",
-        "Accept-Encoding": "gzip, deflate",
-        "Accept-Language": "zh-CN,zh;q=0.9", # Simplified a bit
-        "Cache-Control": "no-cache",
-        "Pragma": "no-cache",
-        "Referer": "http://172.30.255.42/" # Assuming this is the portal page
-    }
-    logger.debug(f"请求头 (headers): {headers}")
-    logger.info("步骤 2 完成: 登录参数准备完毕。")
-
-    # 4. 发送登录请求
-    logger.info(f"步骤 3: 发送登录请求 -> {LOGIN_URL}")
-    try:
-        req = requests.Request('GET', LOGIN_URL, params=params, headers=headers)
-        prepared_req = req.prepare()
-        final_url = prepared_req.url
-        logger.debug(f"最终请求 URL: {final_url}")
+        logger.error(f"获取 IP 地址时出错: {e}", exc_info=True)
+        return PortalResult(PortalCode.ERROR, str(e), None, None)
+    if not user_ip:
+        logger.error(f"步骤 1 失败: 未能在本机网络接口中找到 {settings.network.campus_prefix}x.x 格式的校园网 IPv4 地址。")
+        return PortalResult(PortalCode.NO_IP, "未找到校园网地址", None, None)
+    logger.info(f"步骤 1 完成: 成功获取校园网 IP 地址 -> {user_ip}")
 
-        response = requests.get(LOGIN_URL, params=params, headers=headers, timeout=15)
+    client = get_portal_client()
+    # 2. 主动续期时先注销旧会话
+    if relogin:
+        logger.info("步骤 2: 注销当前会话以便重新认证...")
+        result = client.logout(user_ip, source=source)
+        logger.info(f"步骤 2 完成: 注销结果 {result.code.value} ({result.message})")
+    else:
+        logger.info(f"步骤 2: 使用账号 {client.username} 的登录模板。")
 
-        logger.info(f"收到响应状态码: {response.status_code}")
-        logger.debug(f"原始响应内容:\n{response.text}")
-
-        response_text = response.text
-        if response.status_code == 200 and '"result":1' in response_text and ('Portal协议认证成功' in response_text or '认证成功' in response_text):
-            logger.info("步骤 3 成功: 校园网登录成功！")
-            logger.info("==================== 校园网登录流程结束 ====================")
-            return user_ip # Return user_ip on success
-        else:
-            error_msg = "未知错误或无法解析响应"
-            try:
-                # Try parsing JSONP style response first
-                if response_text.startswith('dr1003(') and response_text.endswith(')'):
-                    json_str = response_text[len('dr1003('):-1]
-                    import json
-                    result_json = json.loads(json_str)
-                    error_msg = result_json.get('msg', f"Result: {result_json.get('result', '?')}")
-                # Then check specific messages for already online
-                elif '已经在线' in response_text:
-                    error_msg = "设备已经在线"
-                    logger.warning(f"步骤 3 注意: {error_msg} (IP: {user_ip})，视为部分成功。")
-                    logger.info("==================== 校园网登录流程结束 ====================")
-                    return user_ip # Also return IP if already online
-                elif response.status_code != 200:
-                    error_msg = f"HTTP {response.status_code} {response.reason}"
-
-            except Exception as parse_err:
-                logger.warning(f"解析登录响应时发生异常: {parse_err}", exc_info=True)
-
-            logger.error(f"步骤 3 失败: 校园网登录失败。服务器响应: {error_msg}")
-            if response.status_code == 502:
-                logger.error("提示: 收到 502 Bad Gateway 错误，通常表示网关服务器问题。请检查 IP 是否正确或稍后再试。")
-            logger.info("==================== 校园网登录流程结束 ====================")
-            return None # Return None on failure
-
-    except requests.exceptions.Timeout:
-        logger.error(f"步骤 3 失败: 登录请求超时 ({LOGIN_URL})。请检查网络或目标服务器状态。")
-        logger.info("==================== 校园网登录流程结束 ====================")
-        return None # Return None on failure
-    except requests.exceptions.RequestException as e:
-        logger.error(f"步骤 3 失败: 登录请求时发生网络错误: {e}", exc_info=True)
-        logger.info("==================== 校园网登录流程结束 ====================")
-        return None # Return None on failure
+    # 3. 发送登录请求
+    logger.info(f"步骤 3: 发送登录请求 -> {client.login_url}")
+    try:
+        result = client.login(user_ip, source=source)
     except Exception as e:
         logger.error(f"步骤 3 失败: 登录过程中发生未知错误: {e}", exc_info=True)
         logger.info("==================== 校园网登录流程结束 ====================")
-        return None # Return None on failure
-
-# Remove the __main__ test block for production
-# if __name__ == '__main__':
-#     logger.info("开始测试网络工具...")
-#     if check_internet_connection():
-#         logger.info("网络连接测试通过")
-#     else:
-#         logger.warning("网络连接测试失败，尝试登录...")
-#         login_to_network() 
\ No newline at end of file
+        return PortalResult(PortalCode.ERROR, str(e), user_ip, None)
+
+    if result.code is PortalCode.SUCCESS:
+        logger.info(f"步骤 3 成功: 校园网登录成功！({result.message})")
+    elif result.code is PortalCode.ALREADY_ONLINE:
+        logger.warning(f"步骤 3 注意: 设备已经在线 (IP: {user_ip})，视为成功。服务器消息: {result.message}")
+    else:
+        logger.error(f"步骤 3 失败: 校园网登录失败 [{result.code.value}]。服务器响应: {result.message}")
+        if result.code is PortalCode.BAD_CREDENTIALS:
+            logger.error("提示: 账号或密码错误，请检查 config.ini 中 [Credentials] 的 username 和 password。")
+        elif result.code is PortalCode.HTTP_ERROR and result.message.startswith('HTTP 502'):
+            logger.error("提示: 收到 502 Bad Gateway 错误，通常表示网关服务器问题。请检查 IP 是否正确或稍后再试。")
+    logger.info("==================== 校园网登录流程结束 ====================")
+    return result
@@ -0,0 +1,202 @@
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from logger_config import logger
+from settings import settings
+from email_utils import send_notifications
+
+# --- Outbox Configuration Loading ---
+SPOOL_DIR = settings.email.spool_dir  # 修改后需重启 (RESTART_KEYS)
+# 重试间隔 ([Email] retry_base / retry_max) 和合并窗口 ([Email] coalesce_window) 每次使用时读取，热加载后立即生效
+DIGEST_MAX_EVENTS = 50
+BATCH_MAX_MAILS = 10  # 积压较多时每次在同一个 SMTP 会话中最多发送的汇总邮件数
+DIGEST_LABELS = {'user_ip': '当前IP', 'disconnect_time': '断开时间', 'reconnect_time': '重连时间'}
+# --- Outbox Configuration Loading End ---
+
+
+class Outbox:
+    """异步通知发件箱。
+
+    事件先写入磁盘上的 spool 目录再返回，调用方从不等待 SMTP；后台线程在网络可用时发送，
+    失败后按指数退避 (带抖动) 重试。多条待发事件合并成一封汇总邮件；积压超过一封汇总的容量时，
+    拆成多封汇总在同一个 SMTP 会话中批量发送。
+    断网期间产生的事件保存在磁盘上，进程重启后也不会丢失。
+    """
+
+    def __init__(self, spool_dir=SPOOL_DIR, sender=send_notifications,
+                 retry_base=None, retry_max=None, coalesce_window=None):
+        self.spool_dir = spool_dir
+        self.sender = sender  # sender([(subject, body, kwargs), ...]) -> bool，一次发送一批邮件
+        # 显式传入的值固定不变 (测试、基准)；为 None 时使用 config.ini 中的当前值
+        self._retry_base = retry_base
+        self._retry_max = retry_max
+        self._coalesce_window = coalesce_window
+        self._cond = threading.Condition()
+        self._counter = itertools.count()
+        self._online = False
+        self._failures = 0
+        self._next_attempt = 0.0
+        self._stopped = False
+        self._thread = None
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    @property
+    def retry_base(self):
+        """首次重试等待 (秒)。"""
+        return settings.email.retry_base if self._retry_base is None else self._retry_base
+
+    @property
+    def retry_max(self):
+        """重试等待上限 (秒)。"""
+        return settings.email.retry_max if self._retry_max is None else self._retry_max
+
+    @property
+    def coalesce_window(self):
+        """收到第一条事件后再等待的秒数，让同一次网络抖动产生的事件合并成一封汇总邮件。"""
+        return settings.email.coalesce_window if self._coalesce_window is None else self._coalesce_window
+
+    # --- 对外接口 --- START
+    def enqueue(self, subject, body, **kwargs):
+        """把一条通知写入 spool 并立即返回。kwargs 与 send_notification_email 的参数相同。"""
+        event = {
+            'subject': subject,
+            'body': body,
+            'kwargs': kwargs,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        name = f"{time.time_ns()}-{next(self._counter):04d}.json"
+        path = os.path.join(self.spool_dir, name)
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(event, f, ensure_ascii=False)
+            os.replace(tmp_path, path)  # 原子替换，避免崩溃时留下半个文件
+        except OSError as e:
+            logger.error(f"写入通知 spool 失败，事件丢失: {subject} ({e})")
+            return False
+        logger.info(f"通知已加入发件箱: {subject}")
+        with self._cond:
+            self._cond.notify()
+        return True
+
+    def set_online(self, online):
+        """更新网络状态提示。网络恢复时立即重置退避并唤醒发送线程。"""
+        with self._cond:
+            if online and not self._online:
+                self._failures = 0
+                self._next_attempt = 0.0
+            self._online = online
+            self._cond.notify()
+
+    def pending_count(self):
+        return len(self._spooled())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='snaf-outbox', daemon=True)
+        self._thread.start()
+        pending = self.pending_count()
+        if pending:
+            logger.info(f"发件箱中有 {pending} 条未发送的通知，将在网络可用时发送。")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+    # --- 对外接口 --- END
+
+    # --- 内部实现 --- START
+    def _spooled(self):
+        try:
+            names = [n for n in os.listdir(self.spool_dir) if n.endswith('.json')]
+        except OSError:
+            return []
+        return sorted(os.path.join(self.spool_dir, n) for n in names)
+
+    def _load(self, paths):
+        events = []
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    events.append((path, json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.error(f"无法读取通知 spool 文件 {path}，已丢弃: {e}")
+                self._remove([path])
+        return events
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _wait_timeout(self):
+        """计算发送线程需要等待多久；返回 0 表示现在就可以发送。调用者需持有锁。"""
+        paths = self._spooled()
+        if not paths or not self._online:
+            return None  # 等待新事件或网络恢复
+        now = time.time()
+        if now < self._next_attempt:
+            return self._next_attempt - now
+        oldest = int(os.path.basename(paths[0]).split('-')[0]) / 1e9
+        return max(0.0, oldest + self.coalesce_window - now)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    timeout = self._wait_timeout()
+                    if timeout == 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+            self._flush()
+
+    def _flush(self):
+        events = self._load(self._spooled()[:DIGEST_MAX_EVENTS * BATCH_MAX_MAILS])
+        if not events:
+            return
+        if len(events) == 1:
+            event = events[0][1]
+            batch = [(event['subject'], event['body'], event.get('kwargs', {}))]
+        else:
+            batch = []
+            for i in range(0, len(events), DIGEST_MAX_EVENTS):
+                digest = [e for _, e in events[i:i + DIGEST_MAX_EVENTS]]
+                subject, body = build_digest(digest)
+                # 汇总中只要有一条断网/失败事件，就附带一份诊断包
+                diagnostics = any(e.get('kwargs', {}).get('diagnostics') for e in digest)
+                batch.append((subject, body, {'diagnostics': diagnostics}))
+        ok = self.sender(batch)
+        with self._cond:
+            if ok:
+                self._failures = 0
+                self._next_attempt = 0.0
+            else:
+                self._failures += 1
+                delay = min(self.retry_max, self.retry_base * 2 ** (self._failures - 1))
+                delay *= random.uniform(0.8, 1.2)
+                self._next_attempt = time.time() + delay
+                logger.warning(f"发件箱发送失败 (连续 {self._failures} 次)，{delay:.0f} 秒后重试。")
+        if ok:
+            self._remove([path for path, _ in events])
+            logger.info(f"发件箱已发送 {len(events)} 条通知 ({len(batch)} 封邮件)。")
+    # --- 内部实现 --- END
+
+
+def build_digest(events):
+    """把多条事件合并为一封汇总邮件，返回 (subject, body)。"""
+    subject = f"校园网通知汇总: {len(events)} 条事件"
+    lines = [f"以下是期间累计的 {len(events)} 条网络事件 (按时间顺序):", ""]
+    for event in events:
+        lines.append(f"[{event.get('created', '?')}] {event['subject']}")
+        lines.append(f"    {event['body']}")
+        for key, value in event.get('kwargs', {}).items():
+            if value and key in DIGEST_LABELS:
+                lines.append(f"    - {DIGEST_LABELS.get(key, key)}: {value}")
+    return subject, '\n'.join(lines)
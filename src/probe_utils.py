@@ -0,0 +1,288 @@
+import collections
+import logging
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from logger_config import logger
+from settings import DEFAULT_PROBES, settings
+import metrics
+import dns_cache
+
+# HTTP 层探测才能区分 "真正联网" 与 "被 Portal 劫持"，判定在线时至少要有一个成功
+HTTP_KINDS = ('http204', 'head', 'get')
+# 到达外网的探测：判定在线时至少要有一个成功，否则网关正常而学校出口故障时会被误判为在线
+EXTERNAL_KINDS = HTTP_KINDS + ('tcp',)
+# 认证网关的在线状态查询只能排除 "被劫持"：与外网 TCP 探测一起成功时可以代替外网 HTTP 探测，但不能单独满足要求
+AUTHORITATIVE_KINDS = HTTP_KINDS + ('portal',)
+
+Probe = collections.namedtuple('Probe', ['kind', 'target'])
+ProbeResult = collections.namedtuple('ProbeResult', ['probe', 'ok', 'latency', 'detail'])
+# interfaces: 逐接口探测时为 {源地址: (接口名, ProbeReport)}，否则为 None (Windows 上接口名可能都是 '?'，只有地址唯一)
+ProbeReport = collections.namedtuple('ProbeReport', ['online', 'results', 'elapsed', 'interfaces'], defaults=(None,))
+
+# 探测线程池在进程内共享，避免每次检查都创建线程
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='snaf-probe')
+
+
+def parse_probes(spec):
+    """解析 'kind=target, kind=target' 格式的探测配置。
+
+    支持的 kind: http204 (期望 204 空响应), head (HEAD 请求 2xx), get (完整 GET 200),
+    tcp (host:port 建立 TCP 连接), dns (解析主机名),
+    portal (查询认证网关的在线状态，target 为状态查询 URL 或 auto)。
+    """
+    probes = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        kind, sep, target = item.partition('=')
+        kind = kind.strip().lower()
+        target = target.strip()
+        if not sep or not target or kind not in AUTHORITATIVE_KINDS + ('tcp', 'dns'):
+            logger.warning(f"忽略无法识别的探测配置: '{item}'")
+            continue
+        probes.append(Probe(kind, target))
+    return probes
+
+
+def load_probes():
+    """按当前配置 ([Network] probes) 生成探测集合，没有有效目标时使用默认集合。"""
+    probes = parse_probes(settings.network.probes)
+    if not probes:
+        logger.warning("未配置有效的探测目标，使用默认探测集合。")
+        probes = parse_probes(DEFAULT_PROBES)
+    return probes
+
+
+# 当前探测集合；配置热加载时整体替换，使用方应通过 probe_utils.PROBES 读取
+PROBES = load_probes()
+
+
+def _on_config_change(changed):
+    global PROBES
+    if ('Network', 'probes') in changed:
+        PROBES = load_probes()
+        logger.info(f"探测目标已更新: {', '.join(f'{p.kind}={p.target}' for p in PROBES)}")
+
+
+settings.add_listener(_on_config_change)
+
+
+# --- HTTP 后端 --- START
+# requests: 复用 session_utils 的长连接池 (默认)；
+# stdlib: 只用 http.client，进程完全不需要加载 requests/urllib3/charset_normalizer，适合低配机器的精简模式。
+# stdlib 后端不跟随重定向 (对探测而言更严格：被 Portal 劫持的 302 直接判定失败)。
+_idle_connections = {}  # (scheme, host, port, 源地址) -> 空闲的 http.client 连接
+_idle_lock = threading.Lock()
+
+
+def _requests_fetch(method, url, timeout, allow_redirects):
+    from session_utils import PROBE_POOL, get_session
+    response = get_session(PROBE_POOL).request(method, url, timeout=timeout, allow_redirects=allow_redirects)
+    return response.status_code, response.content
+
+
+_connection_classes = None
+
+
+def _stdlib_connection_class(scheme):
+    """返回主机名经进程内 DNS 缓存解析的 http.client 连接类 (首次使用时才导入 http.client)。"""
+    global _connection_classes
+    if _connection_classes is None:
+        import http.client
+
+        class CachedDNSHTTPConnection(http.client.HTTPConnection):
+            def connect(self):
+                self.sock = dns_cache.create_connection((self.host, self.port), self.timeout, self.source_address)
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        class CachedDNSHTTPSConnection(http.client.HTTPSConnection, CachedDNSHTTPConnection):
+            """HTTPSConnection.connect() 经 super() 调用上面的 connect() 建立 TCP 连接，再按主机名做 TLS 握手。"""
+
+        _connection_classes = {'http': CachedDNSHTTPConnection, 'https': CachedDNSHTTPSConnection}
+    return _connection_classes[scheme]
+
+
+def _stdlib_fetch(method, url, timeout, source=None):
+    import http.client
+    from urllib.parse import urlsplit
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port, source)
+    path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    with _idle_lock:
+        conn = _idle_connections.pop(key, None)
+    reused = conn is not None
+    while True:
+        if conn is None:
+            conn_cls = _stdlib_connection_class('https' if parts.scheme == 'https' else 'http')
+            conn = conn_cls(parts.hostname, parts.port, timeout=timeout,
+                            source_address=(source, 0) if source else None)
+        elif conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            conn.request(method, path, headers={'User-Agent': 'snaf-probe', 'Accept': '*/*'})
+            response = conn.getresponse()
+            body = response.read()  # 读完响应体才能复用连接
+            break
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            # 空闲连接已被服务器关闭，换新连接重试一次
+            conn, reused = None, False
+        except http.client.HTTPException as e:
+            conn.close()
+            raise ConnectionError(f"{type(e).__name__}: {e}") from e
+        except BaseException:
+            conn.close()
+            raise
+    if response.will_close:
+        conn.close()
+    else:
+        with _idle_lock:
+            stale = _idle_connections.pop(key, None)
+            _idle_connections[key] = conn
+        if stale is not None:
+            stale.close()
+    return response.status, body
+
+
+def http_fetch(method, url, timeout, allow_redirects=False, source=None):
+    """按 [Network] probe_backend 选择的后端发送请求，返回 (HTTP 状态码, 响应体 bytes)。
+
+    指定 source (本机 IPv4 地址) 时从该地址发出请求，总是使用 stdlib 后端。
+    """
+    if source or settings.network.probe_backend == 'stdlib':
+        return _stdlib_fetch(method, url, timeout, source)
+    return _requests_fetch(method, url, timeout, allow_redirects)
+
+
+def _is_timeout(error):
+    if isinstance(error, socket.timeout):
+        return True
+    # 只有 requests 已被加载时才可能抛出它的超时异常；其他线程可能正在导入，属性尚未就绪
+    timeout_type = getattr(sys.modules.get('requests'), 'Timeout', None)
+    return timeout_type is not None and isinstance(error, timeout_type)
+# --- HTTP 后端 --- END
+
+
+# --- 单个探测实现 --- START
+# source 为本机 IPv4 地址时探测流量从该地址发出 (多网卡主机逐个接口探测)，None 表示由默认路由决定
+def _probe_http204(target, timeout, source=None):
+    status, _ = http_fetch('GET', target, timeout, source=source)
+    return status == 204, f"HTTP {status}"
+
+def _probe_head(target, timeout, source=None):
+    status, _ = http_fetch('HEAD', target, timeout, source=source)
+    return 200 <= status < 300, f"HTTP {status}"
+
+def _probe_get(target, timeout, source=None):
+    status, _ = http_fetch('GET', target, timeout, allow_redirects=True, source=source)
+    return status == 200, f"HTTP {status}"
+
+def _probe_portal(target, timeout, source=None):
+    # 向局域网内的认证网关查询本机是否已认证，通常 1 ms 左右；target 为 auto 时使用 [Network] status_url
+    from network_utils import get_portal_client
+    status = get_portal_client().status(timeout=timeout, url=None if target == 'auto' else target, source=source)
+    if status.online is None:
+        raise ConnectionError(status.message)
+    return status.online, status.message
+
+def _probe_tcp(target, timeout, source=None):
+    host, _, port = target.rpartition(':')
+    with dns_cache.create_connection((host, int(port)), timeout=timeout,
+                                     source_address=(source, 0) if source else None):
+        pass
+    return True, "已连接"
+
+def _probe_dns(target, timeout, source=None):
+    # DNS 探测检验的是系统解析器本身，不经过进程内缓存 (dns_cache)；
+    # 系统解析器无法绑定源地址，source 被忽略；getaddrinfo 本身不支持超时，由 run_probes 的等待超时兜底
+    infos = socket.getaddrinfo(target, None, type=socket.SOCK_STREAM)
+    return bool(infos), infos[0][4][0] if infos else "无解析结果"
+
+_PROBE_FUNCS = {
+    'http204': _probe_http204,
+    'head': _probe_head,
+    'get': _probe_get,
+    'tcp': _probe_tcp,
+    'dns': _probe_dns,
+    'portal': _probe_portal,
+}
+# --- 单个探测实现 --- END
+
+
+def run_probe(probe, timeout=None, source=None):
+    """执行单个探测，返回 ProbeResult，任何异常都视为探测失败。source 为发出探测的本机地址。"""
+    timeout = settings.network.probe_timeout if timeout is None else timeout
+    start = time.perf_counter()
+    try:
+        ok, detail = _PROBE_FUNCS[probe.kind](probe.target, timeout, source)
+    except (OSError, ValueError) as e:
+        # requests 的异常都继承自 OSError；stdlib 后端把协议错误转换为 ConnectionError
+        ok, detail = False, "超时" if _is_timeout(e) else f"{type(e).__name__}: {e}"
+    latency = time.perf_counter() - start
+    metrics.probe_latency.observe(latency, kind=probe.kind, target=probe.target)
+    metrics.probe_results.inc(kind=probe.kind, target=probe.target, result='ok' if ok else 'fail')
+    return ProbeResult(probe, ok, latency, detail)
+
+
+def _authoritative(successes):
+    """成功的探测能否确认真正联网：外网 HTTP 探测成功，或网关确认已认证且外网 TCP 探测成功。"""
+    kinds = {r.probe.kind for r in successes}
+    if kinds & set(HTTP_KINDS):
+        return True
+    return 'portal' in kinds and bool(kinds & set(EXTERNAL_KINDS))
+
+
+def run_probes(probes=None, quorum=None, timeout=None, source=None):
+    """并行执行多个探测，达到法定数 (quorum) 即返回，其余探测结果被丢弃。
+
+    判定在线需要至少 quorum 个探测成功，且其中至少有一个 HTTP 层或认证网关状态探测；
+    当剩余探测已不可能凑够法定数时立即判定离线。
+
+    Args:
+        probes (list[Probe], optional): 探测集合，默认使用 config.ini 中的配置。
+        quorum (int, optional): 判定在线所需的成功探测数，默认使用 [Network] probe_quorum。
+        timeout (float, optional): 单个探测的超时时间 (秒)，也是整体等待的上限，默认使用 [Network] probe_timeout。
+        source (str, optional): 从该本机地址发出探测 (DNS 探测除外)，默认由系统路由决定。
+
+    Returns:
+        ProbeReport: online 为最终判定，results 为已完成的探测结果。
+    """
+    probes = PROBES if probes is None else probes
+    quorum = settings.network.probe_quorum if quorum is None else quorum
+    timeout = settings.network.probe_timeout if timeout is None else timeout
+    quorum = max(1, min(quorum, len(probes)))
+    start = time.perf_counter()
+    futures = {_executor.submit(run_probe, probe, timeout, source): probe for probe in probes}
+    pending = set(futures)
+    results = []
+    online = False
+    deadline = start + timeout + 0.5
+
+    while pending:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        results.extend(f.result() for f in done)
+        successes = [r for r in results if r.ok]
+        if len(successes) >= quorum and _authoritative(successes):
+            online = True
+            break
+        if len(successes) + len(pending) < quorum:
+            break
+
+    for future in pending:
+        # 尚未开始的探测直接取消；已在运行的会在自身超时内结束，结果被忽略
+        future.cancel()
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for result in results:
+            logger.debug("探测 %s=%s: %s (%s, %.0f ms)", result.probe.kind, result.probe.target,
+                         '成功' if result.ok else '失败', result.detail, result.latency * 1000)
+    return ProbeReport(online, results, time.perf_counter() - start)
@@ -0,0 +1,204 @@
+import enum
+import random
+import threading
+import time
+from logger_config import logger
+from settings import settings
+
+
+class ConnectionState(enum.Enum):
+    """连接状态机的状态。"""
+    ONLINE = 'online'          # 网络正常
+    PROBING = 'probing'        # 正在探测网络
+    LOGGING_IN = 'logging_in'  # 正在登录校园网
+    VERIFYING = 'verifying'    # 登录后等待验证
+    OFFLINE = 'offline'        # 已确认断网，等待下一次重连尝试
+
+
+# 允许的状态转换；其他转换视为逻辑错误并记录警告
+TRANSITIONS = {
+    ConnectionState.ONLINE: {ConnectionState.PROBING},
+    ConnectionState.PROBING: {ConnectionState.ONLINE, ConnectionState.OFFLINE},
+    ConnectionState.OFFLINE: {ConnectionState.PROBING, ConnectionState.LOGGING_IN},
+    ConnectionState.LOGGING_IN: {ConnectionState.VERIFYING, ConnectionState.OFFLINE},
+    ConnectionState.VERIFYING: {ConnectionState.ONLINE, ConnectionState.OFFLINE, ConnectionState.PROBING},
+}
+
+
+class ConnectionStateMachine:
+    """显式的连接状态机，替代原来散落在 main.py 中的高频模式全局变量。
+
+    记录当前状态、本次断网开始时间和本次断网期间的重连尝试次数。clock 可替换，
+    便于在虚拟时间中回放。
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = ConnectionState.PROBING
+        self.since = clock()
+        self.offline_since = None
+        self.attempts = 0
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """注册状态变化回调 callback(old_state, new_state, timestamp)，在状态锁之外调用。"""
+        self._listeners.append(callback)
+
+    def transition(self, new_state):
+        """切换到新状态，返回旧状态。"""
+        with self._lock:
+            old_state = self.state
+            if new_state is old_state:
+                return old_state
+            if new_state not in TRANSITIONS[old_state]:
+                logger.warning(f"非预期的状态转换: {old_state.value} -> {new_state.value}")
+            self.state = new_state
+            self.since = self._clock()
+            if new_state is ConnectionState.ONLINE:
+                self.offline_since = None
+                self.attempts = 0
+            elif new_state is ConnectionState.OFFLINE and self.offline_since is None:
+                self.offline_since = self.since
+            elif new_state is ConnectionState.LOGGING_IN:
+                self.attempts += 1
+            logger.debug(f"连接状态: {old_state.value} -> {new_state.value}")
+            timestamp = self.since
+        for callback in self._listeners:
+            try:
+                callback(old_state, new_state, timestamp)
+            except Exception:
+                logger.exception(f"状态变化回调执行失败: {old_state.value} -> {new_state.value}")
+        return old_state
+
+    @property
+    def is_offline(self):
+        return self.offline_since is not None
+
+    def offline_for(self):
+        """本次断网已持续的秒数，在线时返回 0。"""
+        with self._lock:
+            return 0.0 if self.offline_since is None else self._clock() - self.offline_since
+
+
+# --- 重连策略 --- START
+class RetryPolicy:
+    """断网期间重连间隔的计算策略。
+
+    next_delay() 只依赖传入的参数 (尝试次数、已断网时长) 和自身的随机数发生器，
+    不读取真实时间，因此既能驱动调度器，也能在模拟器中回放。
+    """
+
+    name = 'base'
+
+    def __init__(self, normal_interval, rng=None):
+        self.normal_interval = normal_interval  # 在线时的检查间隔 (秒)
+        self.rng = rng or random.Random()
+
+    def online_delay(self):
+        return self.normal_interval
+
+    def next_delay(self, attempts, offline_for):
+        """返回下一次重连尝试前的等待秒数。"""
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+
+class HighFrequencyPolicy(RetryPolicy):
+    """原有行为：断网后每 interval 秒重试，持续 duration 秒后回落到正常间隔 (即使仍未恢复)。"""
+
+    name = 'high_frequency'
+
+    def __init__(self, normal_interval, interval, duration, rng=None):
+        super().__init__(normal_interval, rng)
+        self.interval = interval
+        self.duration = duration
+
+    def next_delay(self, attempts, offline_for):
+        if offline_for >= self.duration:
+            return self.normal_interval
+        return self.interval
+
+    def describe(self):
+        return f"高频重连 (每 {self.interval:.0f} 秒，持续 {self.duration / 60:.0f} 分钟后回落到正常间隔)"
+
+
+class ExponentialBackoffPolicy(RetryPolicy):
+    """指数退避：刚断网时快速重试，之后间隔翻倍直到上限，并加入随机抖动避免多机同步。"""
+
+    name = 'backoff'
+
+    def __init__(self, normal_interval, base, cap, jitter=0.2, rng=None):
+        super().__init__(normal_interval, rng)
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+
+    def next_delay(self, attempts, offline_for):
+        delay = min(self.cap, self.base * 2 ** max(0, attempts - 1))
+        return delay * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def describe(self):
+        return f"指数退避 (从 {self.base:.0f} 秒开始翻倍，上限 {self.cap:.0f} 秒，抖动 ±{self.jitter:.0%})"
+
+
+class CappedRetriesPolicy(RetryPolicy):
+    """固定间隔重试 max_retries 次，之后回落到正常间隔。"""
+
+    name = 'capped'
+
+    def __init__(self, normal_interval, interval, max_retries, rng=None):
+        super().__init__(normal_interval, rng)
+        self.interval = interval
+        self.max_retries = max_retries
+
+    def next_delay(self, attempts, offline_for):
+        return self.interval if attempts < self.max_retries else self.normal_interval
+
+    def describe(self):
+        return f"有限重试 (每 {self.interval:.0f} 秒，最多 {self.max_retries} 次后回落到正常间隔)"
+
+
+class StayAggressivePolicy(RetryPolicy):
+    """只要仍然断网就保持高频重试，不会自动回落。"""
+
+    name = 'aggressive'
+
+    def __init__(self, normal_interval, interval, rng=None):
+        super().__init__(normal_interval, rng)
+        self.interval = interval
+
+    def next_delay(self, attempts, offline_for):
+        return self.interval
+
+    def describe(self):
+        return f"持续高频 (断网期间始终每 {self.interval:.0f} 秒重试)"
+# --- 重连策略 --- END
+
+
+def create_policy(name, schedule, rng=None):
+    """根据策略名称和 [schedule] 配置 (settings.schedule 或具有相同属性的对象) 创建策略对象。"""
+    normal_interval = schedule.interval * 60
+    hf_interval = schedule.high_frequency_interval
+    if name == 'high_frequency':
+        return HighFrequencyPolicy(normal_interval, hf_interval, schedule.high_frequency_duration * 60, rng=rng)
+    if name == 'backoff':
+        return ExponentialBackoffPolicy(normal_interval, schedule.backoff_base, schedule.backoff_max,
+                                        schedule.backoff_jitter, rng=rng)
+    if name == 'capped':
+        return CappedRetriesPolicy(normal_interval, hf_interval, schedule.max_retries, rng=rng)
+    if name == 'aggressive':
+        return StayAggressivePolicy(normal_interval, hf_interval, rng=rng)
+    raise ValueError(f"未知的重连策略: {name}")
+
+
+def load_policy():
+    """按 [schedule] retry_policy 创建策略，策略名无效时回退到原有的高频模式。"""
+    schedule = settings.schedule
+    try:
+        return create_policy(schedule.retry_policy, schedule)
+    except ValueError as e:
+        logger.warning(f"重连策略配置无效 ({e})，使用默认的高频重连策略。")
+        return create_policy('high_frequency', schedule)
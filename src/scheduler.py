@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logger_config import logger
+
+
+class Scheduler:
+    """基于截止时间堆 (deadline heap) 的调度器。
+
+    主循环只在下一个任务到期时才醒来，不再每秒轮询；到期的任务交给后台线程池执行，
+    因此探测、登录、邮件等阻塞操作不会拖住调度循环本身。
+
+    任务按名称管理：同一名称同一时刻最多只有一个待执行项，重复调度会替换旧的截止时间，
+    且同名任务不会并发执行。
+    """
+
+    def __init__(self, max_workers=4, clock=time.monotonic):
+        self._clock = clock
+        self._heap = []
+        self._counter = itertools.count()
+        self._pending = {}  # name -> heap entry
+        self._running = set()  # 正在执行的任务名称
+        self._retrigger = {}  # name -> (func, args, kwargs)，执行期间收到的立即触发请求
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='snaf-worker')
+        self._stopped = False
+
+    # --- 调度接口 --- START
+    def schedule(self, name, delay, func, *args, **kwargs):
+        """在 delay 秒后执行 func，替换同名的待执行任务。"""
+        with self._cond:
+            self._push(name, self._clock() + max(0.0, delay), func, args, kwargs)
+            self._cond.notify()
+
+    def trigger(self, name, func, *args, **kwargs):
+        """立即执行一次 func (例如网络事件触发的检查)。
+
+        如果同名任务正在执行，则在其结束后立刻再执行一次，避免触发被正在运行的任务覆盖。
+        """
+        with self._cond:
+            if name in self._running:
+                self._retrigger[name] = (func, args, kwargs)
+                logger.debug(f"任务 '{name}' 正在执行，结束后将立即重新执行。")
+                return
+            self._push(name, self._clock(), func, args, kwargs)
+            self._cond.notify()
+
+    def cancel(self, name):
+        """取消指定名称的待执行任务，返回是否存在该任务。"""
+        with self._cond:
+            self._retrigger.pop(name, None)
+            entry = self._pending.pop(name, None)
+            if entry is None:
+                return False
+            entry[-1] = True  # 标记为已取消，堆中的条目惰性删除
+            self._cond.notify()
+            return True
+
+    def next_due(self, name):
+        """返回指定任务距离到期还有多少秒，不存在时返回 None。"""
+        with self._cond:
+            entry = self._pending.get(name)
+            if entry is None:
+                return None
+            return max(0.0, entry[0] - self._clock())
+
+    def submit(self, func, *args, **kwargs):
+        """把一次性的阻塞操作 (如发送邮件) 放到后台线程执行，立即返回 Future。"""
+        return self._executor.submit(self._safe_call, getattr(func, '__name__', 'task'), func, args, kwargs)
+    # --- 调度接口 --- END
+
+    # --- 主循环 --- START
+    def run_forever(self):
+        """运行调度循环，直到调用 stop()。循环只在最近的截止时间或有新任务时醒来。"""
+        logger.debug("调度循环启动。")
+        with self._cond:
+            while not self._stopped:
+                entry, timeout = self._next_ready()
+                if entry is None:
+                    self._cond.wait(timeout)
+                    continue
+                _, _, name, func, args, kwargs, _ = entry
+                self._running.add(name)
+                self._executor.submit(self._run_task, name, func, args, kwargs)
+        logger.debug("调度循环已退出。")
+
+    def stop(self, wait=False):
+        """停止调度循环；wait=True 时等待正在执行的任务结束。"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+    # --- 主循环 --- END
+
+    # --- 内部实现 --- START
+    def _push(self, name, due, func, args, kwargs):
+        old = self._pending.pop(name, None)
+        if old is not None:
+            old[-1] = True
+        entry = [due, next(self._counter), name, func, args, kwargs, False]
+        self._pending[name] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _next_ready(self):
+        """弹出一个已到期且当前未在执行的任务。调用者需持有锁。
+
+        Returns:
+            tuple: (entry, timeout)。没有可执行任务时 entry 为 None，timeout 为距离下一个
+            截止时间的秒数；若只剩等待同名任务结束的条目则为 None (由任务结束时的 notify 唤醒)。
+        """
+        now = self._clock()
+        deferred = []
+        ready = None
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if entry[-1]:
+                continue
+            if entry[2] in self._running:
+                # 同名任务还在执行，等它结束后再派发
+                deferred.append(entry)
+                continue
+            self._pending.pop(entry[2], None)
+            ready = entry
+            break
+        timeout = None
+        while self._heap and self._heap[0][-1]:
+            heapq.heappop(self._heap)
+        if self._heap:
+            timeout = max(0.0, self._heap[0][0] - now)
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        return ready, timeout
+
+    def _run_task(self, name, func, args, kwargs):
+        try:
+            self._safe_call(name, func, args, kwargs)
+        finally:
+            with self._cond:
+                self._running.discard(name)
+                retrigger = self._retrigger.pop(name, None)
+                if retrigger is not None:
+                    self._push(name, self._clock(), retrigger[0], retrigger[1], retrigger[2])
+                self._cond.notify()
+
+    @staticmethod
+    def _safe_call(name, func, args, kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"调度任务 '{name}' 执行时发生未捕获的错误: {e}", exc_info=True)
+            return None
+    # --- 内部实现 --- END
@@ -0,0 +1,40 @@
+import os
+import socket
+from logger_config import logger
+
+# systemd 服务管理协议 (sd_notify)：以 Type=notify 运行时，systemd 通过 NOTIFY_SOCKET 环境变量告知通知套接字，
+# 程序在启动完成后发送 READY=1，定期发送 WATCHDOG=1 (WatchdogSec=)，用 STATUS= 更新 systemctl status 中的状态行。
+# 不在 systemd 下运行时所有函数都是空操作，无需安装 python-systemd。
+
+
+def enabled():
+    return bool(os.environ.get('NOTIFY_SOCKET'))
+
+
+def notify(**fields):
+    """发送一条通知，例如 notify(READY=1, STATUS='在线')；不在 systemd 下运行时返回 False。"""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address or not hasattr(socket, 'AF_UNIX'):
+        return False
+    if address.startswith('@'):
+        address = '\0' + address[1:]  # 抽象命名空间套接字
+    message = '\n'.join(f"{key}={value}" for key, value in fields.items()).encode('utf-8')
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(message, address)
+        return True
+    except OSError as e:
+        logger.warning(f"向 systemd 发送通知失败: {e}")
+        return False
+
+
+def watchdog_interval():
+    """systemd 要求的看门狗通知间隔 (WatchdogSec 的一半，单位: 秒)；未启用看门狗时返回 None。"""
+    usec = os.environ.get('WATCHDOG_USEC')
+    pid = os.environ.get('WATCHDOG_PID')
+    if not usec or (pid and pid != str(os.getpid())):
+        return None
+    try:
+        return int(usec) / 1e6 / 2
+    except ValueError:
+        return None
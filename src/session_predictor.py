@@ -0,0 +1,143 @@
+import json
+import os
+import statistics
+import threading
+import time
+from logger_config import logger
+from settings import settings
+
+# --- Session Prediction Configuration Loading ---
+# predict 和 history_file 修改后需重启 (RESTART_KEYS)；min_samples、max_spread、preempt_margin、
+# keepalive_interval 每次使用时从 settings.session 读取，热加载后立即生效
+PREDICT_ENABLED = settings.session.predict
+HISTORY_PATH = settings.session.history_file
+MAX_HISTORY = 50
+# --- Session Prediction Configuration Loading End ---
+
+# 过短的 "会话" 多半是登录后立即掉线或检测抖动，不参与学习
+MIN_SESSION_SECONDS = 120
+
+
+class SessionPredictor:
+    """记录每个账号的会话开始/掉线时间，学习会话寿命，预测下一次过期时间。
+
+    会话寿命集中 (离散系数小) 说明 Portal 按固定时长踢下线，可在过期前主动重新认证；
+    寿命分散则更像是空闲超时，此时建议按最短寿命的一半发送保活流量。
+    min_samples / max_spread 为 None 时使用 [session] 中的当前值。
+    """
+
+    def __init__(self, account, path=HISTORY_PATH, min_samples=None, max_spread=None, clock=time.time):
+        self.account = account
+        self.path = path
+        self._min_samples = min_samples
+        self._max_spread = max_spread
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = self._load()
+        # 上一次运行记录的会话开始时间未经确认不能沿用 (程序停止期间可能已经掉线并重新登录)，
+        # 先移出，等启动后的第一次检查确认在线时再由 resume_session() 决定是否恢复
+        self._resumable_start = self._account().get('current_start')
+        self._account()['current_start'] = None
+
+    @property
+    def min_samples(self):
+        return settings.session.min_samples if self._min_samples is None else self._min_samples
+
+    @property
+    def max_spread(self):
+        """会话时长的离散系数 (标准差/均值) 低于该值才认为存在规律的定时下线。"""
+        return settings.session.max_spread if self._max_spread is None else self._max_spread
+
+    # --- 持久化 --- START
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"无法读取会话历史文件 {self.path}，将重新开始记录: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存会话历史失败: {e}")
+
+    def _account(self):
+        return self._data.setdefault(self.account, {'sessions': [], 'current_start': None})
+    # --- 持久化 --- END
+
+    def session_started(self, timestamp=None):
+        """记录一次会话开始 (登录成功或断网后恢复)。"""
+        with self._lock:
+            self._resumable_start = None
+            self._account()['current_start'] = self._clock() if timestamp is None else timestamp
+            self._save()
+
+    def resume_session(self):
+        """启动后第一次检查确认在线时调用：上一次运行记录的会话仍可能有效时恢复它，返回是否恢复。
+
+        会话开始后已经超过典型寿命仍然在线，说明中间换过会话 (或寿命没有规律)，此时丢弃。
+        """
+        with self._lock:
+            start, self._resumable_start = self._resumable_start, None
+        if start is None:
+            return False
+        lifetime = self.typical_lifetime()
+        if lifetime is not None and self._clock() >= start + lifetime:
+            logger.info("上一次运行记录的会话已超过典型寿命，不再沿用其开始时间。")
+            return False
+        with self._lock:
+            self._account()['current_start'] = start
+            self._save()
+        return True
+
+    def session_dropped(self, timestamp=None):
+        """记录一次掉线。会话开始时间未知 (例如程序启动时已在线) 时只清空当前会话。"""
+        with self._lock:
+            entry = self._account()
+            start = entry.get('current_start')
+            end = self._clock() if timestamp is None else timestamp
+            entry['current_start'] = None
+            self._resumable_start = None
+            if start is not None and end - start >= MIN_SESSION_SECONDS:
+                entry['sessions'] = (entry['sessions'] + [[start, end]])[-MAX_HISTORY:]
+                logger.info(f"记录一次会话: 持续 {(end - start) / 60:.1f} 分钟 (账号 {self.account})")
+            self._save()
+
+    def lifetimes(self):
+        with self._lock:
+            return [end - start for start, end in self._account()['sessions']]
+
+    def typical_lifetime(self):
+        """会话寿命有规律时返回保守估计 (秒)，否则返回 None。"""
+        lifetimes = self.lifetimes()
+        if len(lifetimes) < self.min_samples:
+            return None
+        mean = statistics.fmean(lifetimes)
+        spread = statistics.pstdev(lifetimes) / mean if mean else 1.0
+        if spread > self.max_spread:
+            return None
+        # 取较低的分位，宁可早一点重新认证
+        return sorted(lifetimes)[len(lifetimes) // 4]
+
+    def idle_keepalive_interval(self):
+        """推断的保活间隔：会话寿命不规律时取最短寿命的一半，否则返回 None。"""
+        lifetimes = self.lifetimes()
+        if len(lifetimes) < self.min_samples or self.typical_lifetime() is not None:
+            return None
+        return max(60.0, min(lifetimes) / 2)
+
+    def predicted_expiry(self):
+        """返回当前会话的预测过期时间戳，无法预测时返回 None。"""
+        lifetime = self.typical_lifetime()
+        with self._lock:
+            start = self._account().get('current_start')
+        if lifetime is None or start is None:
+            return None
+        return start + lifetime
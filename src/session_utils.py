@@ -0,0 +1,144 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ProtocolError
+from logger_config import logger
+from settings import settings
+import dns_cache
+
+# --- Session Configuration Loading ---
+POOL_SIZE = settings.network.pool_size  # 修改后需重启 (RESTART_KEYS)
+# --- Session Configuration Loading End ---
+
+PORTAL_POOL = 'portal'  # 校园网 Portal (172.30.255.42:801)
+PROBE_POOL = 'probe'    # 外网探测目标
+
+
+class _CachedDNSMixin:
+    """urllib3 建连时用 _dns_host 作为连接地址：改为经进程内 DNS 缓存解析，host 仍是主机名 (Host 头、SNI 和证书校验)。"""
+
+    @property
+    def host(self):
+        return self._hostname.rstrip('.')
+
+    @host.setter
+    def host(self, value):
+        self._hostname = value
+
+    @property
+    def _dns_host(self):
+        return dns_cache.resolve(self.host)[0]
+
+    @_dns_host.setter
+    def _dns_host(self, value):
+        self._hostname = value
+
+
+class _CachedDNSConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class _CachedDNSHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class _CachedDNSPool(HTTPConnectionPool):
+    ConnectionCls = _CachedDNSConnection
+
+
+class _CachedDNSHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _CachedDNSHTTPSConnection
+
+
+class CachedDNSAdapter(HTTPAdapter):
+    """连接池中的新连接经 dns_cache 解析主机名 (缓存、过期兜底、固定解析)。"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _CachedDNSPool, 'https': _CachedDNSHTTPSPool}
+
+
+class PooledSession:
+    """长连接复用的 HTTP 会话，带空闲过期和失效重连。
+
+    每个实例对应一个独立的连接池，Portal 和外网探测各用一个，互不挤占连接。
+    idle_timeout 为 None 时使用 [Network] keepalive_idle 的当前值。
+    """
+
+    def __init__(self, name, pool_size=POOL_SIZE, idle_timeout=None):
+        self.name = name
+        self.pool_size = pool_size
+        self._idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._last_used = 0.0
+
+    @property
+    def idle_timeout(self):
+        """连接空闲超过该秒数后，服务器端多半已关闭 keep-alive，直接重建会话而不是等它报错。"""
+        return settings.network.keepalive_idle if self._idle_timeout is None else self._idle_timeout
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = CachedDNSAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._session is not None and now - self._last_used > self.idle_timeout:
+                logger.debug(f"会话池 '{self.name}' 空闲 {now - self._last_used:.0f} 秒，重建连接。")
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                self._session = self._new_session()
+            self._last_used = now
+            return self._session
+
+    def reset(self):
+        """关闭所有连接，下次请求时重新建立。"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def request(self, method, url, **kwargs):
+        """发送请求；如果复用的连接已失效 (服务器已断开)，重建会话后重试一次。"""
+        session = self._get()
+        try:
+            return session.request(method, url, **kwargs)
+        except requests.ConnectionError as e:
+            # 只有复用中的连接被对端关闭 (ProtocolError) 才值得重试；建连失败直接上抛
+            if not (e.args and isinstance(e.args[0], ProtocolError)):
+                raise
+            logger.debug(f"会话池 '{self.name}' 连接失效 ({e})，重建后重试一次。")
+            self.reset()
+            return self._get().request(method, url, **kwargs)
+
+    def close(self):
+        self.reset()
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(name):
+    """获取指定名称的共享会话 (进程内单例)。"""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = PooledSession(name)
+        return session
+
+
+def close_all():
+    """关闭所有共享会话的连接池。"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
@@ -0,0 +1,370 @@
+import collections
+import configparser
+import ipaddress
+import logging
+import os
+import sys
+import threading
+
+# --- Determine base path and config path --- START
+if getattr(sys, 'frozen', False):
+    # If the application is run as a bundle (frozen), use the executable directory
+    base_path = os.path.dirname(sys.executable)
+else:
+    # If run from a normal Python environment, use the script's directory
+    base_path = os.path.dirname(os.path.abspath(__file__))
+# 环境变量 SNAF_CONFIG 可以指定其他配置文件 (基准测试、同一台机器上运行多个实例)
+config_path = os.environ.get('SNAF_CONFIG') or os.path.join(base_path, 'config.ini')
+# --- Determine base path and config path --- END
+
+# settings 在 logger_config 之前加载，这里直接取同名 logger，不导入 logger_config 以免循环依赖
+logger = logging.getLogger('szu_network_fixer')
+
+REQUIRED = object()
+DEFAULT_PROBES = ('portal=auto, http204=http://connect.rom.miui.com/generate_204, head=https://www.baidu.com, '
+                  'tcp=www.baidu.com:443, dns=www.baidu.com')
+
+
+def path(value):
+    """相对路径按程序目录解析。"""
+    return os.path.join(base_path, value) if value else ''
+
+
+def upper(value):
+    return value.upper()
+
+
+def lower(value):
+    return value.lower()
+
+
+# (节, 键, 类型, 默认值, 最小值)；默认值为 REQUIRED 的键必须在 config.ini 中给出且不能为空
+SCHEMA = (
+    ('Credentials', 'username', str, REQUIRED, None),
+    ('Credentials', 'password', str, REQUIRED, None),
+
+    ('Network', 'login_url', str, REQUIRED, None),
+    ('Network', 'status_url', str, '', None),
+    ('Network', 'portal_ac_ip', str, '172.30.255.41', None),
+    ('Network', 'portal_js_version', str, '4.1.3', None),
+    ('Network', 'campus_prefix', str, '172.30.', None),
+    ('Network', 'iface_cache_ttl', float, 300, 0),
+    ('Network', 'probes', str, DEFAULT_PROBES, None),
+    ('Network', 'probe_quorum', int, 2, 1),
+    ('Network', 'probe_timeout', float, 3, 0.1),
+    ('Network', 'probe_backend', lower, 'requests', None),
+    ('Network', 'per_interface', lower, 'auto', None),
+    ('Network', 'upstream_ip', str, '223.5.5.5:53', None),
+    ('Network', 'dns_ttl', float, 300, 0),
+    ('Network', 'dns_stale', float, 86400, 0),
+    ('Network', 'dns_timeout', float, 2, 0.1),
+    ('Network', 'dns_pins', str, '', None),
+    ('Network', 'pool_size', int, 4, 1),
+    ('Network', 'keepalive_idle', float, 60, 0),
+
+    ('Email', 'sender_email', str, REQUIRED, None),
+    ('Email', 'sender_password', str, REQUIRED, None),
+    ('Email', 'receiver_email', str, REQUIRED, None),
+    ('Email', 'smtp_server', str, REQUIRED, None),
+    ('Email', 'smtp_port', int, 587, 1),
+    ('Email', 'smtp_security', lower, 'auto', None),
+    ('Email', 'smtp_keepalive', float, 300, 0),
+    ('Email', 'sink_dir', path, 'mail_sink', None),
+    ('Email', 'spool_dir', path, 'spool', None),
+    ('Email', 'retry_base', float, 30, 1),
+    ('Email', 'retry_max', float, 1800, 1),
+    ('Email', 'coalesce_window', float, 10, 0),
+    ('Email', 'diag_budget', float, 3, 0),
+    ('Email', 'diag_log_lines', int, 200, 0),
+
+    ('dev', 'debug', bool, False, None),
+    ('dev', 'log_level', upper, 'INFO', None),
+    ('dev', 'log_format', lower, 'json', None),
+    ('dev', 'log_max_mb', float, 5, 0),
+    ('dev', 'log_disk_budget_mb', float, 50, 0),
+
+    ('schedule', 'interval', int, 10, 1),
+    ('schedule', 'high_frequency_interval', int, 30, 1),
+    ('schedule', 'high_frequency_duration', int, 10, 0),
+    ('schedule', 'retry_policy', lower, 'high_frequency', None),
+    ('schedule', 'backoff_base', float, 10, 1),
+    ('schedule', 'backoff_max', float, 600, 1),
+    ('schedule', 'backoff_jitter', float, 0.2, 0),
+    ('schedule', 'max_retries', int, 20, 0),
+    ('schedule', 'link_watch', bool, True, None),
+    ('schedule', 'link_debounce', float, 2, 0),
+    ('schedule', 'config_reload', float, 5, 0),
+    ('schedule', 'diagnose', bool, True, None),
+
+    ('session', 'predict', bool, True, None),
+    ('session', 'history_file', path, 'session_history.json', None),
+    ('session', 'min_samples', int, 3, 1),
+    ('session', 'preempt_margin', float, 60, 0),
+    ('session', 'max_spread', float, 0.25, 0),
+    ('session', 'keepalive_interval', float, 0, None),
+
+    ('quality', 'enabled', bool, True, None),
+    ('quality', 'targets', str, 'auto', None),
+    ('quality', 'interval', float, 5, 1),
+    ('quality', 'timeout', float, 1, 0.1),
+    ('quality', 'window', int, 120, 10),
+    ('quality', 'min_samples', int, 12, 1),
+    ('quality', 'max_loss', float, 0.3, 0),
+    ('quality', 'max_p95_ms', float, 300, 1),
+    ('quality', 'cooldown', float, 120, 0),
+
+    ('metrics', 'enabled', bool, False, None),
+    ('metrics', 'listen', str, '127.0.0.1:9108', None),
+    ('metrics', 'textfile', str, '', None),
+    ('metrics', 'textfile_interval', float, 60, 1),
+
+    ('login', 'jitter', float, 10, 0),
+    ('login', 'bucket_size', int, 3, 1),
+    ('login', 'bucket_refill', float, 60, 1),
+    ('login', 'backoff_base', float, 30, 1),
+    ('login', 'backoff_max', float, 900, 1),
+    ('login', 'lan_lease', bool, False, None),
+    ('login', 'lease_port', int, 47631, 1),
+    ('login', 'lease_slots', int, 4, 1),
+    ('login', 'lease_ttl', float, 20, 1),
+
+    ('fleet', 'inventory', path, '', None),
+    ('fleet', 'concurrency', int, 4, 1),
+    ('fleet', 'interval', float, 60, 5),
+
+    ('history', 'enabled', bool, True, None),
+    ('history', 'db_file', path, 'history.db', None),
+
+    ('control', 'socket', path, 'snaf.sock', None),
+)
+
+# 只在启动时生效的键：运行中修改会提示需要重启
+RESTART_KEYS = {
+    ('Network', 'pool_size'), ('Email', 'spool_dir'), ('dev', 'log_format'), ('dev', 'log_max_mb'),
+    ('dev', 'log_disk_budget_mb'), ('schedule', 'link_watch'), ('schedule', 'link_debounce'),
+    ('session', 'predict'), ('session', 'history_file'), ('metrics', 'enabled'), ('metrics', 'listen'),
+    ('history', 'enabled'), ('history', 'db_file'), ('login', 'lan_lease'), ('login', 'lease_port'),
+    ('login', 'lease_slots'), ('login', 'lease_ttl'), ('fleet', 'concurrency'), ('quality', 'window'),
+    ('control', 'socket'),
+}
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+PROBE_BACKENDS = ('requests', 'stdlib')
+PER_INTERFACE_MODES = ('auto', 'true', 'false')
+FLEET_PREFIX = 'fleet:'  # 集群成员的节名前缀: [fleet:<名称>]
+
+
+class ConfigError(ValueError):
+    """config.ini 缺失、无法解析或取值不合法。"""
+
+
+class FleetEntry(collections.namedtuple('FleetEntry', ['name', 'username', 'password', 'ip'])):
+    """集群模式中的一个成员：用 username 为 ip 保持认证。"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"FleetEntry(name={self.name!r}, username={self.username!r}, ip={self.ip!r})"
+
+
+class Section:
+    """配置节的只读视图，键作为属性访问 (settings.network.probe_timeout)。"""
+
+    def __init__(self, name, values):
+        self._name = name
+        self.__dict__.update(values)
+
+    def __repr__(self):
+        items = ', '.join(f"{k}={v!r}" for k, v in vars(self).items()
+                          if not k.startswith('_') and k != 'password' and not k.endswith('_password'))
+        return f"<Section [{self._name}] {items}>"
+
+
+def _convert(section, key, kind, raw, minimum):
+    try:
+        if kind is bool:
+            state = configparser.ConfigParser.BOOLEAN_STATES.get(raw.lower())
+            if state is None:
+                raise ValueError(f"不是布尔值: {raw!r}")
+            value = state
+        else:
+            value = kind(raw)
+    except ValueError as e:
+        raise ConfigError(f"[{section}] {key} 的值无效: {e}") from None
+    if minimum is not None and value < minimum:
+        raise ConfigError(f"[{section}] {key} 不能小于 {minimum} (当前为 {value})")
+    return value
+
+
+def _parse_fleet(parsers, credentials):
+    """收集 [fleet:<名称>] 节 (config.ini 和 inventory 文件中)，账号密码缺省时使用 [Credentials]。"""
+    entries, seen = [], {}
+    for parser in parsers:
+        for section in parser.sections():
+            if not section.startswith(FLEET_PREFIX):
+                continue
+            name = section[len(FLEET_PREFIX):].strip() or section
+            ip = parser.get(section, 'ip', fallback='').strip()
+            try:
+                ipaddress.IPv4Address(ip)
+            except ValueError:
+                raise ConfigError(f"[{section}] ip 不是有效的 IPv4 地址: {ip!r}") from None
+            if ip in seen:
+                raise ConfigError(f"[{section}] ip {ip} 与 [{seen[ip]}] 重复")
+            seen[ip] = section
+            entries.append(FleetEntry(name, parser.get(section, 'username', fallback='').strip() or credentials['username'],
+                                      parser.get(section, 'password', fallback='').strip() or credentials['password'],
+                                      ip))
+    return tuple(entries)
+
+
+def _read_inventory(inventory):
+    parser = configparser.ConfigParser()
+    try:
+        with open(inventory, encoding='utf-8') as f:
+            parser.read_file(f)
+    except OSError as e:
+        raise ConfigError(f"无法读取集群清单 [fleet] inventory {inventory}: {e}") from None
+    except configparser.Error as e:
+        raise ConfigError(f"集群清单 {inventory} 格式错误: {e}") from None
+    return parser
+
+
+def _file_mtime(file_path):
+    try:
+        return os.stat(file_path).st_mtime_ns if file_path else None
+    except OSError:
+        return None
+
+
+def parse(text_or_parser):
+    """按 SCHEMA 解析并校验配置，返回 {节名: {键: 值}}。不合法时抛出 ConfigError。"""
+    parser = text_or_parser
+    if isinstance(text_or_parser, str):
+        parser = configparser.ConfigParser()
+        try:
+            parser.read_string(text_or_parser)
+        except configparser.Error as e:
+            raise ConfigError(f"配置文件格式错误: {e}") from None
+    values = {}
+    for section, key, kind, default, minimum in SCHEMA:
+        raw = parser.get(section, key, fallback=None)
+        if raw is not None:
+            raw = raw.strip()
+        if not raw:
+            if default is REQUIRED:
+                raise ConfigError(f"缺少必填配置项 [{section}] {key}")
+            value = kind(default) if kind in (path, upper, lower) else default
+        else:
+            value = _convert(section, key, kind, raw, minimum)
+        values.setdefault(section, {})[key] = value
+    if values['dev']['log_level'] not in LOG_LEVELS:
+        raise ConfigError(f"[dev] log_level 必须是 {', '.join(LOG_LEVELS)} 之一")
+    if values['Network']['probe_backend'] not in PROBE_BACKENDS:
+        raise ConfigError(f"[Network] probe_backend 必须是 {', '.join(PROBE_BACKENDS)} 之一")
+    if values['Network']['per_interface'] not in PER_INTERFACE_MODES:
+        raise ConfigError(f"[Network] per_interface 必须是 {', '.join(PER_INTERFACE_MODES)} 之一")
+    if values['Network']['probe_quorum'] > len([p for p in values['Network']['probes'].split(',') if p.strip()]):
+        raise ConfigError("[Network] probe_quorum 不能大于探测目标数量")
+    if values['quality']['max_loss'] > 1:
+        raise ConfigError("[quality] max_loss 是比例，必须在 0 到 1 之间")
+    inventory = values['fleet']['inventory']
+    parsers = [parser] + ([_read_inventory(inventory)] if inventory else [])
+    values['fleet']['entries'] = _parse_fleet(parsers, values['Credentials'])
+    return values
+
+
+class Settings:
+    """进程内唯一的配置对象：启动时加载并校验一次，之后按文件修改时间热加载。
+
+    各模块在使用时读取 settings.<节>.<键>，不再在导入时把值冻结成模块常量；
+    需要在变更时重建状态的模块 (日志级别、探测目标、重连策略、SMTP 传输) 通过 add_listener 注册回调。
+    重新加载失败时保留旧配置并记录错误，不会让运行中的进程退出。
+    """
+
+    def __init__(self, path=config_path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._values = {}
+        self._mtime = None
+        self._apply(self._read())
+
+    def _read(self):
+        # 先记录修改时间：文件无效时不会在每次轮询中反复重新加载
+        inventory = self._values.get('fleet', {}).get('inventory', '')
+        try:
+            self._mtime = (os.stat(self.path).st_mtime_ns, _file_mtime(inventory))
+            with open(self.path, encoding='utf-8') as f:
+                values = parse(f.read())
+        except OSError as e:
+            raise ConfigError(f"无法找到或读取配置文件 {self.path}: {e}") from None
+        self._mtime = (self._mtime[0], _file_mtime(values['fleet']['inventory']))
+        return values
+
+    def _apply(self, values):
+        with self._lock:
+            self._values = values
+            for section, entries in values.items():
+                setattr(self, section.lower(), Section(section, entries))
+
+    def add_listener(self, callback):
+        """注册配置变更回调 callback(changed)，changed 为 {(节, 键), ...}。"""
+        self._listeners.append(callback)
+
+    def reload(self):
+        """重新读取配置文件并通知监听者，返回变更的键集合；配置无效时保留旧配置并返回空集合。"""
+        old = self._values
+        try:
+            new = self._read()
+        except ConfigError as e:
+            logger.error(f"配置文件重新加载失败，继续使用旧配置: {e}")
+            return set()
+        changed = {(section, key) for section, entries in new.items()
+                   for key, value in entries.items() if old.get(section, {}).get(key) != value}
+        if not changed:
+            return changed
+        self._apply(new)
+        logger.info(f"配置已重新加载，变更: {', '.join(f'[{s}] {k}' for s, k in sorted(changed))}")
+        restart = changed & RESTART_KEYS
+        if restart:
+            logger.warning(f"以下配置需要重启程序才能生效: {', '.join(f'[{s}] {k}' for s, k in sorted(restart))}")
+        for callback in self._listeners:
+            try:
+                callback(changed)
+            except Exception:
+                logger.exception("配置变更回调执行失败")
+        return changed
+
+    def check_for_changes(self):
+        """配置文件 (或集群清单) 修改时间变化时重新加载。"""
+        try:
+            mtime = (os.stat(self.path).st_mtime_ns, _file_mtime(self.fleet.inventory))
+        except OSError:
+            return set()
+        if mtime == self._mtime:
+            return set()
+        return self.reload()
+
+    def watch(self, scheduler, interval=None):
+        """在调度器中定期检查配置文件是否被修改 ([schedule] config_reload 秒，0 表示关闭)。"""
+        interval = self.schedule.config_reload if interval is None else interval
+        if interval <= 0:
+            return
+
+        def _poll():
+            self.check_for_changes()
+            scheduler.schedule('config_reload', self.schedule.config_reload or interval, _poll)
+        scheduler.schedule('config_reload', interval, _poll)
+        logger.info(f"已启用配置热加载，每 {interval:.0f} 秒检查一次 {self.path}")
+
+
+def _load_or_exit():
+    # 整个进程只有这一个配置失败出口
+    try:
+        return Settings()
+    except ConfigError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(f"配置文件无效: {e}")
+
+
+settings = _load_or_exit()
@@ -0,0 +1,166 @@
+import os
+import smtplib
+import ssl
+import threading
+import time
+from logger_config import logger
+import dns_cache
+
+
+class _SMTP(smtplib.SMTP):
+    """服务器主机名经进程内 DNS 缓存解析 (启动时已预解析并固定)，断网恢复后发信不再等待 DNS。"""
+
+    def _get_socket(self, host, port, timeout):
+        return dns_cache.create_connection((host, port), timeout, self.source_address)
+
+
+class _SMTP_SSL(smtplib.SMTP_SSL, _SMTP):
+    """SMTP_SSL._get_socket 先经 _SMTP 建连，再以原主机名做 TLS 握手。"""
+
+
+class SMTPTransport:
+    """可复用的 SMTP 传输基类。
+
+    保持一个已认证的连接跨多次发送复用：距上次使用不久的连接先用 NOOP 确认仍然可用，
+    空闲太久的连接直接重建；一次 send() 调用中的多封邮件在同一个会话里发送。
+    """
+
+    name = 'smtp'
+
+    def __init__(self, host, port, username, password, timeout=20, keepalive=300):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.keepalive = keepalive  # 连接空闲超过该秒数后不再复用
+        self._lock = threading.Lock()
+        self._server = None
+        self._last_used = 0.0
+
+    def _open(self):
+        """建立并返回一个未认证的连接，由子类实现。"""
+        raise NotImplementedError
+
+    def _connect(self):
+        logger.info(f"连接到 SMTP 服务器: {self.host}:{self.port} ({self.name})...")
+        server = self._open()
+        server.login(self.username, self.password)
+        logger.info(f"SMTP 登录成功 ({self.username})。")
+        return server
+
+    def _alive(self):
+        if self._server is None:
+            return False
+        if time.monotonic() - self._last_used > self.keepalive:
+            logger.debug("SMTP 连接空闲过久，重新建立连接。")
+            return False
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            logger.debug("SMTP 连接 NOOP 检查失败，重新建立连接。")
+            return False
+
+    def send(self, messages):
+        """在一个会话中发送多封邮件。
+
+        Args:
+            messages (list): (sender, recipients, message_bytes) 三元组列表。
+        """
+        with self._lock:
+            if not self._alive():
+                self._close()
+                self._server = self._connect()
+            try:
+                for sender, recipients, data in messages:
+                    self._server.sendmail(sender, recipients, data)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # 连接在发送过程中失效，下次发送时重建
+                self._close()
+                raise
+            self._last_used = time.monotonic()
+
+    def _close(self):
+        if self._server is None:
+            return
+        try:
+            logger.debug("尝试发送 QUIT 命令...")
+            self._server.quit()
+            logger.debug("SMTP 连接已正常关闭。")
+        except (smtplib.SMTPException, OSError) as quit_err:
+            logger.debug(f"发送 QUIT 命令时出现异常: {quit_err}")
+        self._server = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class SSLTransport(SMTPTransport):
+    """隐式 TLS (SMTPS，通常为 465 端口)：连接建立即进行 TLS 握手。"""
+
+    name = 'ssl'
+
+    def _open(self):
+        return _SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+
+
+class StartTLSTransport(SMTPTransport):
+    """STARTTLS (通常为 587 端口)：先明文连接，再升级为 TLS。"""
+
+    name = 'starttls'
+
+    def _open(self):
+        server = _SMTP(self.host, self.port, timeout=self.timeout)
+        logger.info("连接成功，尝试启动 TLS 加密 (STARTTLS)...")
+        server.starttls(context=ssl.create_default_context())
+        return server
+
+
+class PlainTransport(SMTPTransport):
+    """不加密的 SMTP，只用于本机或可信内网的中继 (以及 tools/simulators.py 中的本地 SMTP 模拟器)。"""
+
+    name = 'plain'
+
+    def _open(self):
+        return _SMTP(self.host, self.port, timeout=self.timeout)
+
+
+class FileTransport:
+    """本地文件投递：把邮件写成 .eml 文件，用于测试或无 SMTP 的环境。"""
+
+    name = 'file'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def send(self, messages):
+        os.makedirs(self.directory, exist_ok=True)
+        for _, _, data in messages:
+            path = os.path.join(self.directory, f"{time.time_ns()}.eml")
+            with open(path, 'wb') as f:
+                f.write(data)
+            logger.info(f"邮件已写入本地文件: {path}")
+
+    def close(self):
+        pass
+
+
+def create_transport(security, host, port, username, password, sink_dir=None, timeout=20, keepalive=300):
+    """根据配置创建传输对象。
+
+    Args:
+        security (str): auto / ssl / starttls / plain / file。auto 时 465 端口使用隐式 TLS，其余使用 STARTTLS。
+    """
+    security = (security or 'auto').lower()
+    if security == 'file':
+        return FileTransport(sink_dir)
+    if security == 'auto':
+        security = 'ssl' if port == 465 else 'starttls'
+    if security == 'ssl':
+        return SSLTransport(host, port, username, password, timeout=timeout, keepalive=keepalive)
+    if security == 'starttls':
+        return StartTLSTransport(host, port, username, password, timeout=timeout, keepalive=keepalive)
+    if security == 'plain':
+        return PlainTransport(host, port, username, password, timeout=timeout, keepalive=keepalive)
+    raise ValueError(f"未知的 smtp_security 配置: {security}")
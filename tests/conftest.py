@@ -0,0 +1,31 @@
+"""测试环境：在临时目录生成配置 (通过 SNAF_CONFIG)，运行时文件不写入程序目录。"""
+import configparser
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+sys.path.insert(0, SRC_DIR)
+
+TMP_DIR = tempfile.mkdtemp(prefix='snaf-test-')
+
+
+def _write_config():
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(os.path.join(ROOT_DIR, 'config.ini'), encoding='utf-8')
+    parser['Email']['spool_dir'] = os.path.join(TMP_DIR, 'spool')
+    parser['Email']['sink_dir'] = os.path.join(TMP_DIR, 'mail_sink')
+    parser['session']['history_file'] = os.path.join(TMP_DIR, 'session_history.json')
+    parser['history']['db_file'] = os.path.join(TMP_DIR, 'history.db')
+    parser['control']['socket'] = os.path.join(TMP_DIR, 'snaf.sock')
+    parser['schedule']['link_watch'] = 'false'
+    parser['schedule']['config_reload'] = '0'
+    parser['dev']['log_level'] = 'WARNING'
+    path = os.path.join(TMP_DIR, 'config.ini')
+    with open(path, 'w', encoding='utf-8') as f:
+        parser.write(f)
+    return path
+
+
+os.environ['SNAF_CONFIG'] = _write_config()
@@ -0,0 +1,48 @@
+import time
+
+import main
+from event_store import EventStore
+
+
+def test_stats_last_hour_is_a_sliding_window(monkeypatch, tmp_path):
+    store = EventStore(str(tmp_path / 'history.db'))
+    now_ms = int(time.time() * 1000)
+    # 跨越整点的事件：按小时分桶会只剩当前小时的部分
+    for minutes_ago, ok, latency in ((90, True, 0.5), (50, True, 0.1), (30, False, 0.3), (1, True, 0.2)):
+        store.record('probe', ok, latency, ts_ms=now_ms - minutes_ago * 60 * 1000)
+    monkeypatch.setattr(main, 'history', store)
+    try:
+        stats = main.control_stats([])
+    finally:
+        store.close()
+    assert stats['last_hour']['probe'] == {'total': 3, 'ok': 2, 'avg_ms': 200.0}
+    assert 'login' not in stats['last_hour']
+
+
+def test_malformed_json_commands_get_an_error_reply():
+    from control import ControlServer
+    server = ControlServer('unused.sock', {'status': lambda args: {'args': args}})
+    for line in ('{"cmd":"status","args":5}', '{"cmd":"status","args":null}', '["status"]', '{"cmd": '):
+        reply = server.dispatch(line)
+        assert reply['ok'] is False
+        assert reply['error'].startswith('无法解析的命令')
+    assert server.dispatch('{"cmd":"status","args":[600]}') == {'ok': True, 'args': ['600']}
+
+
+def test_overlong_command_line_is_rejected_without_buffering_it():
+    import json
+    import socket
+    import threading
+    from control import MAX_LINE, ControlServer
+    server = ControlServer('unused.sock', {'ping': lambda args: {'pong': True}})
+    client, conn = socket.socketpair()
+    worker = threading.Thread(target=server._handle, args=(conn,))
+    worker.start()
+    with client:
+        client.sendall(b'ping\n' + b'x' * (MAX_LINE * 4))
+        reader = client.makefile('rb')
+        replies = [json.loads(reader.readline()) for _ in range(2)]
+    worker.join(timeout=5)
+    assert not worker.is_alive()  # 回复错误后立即断开，不等待剩余数据
+    assert replies[0] == {'ok': True, 'pong': True}
+    assert replies[1]['ok'] is False and '命令过长' in replies[1]['error']
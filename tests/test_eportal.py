@@ -0,0 +1,78 @@
+import base64
+import socket
+
+import pytest
+
+import probe_utils
+from network_utils import EPortalClient, PortalCode, classify_response, parse_jsonp
+
+
+def test_parse_jsonp_accepts_callback_wrapper_and_plain_json():
+    assert parse_jsonp('dr1003({"result":"1","msg":"ok"});') == {'result': '1', 'msg': 'ok'}
+    assert parse_jsonp(' dr1002({"result":1,\n"v46ip":"172.30.1.2"}) ') == {'result': 1, 'v46ip': '172.30.1.2'}
+    assert parse_jsonp('{"result":"0"}') == {'result': '0'}
+
+
+@pytest.mark.parametrize('text', ['<html>502 Bad Gateway</html>', 'dr1003([1, 2])', 'dr1003({"result":', ''])
+def test_parse_jsonp_rejects_non_objects(text):
+    with pytest.raises(ValueError):
+        parse_jsonp(text)
+
+
+@pytest.mark.parametrize('payload, code', [
+    ({'result': '1', 'msg': '认证成功'}, PortalCode.SUCCESS),
+    ({'result': 1}, PortalCode.SUCCESS),
+    ({'result': '0', 'ret_code': '2', 'msg': ''}, PortalCode.ALREADY_ONLINE),
+    ({'result': '0', 'ret_code': 1, 'msg': '该账号已经在线'}, PortalCode.ALREADY_ONLINE),
+    ({'result': '0', 'ret_code': 1, 'msg': base64.b64encode(b'ldap auth error').decode()}, PortalCode.BAD_CREDENTIALS),
+    ({'result': '0', 'msg': '密码错误'}, PortalCode.BAD_CREDENTIALS),
+    ({'result': '0', 'ret_code': 'x', 'msg': '本时段禁止上网'}, PortalCode.REJECTED),
+])
+def test_classify_response_maps_portal_answers(payload, code):
+    assert classify_response(payload)[0] is code
+
+
+def test_classify_response_messages():
+    assert classify_response({'result': '1'}) == (PortalCode.SUCCESS, '成功')
+    assert classify_response({'result': '0', 'msg': 'bGRhcCBhdXRoIGVycm9y'})[1] == 'ldap auth error'
+    assert classify_response({'result': '0', 'msg': 'AC999'})[1] == 'AC999'  # 不是 base64 的消息原样保留
+    assert classify_response({'result': '0'}) == (PortalCode.REJECTED, 'result=0')
+
+
+@pytest.fixture
+def client():
+    return EPortalClient('student', 'secret', 'http://172.30.255.42:801/eportal/portal/login')
+
+
+@pytest.mark.parametrize('answer, code', [
+    ((200, b'dr1003({"result":"1","msg":"ok"})'), PortalCode.SUCCESS),
+    ((502, b'Bad Gateway'), PortalCode.HTTP_ERROR),
+    ((200, b'<html>maintenance</html>'), PortalCode.BAD_RESPONSE),
+    (socket.timeout('timed out'), PortalCode.TIMEOUT),
+    (ConnectionRefusedError(111, 'refused'), PortalCode.NETWORK_ERROR),
+])
+def test_bound_login_maps_transport_outcomes(monkeypatch, client, answer, code):
+    requests = []
+
+    def fetch(method, url, timeout, source=None):
+        requests.append((url, source))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    monkeypatch.setattr(probe_utils, 'http_fetch', fetch)
+
+    result = client.login('172.30.9.8', source='172.30.9.8')
+
+    assert (result.code, result.user_ip, result.ok) == (code, '172.30.9.8', code is PortalCode.SUCCESS)
+    assert 'wlan_user_ip=172.30.9.8' in requests[0][0] and requests[0][1] == '172.30.9.8'
+
+
+def test_status_reports_gateway_answer(monkeypatch, client):
+    answers = iter([(200, b'dr1002({"result":1,"uid":"student","v46ip":"172.30.9.8"})'),
+                    (200, b'dr1002({"result":0})'),
+                    (500, b'')])
+    monkeypatch.setattr(probe_utils, 'http_fetch', lambda method, url, timeout, source=None: next(answers))
+
+    assert client.status() == (True, '172.30.9.8', 'student', '已认证 (student)')
+    assert client.status().online is False
+    assert client.status().online is None
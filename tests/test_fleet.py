@@ -0,0 +1,63 @@
+import fleet
+from network_utils import PortalCode, PortalResult, PortalStatus
+from settings import FleetEntry
+
+ENTRY = FleetEntry('lab-01', '2020123456', 'secret', '172.30.10.21')
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule(self, name, delay, func, *args):
+        self.scheduled.append((name, delay))
+
+    def cancel(self, name):
+        pass
+
+
+class FakeClient:
+    def __init__(self, status):
+        self._status = status
+        self.logins = []
+
+    def status(self, timeout=3, url=None, source=None, user_ip=None):
+        return self._status
+
+    def login(self, user_ip, timeout=None, source=None):
+        self.logins.append(user_ip)
+        return PortalResult(PortalCode.SUCCESS, 'ok', user_ip, {})
+
+
+def _member(status):
+    member = fleet.FleetMember(ENTRY, local=False)
+    member.client = FakeClient(status)
+    return member
+
+
+def test_online_downstream_member_is_checked_without_login():
+    member = _member(PortalStatus(True, ENTRY.ip, ENTRY.username, '已认证'))
+    delay, event = member.run()
+    assert member.client.logins == []
+    assert event is None and delay == member.policy.online_delay()
+
+
+def test_downstream_member_logs_in_only_once_known_offline(monkeypatch):
+    member = _member(PortalStatus(False, None, None, '未认证'))
+    monkeypatch.setattr(member.admission, 'acquire', lambda: (0, ''))
+    delay, event = member.run()
+    assert member.client.logins == [ENTRY.ip]
+    assert (delay, event) == (fleet.VERIFY_DELAY, 'offline')
+
+
+def test_run_does_not_block_a_worker_when_slots_are_taken():
+    scheduler = FakeScheduler()
+    group = fleet.Fleet(scheduler)
+    member = _member(PortalStatus(True, ENTRY.ip, ENTRY.username, '已认证'))
+    group.members[ENTRY.name] = member
+    started = member.state.since
+    while group._slots.acquire(blocking=False):
+        pass
+    group._run(member)
+    assert scheduler.scheduled == [(fleet.TASK_PREFIX + ENTRY.name, fleet.SLOT_RETRY)]
+    assert member.client.logins == [] and member.state.since == started  # 成员本轮没有执行
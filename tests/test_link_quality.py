@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from link_quality import LOST, LinkSampler, RingBuffer
+
+
+def test_ring_buffer_overwrites_oldest_samples_after_wraparound():
+    buffer = RingBuffer(4)
+    assert buffer.stats() == (0, 0.0, None, None, None)
+    for value in (LOST, LOST, 10.0, 20.0):
+        buffer.append(value)
+    assert buffer.stats()[:2] == (4, 0.5)
+
+    for value in (30.0, 40.0, 50.0):  # 覆盖两个丢失样本和 10.0
+        buffer.append(value)
+    assert len(buffer) == 4
+    assert buffer.stats() == (4, 0.0, 40.0, 50.0, 50.0)
+
+    for _ in range(9):  # 多次绕回后仍只保留最近 4 个样本
+        buffer.append(LOST)
+    assert buffer.stats() == (4, 1.0, None, None, None)
+
+
+def test_ring_buffer_clear_starts_a_new_window():
+    buffer = RingBuffer(3)
+    for value in (1.0, 2.0, 3.0, 4.0):
+        buffer.append(value)
+    buffer.clear()
+    assert len(buffer) == 0
+    buffer.append(7.0)
+    assert buffer.stats() == (1, 0.0, 7.0, 7.0, 7.0)
+
+
+def test_degradation_triggers_once_per_cooldown():
+    now = [0.0]
+    degraded = []
+    sampler = LinkSampler(scheduler=None, on_degraded=lambda target, reason: degraded.append(target),
+                          clock=lambda: now[0])
+    sampler.buffers = {'gw:80': RingBuffer(8), 'ext:53': RingBuffer(8)}
+    quality = SimpleNamespace(min_samples=4, max_loss=0.5, max_p95_ms=200, cooldown=60)
+
+    for value in (5.0, LOST, LOST, LOST):
+        sampler.buffers['gw:80'].append(value)
+        sampler.buffers['ext:53'].append(10.0)
+    sampler._evaluate(quality)
+    assert degraded == ['gw:80']
+    assert all(len(buffer) == 0 for buffer in sampler.buffers.values())
+
+    for value in (LOST,) * 4:
+        sampler.buffers['gw:80'].append(value)
+    now[0] = 30
+    sampler._evaluate(quality)  # 冷却期内不重复触发
+    now[0] = 61
+    sampler._evaluate(quality)
+    assert degraded == ['gw:80', 'gw:80']
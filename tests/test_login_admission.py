@@ -0,0 +1,126 @@
+import json
+import random
+
+import pytest
+
+import login_admission
+from login_admission import LanLease, LoginAdmission, TokenBucket, is_overload
+from network_utils import PortalCode, PortalResult
+from settings import settings
+
+OK = PortalResult(PortalCode.SUCCESS, 'ok', '172.30.1.2', {})
+
+
+class FakeLease:
+    def __init__(self):
+        self.released = 0
+
+    def acquire(self):
+        return 0.0
+
+    def release(self):
+        self.released += 1
+
+
+def test_release_only_frees_a_lease_that_was_acquired():
+    lease = FakeLease()
+    admission = LoginAdmission(rng=random.Random(1), lease=lease)
+    admission.release(OK)  # 没有经过 acquire() 的登录
+    assert lease.released == 0
+
+    assert admission.acquire(preemptive=True)[0] == 0
+    admission.release(OK)
+    admission.release(OK)
+    assert lease.released == 1
+
+
+def test_preemptive_acquire_skips_jitter_and_backoff(monkeypatch):
+    monkeypatch.setattr(settings.login, 'jitter', 10.0)
+    now = [0.0]
+    admission = LoginAdmission(clock=lambda: now[0], rng=random.Random(1))
+    admission.record(PortalResult(PortalCode.TIMEOUT, '超时', None, None))
+    assert admission.acquire(preemptive=True) == (0.0, "允许登录")
+    # 普通登录仍先随机错峰，再服从服务器退避
+    assert admission.acquire()[1] == "断网后随机错峰"
+    assert admission.acquire()[0] > 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_one_token_per_interval_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(2, 10, clock)
+    assert [bucket.take(), bucket.take()] == [0.0, 0.0]
+    assert bucket.take() == pytest.approx(10)
+    clock.now = 4
+    assert bucket.take() == pytest.approx(6)  # 补充了 0.4 个令牌，还差 0.6 个
+    clock.now = 10
+    assert bucket.take() == 0.0
+    clock.now = 1000  # 长时间空闲后最多积累 capacity 个令牌
+    assert [bucket.take(), bucket.take()] == [0.0, 0.0]
+    assert bucket.take() > 0
+
+
+def test_admission_rate_limits_with_the_configured_bucket(monkeypatch):
+    monkeypatch.setattr(settings.login, 'bucket_size', 1)
+    monkeypatch.setattr(settings.login, 'bucket_refill', 30.0)
+    clock = FakeClock()
+    admission = LoginAdmission(clock=clock, rng=random.Random(1))
+    assert admission.acquire(preemptive=True)[0] == 0
+    assert admission.acquire(preemptive=True) == (pytest.approx(30), "本机登录频率限制")
+    clock.now = 30
+    assert admission.acquire(preemptive=True)[0] == 0
+
+
+def test_overload_results_back_off_and_success_clears_it(monkeypatch):
+    monkeypatch.setattr(settings.login, 'backoff_base', 10.0)
+    monkeypatch.setattr(settings.login, 'backoff_max', 40.0)
+    monkeypatch.setattr(settings.login, 'jitter', 0.0)
+    clock = FakeClock()
+    admission = LoginAdmission(clock=clock, rng=random.Random(1))
+    busy = PortalResult(PortalCode.HTTP_ERROR, 'HTTP 502 Bad Gateway', None, None)
+    assert is_overload(busy)
+    assert not is_overload(PortalResult(PortalCode.HTTP_ERROR, 'HTTP 404 Not Found', None, None))
+    assert is_overload(PortalResult(PortalCode.REJECTED, '系统繁忙，请稍后再试', None, None))
+
+    for ceiling in (10, 20, 40, 40):
+        admission.record(busy)
+        wait = admission.acquire()[0]
+        assert ceiling / 2 <= wait <= ceiling
+    admission.record(OK)
+    assert admission.acquire()[0] == 0
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append(json.loads(data)['op'])
+
+
+def test_lan_lease_arbitrates_simultaneous_claims_by_host_id(monkeypatch):
+    monkeypatch.setattr(login_admission, 'LEASE_SETTLE', 0)
+    clock = FakeClock()
+    lease = LanLease(9999, slots=1, ttl=30, host_id='host-b', clock=clock, rng=random.Random(1))
+    lease._sock = FakeSocket()
+
+    lease._on_message('host-a', 'claim', 1)
+    assert lease.acquire() > 0  # host-a 排在前面，本机让出
+    assert lease._sock.sent == ['claim', 'release']
+
+    clock.now = 5  # host-a 的申请已过期
+    assert lease.acquire() == 0
+    assert lease._sock.sent[-1] == 'hold'
+
+    lease._on_message('host-a', 'hold', 30)
+    wait = lease.acquire()
+    assert 30 <= wait <= 30 + 15  # 名额已满：等到最早的租约到期后再错开一点
+    lease._on_message('host-a', 'release', 0)
+    assert lease.acquire() == 0
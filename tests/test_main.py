@@ -0,0 +1,25 @@
+import main
+from retry_policy import ConnectionState, ConnectionStateMachine
+from scheduler import Scheduler
+
+
+def test_check_trigger_during_verification_keeps_the_verification(monkeypatch):
+    scheduler = Scheduler(max_workers=1)
+    state = ConnectionStateMachine()
+    state.transition(ConnectionState.OFFLINE)
+    state.transition(ConnectionState.LOGGING_IN)
+    state.transition(ConnectionState.VERIFYING)
+    monkeypatch.setattr(main, 'scheduler', scheduler)
+    monkeypatch.setattr(main, 'state', state)
+    try:
+        scheduler.schedule(main.VERIFY_TASK, 60, main.verify_reconnect, '172.30.1.2')
+        # 链路变化、链路质量劣化或控制接口在验证期间触发检查
+        main.on_link_change(['link'])
+        assert scheduler.next_due(main.VERIFY_TASK) is not None
+
+        probed = []
+        monkeypatch.setattr(main, 'check_and_record', lambda: probed.append(1))
+        main.job()
+        assert probed == [] and state.state is ConnectionState.VERIFYING
+    finally:
+        scheduler.stop()
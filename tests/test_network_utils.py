@@ -0,0 +1,41 @@
+import probe_utils
+import network_utils
+from iface_utils import Interface
+
+
+def _report(online):
+    return probe_utils.ProbeReport(online, [], 0.0)
+
+
+def test_probe_interfaces_keeps_interfaces_with_the_same_name(monkeypatch):
+    # Windows 和通用后端的接口名都是 '?'，逐接口探测必须按地址区分
+    online = {'172.30.9.8': True, '172.30.9.9': False}
+    monkeypatch.setattr(probe_utils, 'run_probes',
+                        lambda probes=None, timeout=None, source=None: _report(online[source]))
+    interfaces = [Interface('?', '172.30.9.8', None, True), Interface('?', '172.30.9.9', None, True)]
+
+    reports = network_utils.probe_interfaces(interfaces)
+
+    assert {address: report.online for address, (_, report) in reports.items()} == online
+    assert network_utils._combine(reports, 0.0).online
+
+
+def test_failing_interfaces_and_admission_are_per_address(monkeypatch):
+    import main
+    report = probe_utils.ProbeReport(False, [], 0.0, {
+        '172.30.9.8': ('?', _report(False)),
+        '172.30.9.9': ('?', _report(False)),
+    })
+    assert main.failing_interfaces(report) == [('?', '172.30.9.8'), ('?', '172.30.9.9')]
+
+    interfaces = [Interface('?', '172.30.9.8', None, True), Interface('?', '172.30.9.9', None, True)]
+    scheduled = []
+    monkeypatch.setattr(main, 'monitored_interfaces', lambda: interfaces)
+    monkeypatch.setattr(main, 'login_and_record', lambda **kwargs: kwargs['user_ip'])
+    monkeypatch.setattr(main.scheduler, 'schedule', lambda name, *args: scheduled.append(name))
+    monkeypatch.setattr(main, 'iface_admissions', {})
+    for name, address in main.failing_interfaces(report):
+        main.relogin_interface(name, address)
+
+    assert set(main.iface_admissions) == {'172.30.9.8', '172.30.9.9'}
+    assert scheduled == [main.IFACE_TASK + '172.30.9.8', main.IFACE_TASK + '172.30.9.9']
@@ -0,0 +1,42 @@
+import email_utils
+import outbox as outbox_module
+from outbox import Outbox
+from settings import settings
+
+
+def test_digest_carries_diagnostics_only_when_an_event_needs_them(tmp_path):
+    sent = []
+    outbox = Outbox(spool_dir=str(tmp_path), sender=lambda batch: sent.extend(batch) or True)
+
+    outbox.enqueue("恢复", "网络已恢复", reconnect_time='2026-01-01 00:00:10')
+    outbox.enqueue("首次", "连接成功")
+    outbox._flush()
+    outbox.enqueue("断开", "检测到断开", disconnect_time='2026-01-01 00:00:00', diagnostics=True)
+    outbox.enqueue("恢复", "网络已恢复")
+    outbox._flush()
+
+    assert [kwargs for _, _, kwargs in sent] == [{'diagnostics': False}, {'diagnostics': True}]
+    assert 'diagnostics' not in sent[1][1]
+    assert outbox.pending_count() == 0
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.sessions = []
+
+    def send(self, messages):
+        self.sessions.append(messages)
+
+
+def test_backlog_is_sent_as_several_digests_in_one_session(monkeypatch, tmp_path):
+    transport = RecordingTransport()
+    monkeypatch.setattr(email_utils, 'get_transport', lambda: transport)
+    monkeypatch.setattr(settings.email, 'diag_budget', 0)
+    outbox = Outbox(spool_dir=str(tmp_path))
+    for i in range(outbox_module.DIGEST_MAX_EVENTS * 2 + 1):
+        outbox.enqueue(f"事件 {i}", "正文")
+
+    outbox._flush()
+
+    assert [len(session) for session in transport.sessions] == [3]
+    assert outbox.pending_count() == 0
@@ -0,0 +1,18 @@
+import pytest
+
+import dns_cache
+import probe_utils
+
+
+@pytest.mark.parametrize('scheme', ['http', 'https'])
+def test_stdlib_fetch_connects_through_the_dns_cache(monkeypatch, scheme):
+    calls = []
+
+    def create_connection(address, timeout=None, source_address=None):
+        calls.append((address, source_address))
+        raise ConnectionRefusedError('refused')
+
+    monkeypatch.setattr(dns_cache, 'create_connection', create_connection)
+    with pytest.raises(ConnectionRefusedError):
+        probe_utils._stdlib_fetch('GET', f"{scheme}://probe.invalid:8443/", 1, source='172.30.1.2')
+    assert calls == [(('probe.invalid', 8443), ('172.30.1.2', 0))]
@@ -0,0 +1,86 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from retry_policy import (CappedRetriesPolicy, ConnectionState, ConnectionStateMachine, ExponentialBackoffPolicy,
+                          HighFrequencyPolicy, StayAggressivePolicy, create_policy)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_outage_bookkeeping_follows_transitions():
+    clock = FakeClock()
+    machine = ConnectionStateMachine(clock=clock)
+    seen = []
+    machine.add_listener(lambda old, new, ts: seen.append((old, new, ts)))
+
+    machine.transition(ConnectionState.OFFLINE)
+    clock.now += 30
+    machine.transition(ConnectionState.LOGGING_IN)
+    machine.transition(ConnectionState.OFFLINE)  # 登录失败，断网开始时间不变
+    machine.transition(ConnectionState.LOGGING_IN)
+    assert (machine.offline_since, machine.attempts, machine.offline_for()) == (1000.0, 2, 30.0)
+
+    machine.transition(ConnectionState.VERIFYING)
+    machine.transition(ConnectionState.ONLINE)
+    assert (machine.is_offline, machine.attempts, machine.offline_for()) == (False, 0, 0.0)
+    assert seen[0] == (ConnectionState.PROBING, ConnectionState.OFFLINE, 1000.0)
+    assert seen[-1][:2] == (ConnectionState.VERIFYING, ConnectionState.ONLINE)
+
+
+def test_same_state_is_a_no_op_and_unexpected_transitions_still_apply():
+    machine = ConnectionStateMachine(clock=FakeClock())
+    seen = []
+    machine.add_listener(lambda old, new, ts: seen.append(new))
+    machine.transition(ConnectionState.PROBING)
+    assert seen == []
+    # ONLINE -> OFFLINE 不在 TRANSITIONS 中：记录警告但仍然切换
+    machine.transition(ConnectionState.ONLINE)
+    assert machine.transition(ConnectionState.OFFLINE) is ConnectionState.ONLINE
+    assert machine.state is ConnectionState.OFFLINE and machine.is_offline
+
+
+def test_failing_listener_does_not_break_transition():
+    machine = ConnectionStateMachine(clock=FakeClock())
+    machine.add_listener(lambda old, new, ts: 1 / 0)
+    machine.transition(ConnectionState.OFFLINE)
+    assert machine.state is ConnectionState.OFFLINE
+
+
+def test_high_frequency_falls_back_after_duration():
+    policy = HighFrequencyPolicy(600, 5, 1800)
+    assert policy.next_delay(1, 0) == 5
+    assert policy.next_delay(50, 1799) == 5
+    assert policy.next_delay(50, 1800) == 600
+    assert policy.online_delay() == 600
+
+
+def test_backoff_doubles_up_to_cap_within_jitter():
+    policy = ExponentialBackoffPolicy(600, 5, 120, jitter=0.2, rng=random.Random(1))
+    for attempts, nominal in ((0, 5), (1, 5), (2, 10), (4, 40), (6, 120), (30, 120)):
+        assert nominal * 0.8 <= policy.next_delay(attempts, 0) <= nominal * 1.2
+    assert ExponentialBackoffPolicy(600, 5, 120, jitter=0).next_delay(3, 0) == 20
+
+
+def test_capped_and_aggressive_policies():
+    capped = CappedRetriesPolicy(600, 5, 3)
+    assert [capped.next_delay(n, 0) for n in (0, 2, 3, 10)] == [5, 5, 600, 600]
+    assert StayAggressivePolicy(600, 5).next_delay(1000, 86400) == 5
+
+
+def test_create_policy_reads_schedule_section():
+    schedule = SimpleNamespace(interval=10, high_frequency_interval=5, high_frequency_duration=30,
+                               backoff_base=5, backoff_max=120, backoff_jitter=0.1, max_retries=4)
+    policy = create_policy('backoff', schedule)
+    assert (policy.normal_interval, policy.base, policy.cap, policy.jitter) == (600, 5, 120, 0.1)
+    assert create_policy('high_frequency', schedule).duration == 1800
+    assert create_policy('capped', schedule).max_retries == 4
+    with pytest.raises(ValueError):
+        create_policy('nope', schedule)
@@ -0,0 +1,96 @@
+import threading
+
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_same_name_replaces_pending_entry():
+    clock = FakeClock()
+    scheduler = Scheduler(clock=clock)
+    try:
+        scheduler.schedule('check', 30, lambda: 'old')
+        scheduler.schedule('check', 5, lambda: 'new')
+        scheduler.schedule('other', 10, lambda: 'other')
+        assert scheduler.next_due('check') == 5
+
+        clock.now += 60
+        entry, _ = scheduler._next_ready()
+        assert entry[2] == 'check' and entry[3]() == 'new'
+        entry, _ = scheduler._next_ready()
+        assert entry[2] == 'other'
+        assert scheduler._next_ready() == (None, None)  # 被替换的旧条目不会再执行
+    finally:
+        scheduler.stop()
+
+
+def test_cancel_and_next_due():
+    clock = FakeClock()
+    scheduler = Scheduler(clock=clock)
+    try:
+        scheduler.schedule('relogin', 20, lambda: None)
+        clock.now += 5
+        assert scheduler.next_due('relogin') == 15
+        assert scheduler.cancel('relogin') is True
+        assert scheduler.cancel('relogin') is False
+        assert scheduler.next_due('relogin') is None
+        clock.now += 60
+        assert scheduler._next_ready() == (None, None)
+    finally:
+        scheduler.stop()
+
+
+def test_due_task_is_deferred_while_same_name_is_running():
+    clock = FakeClock()
+    scheduler = Scheduler(clock=clock)
+    try:
+        scheduler._running.add('check')
+        scheduler.schedule('check', 0, lambda: None)
+        scheduler.schedule('later', 7, lambda: None)
+        entry, timeout = scheduler._next_ready()
+        # 到期条目保留在堆中等同名任务结束 (结束时唤醒)，超时只按其他任务计算
+        assert entry is None and timeout == 7
+        assert scheduler.next_due('check') == 0
+        scheduler._running.discard('check')
+        entry, _ = scheduler._next_ready()
+        assert entry[2] == 'check'
+    finally:
+        scheduler.stop()
+
+
+def test_trigger_during_run_executes_again_afterwards_without_overlap():
+    scheduler = Scheduler(max_workers=4)
+    started, release, finished = threading.Event(), threading.Event(), threading.Event()
+    calls, active, overlap = [], [], []
+
+    def task(label):
+        if active:
+            overlap.append(label)
+        active.append(label)
+        calls.append(label)
+        if label == 'first':
+            started.set()
+            release.wait(5)
+        active.remove(label)
+        if label == 'second':
+            finished.set()
+
+    loop = threading.Thread(target=scheduler.run_forever, daemon=True)
+    loop.start()
+    try:
+        scheduler.trigger('check', task, 'first')
+        assert started.wait(5)
+        scheduler.trigger('check', task, 'second')  # 执行期间的触发不丢失，也不并发执行
+        release.set()
+        assert finished.wait(5)
+    finally:
+        scheduler.stop(wait=True)
+        loop.join(5)
+    assert calls == ['first', 'second']
+    assert overlap == []
@@ -0,0 +1,69 @@
+import time
+
+import main
+from retry_policy import ConnectionState, ConnectionStateMachine
+from session_predictor import SessionPredictor
+from settings import settings
+
+LIFETIME = 3600
+
+
+def test_consecutive_preemptions_start_new_sessions(monkeypatch, tmp_path):
+    now = [time.time()]
+    predictor = SessionPredictor('test', path=str(tmp_path / 'sessions.json'), min_samples=3, clock=lambda: now[0])
+    for i in range(3):
+        start = now[0] - (4 - i) * 2 * LIFETIME
+        predictor.session_started(start)
+        predictor.session_dropped(start + LIFETIME)
+    predictor.session_started(now[0])
+    state = ConnectionStateMachine()
+    state.transition(ConnectionState.ONLINE)
+    scheduled = []
+    monkeypatch.setattr(main, 'predictor', predictor)
+    monkeypatch.setattr(main, 'state', state)
+    monkeypatch.setattr(main, 'login_and_record', lambda relogin=False, login_admission=None: '172.30.1.2')
+    monkeypatch.setattr(main.scheduler, 'schedule', lambda name, delay, *args: scheduled.append(name))
+    monkeypatch.setattr(main.scheduler, 'cancel', lambda name: None)
+    monkeypatch.setattr(main.scheduler, 'next_due', lambda name: None)
+
+    for _ in range(2):
+        now[0] += LIFETIME - settings.session.preempt_margin
+        scheduled.clear()
+        main.preempt_session()
+        # 重新认证后记为新会话，并为它安排下一次主动重新认证
+        assert predictor.predicted_expiry() == now[0] + LIFETIME
+        assert main.PREEMPT_TASK in scheduled
+
+    # 主动结束的会话不计入寿命；之后真实掉线时记录的是最后一次重新认证以来的时长
+    assert predictor.lifetimes() == [LIFETIME] * 3
+    main.end_session(now[0] + 1800)
+    assert predictor.lifetimes() == [LIFETIME] * 3 + [1800]
+
+
+def _saved_predictor(path, start, now):
+    predictor = SessionPredictor('test', path=path, min_samples=3, clock=lambda: now)
+    for i in range(3):
+        predictor.session_started(start - (i + 1) * 3 * LIFETIME)
+        predictor.session_dropped(start - (i + 1) * 3 * LIFETIME + LIFETIME)
+    predictor.session_started(start)
+    return SessionPredictor('test', path=path, min_samples=3, clock=lambda: now)
+
+
+def test_saved_session_start_is_not_trusted_until_confirmed(tmp_path):
+    now = time.time()
+    path = str(tmp_path / 'sessions.json')
+    # 程序停止期间断网：第一次检查就离线，旧的开始时间不能用来计算寿命
+    predictor = _saved_predictor(path, now - 600, now)
+    assert predictor.predicted_expiry() is None
+    predictor.session_dropped(now)
+    assert predictor.lifetimes() == [LIFETIME] * 3
+
+    # 第一次检查确认在线且仍在典型寿命内：沿用旧的开始时间
+    predictor = _saved_predictor(path, now - 600, now)
+    assert predictor.resume_session()
+    assert predictor.predicted_expiry() == now - 600 + LIFETIME
+
+    # 已经超过典型寿命仍在线：中间换过会话，丢弃
+    predictor = _saved_predictor(path, now - 2 * LIFETIME, now)
+    assert not predictor.resume_session()
+    assert predictor.predicted_expiry() is None
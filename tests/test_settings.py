@@ -0,0 +1,89 @@
+import configparser
+import os
+import re
+
+import pytest
+
+import iface_utils
+import session_utils
+from outbox import Outbox
+from session_predictor import SessionPredictor
+from settings import ConfigError, parse, settings
+
+
+def load_config(**overrides):
+    """读取测试配置，overrides 为 {'节.键': 值}，值为 None 时删除该键。"""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(os.environ['SNAF_CONFIG'], encoding='utf-8')
+    for name, value in overrides.items():
+        section, key = name.split('.')
+        if value is None:
+            parser.remove_option(section, key)
+        else:
+            parser[section][key] = value
+    return parser
+
+
+def test_parse_converts_types_and_fills_defaults():
+    values = parse(load_config(**{'Email.smtp_port': ' 465 ', 'Network.probe_backend': 'STDLIB',
+                                  'Network.pool_size': None}))
+    assert values['Email']['smtp_port'] == 465
+    assert values['Network']['probe_backend'] == 'stdlib'
+    assert values['Network']['pool_size'] == 4
+    assert values['fleet']['entries'] == ()
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'Credentials.username': None}, '缺少必填配置项 [Credentials] username'),
+    ({'Email.receiver_email': '  '}, '缺少必填配置项 [Email] receiver_email'),
+    ({'Email.smtp_port': 'abc'}, '[Email] smtp_port 的值无效'),
+    ({'Email.smtp_port': '0'}, '[Email] smtp_port 不能小于 1'),
+    ({'schedule.link_watch': 'maybe'}, '[schedule] link_watch 的值无效'),
+    ({'dev.log_level': 'LOUD'}, '[dev] log_level 必须是'),
+    ({'Network.probe_backend': 'curl'}, '[Network] probe_backend 必须是'),
+    ({'Network.probe_quorum': '99'}, 'probe_quorum 不能大于探测目标数量'),
+    ({'quality.max_loss': '5'}, '[quality] max_loss 是比例'),
+])
+def test_parse_rejects_invalid_values(overrides, message):
+    with pytest.raises(ConfigError, match=re.escape(message)):
+        parse(load_config(**overrides))
+
+
+def test_parse_validates_fleet_sections():
+    parser = load_config()
+    parser['fleet:a'] = {'ip': '10.0.0.2'}
+    parser['fleet:b'] = {'ip': '10.0.0.2', 'username': 'other'}
+    with pytest.raises(ConfigError, match=re.escape('与 [fleet:a] 重复')):
+        parse(parser)
+    parser['fleet:b']['ip'] = '10.0.0.300'
+    with pytest.raises(ConfigError, match='不是有效的 IPv4 地址'):
+        parse(parser)
+    parser['fleet:b']['ip'] = '10.0.0.3'
+    a, b = parse(parser)['fleet']['entries']
+    assert (a.name, a.username) == ('a', parser['Credentials']['username'])
+    assert (b.username, b.ip) == ('other', '10.0.0.3')
+
+
+def test_malformed_text_is_a_config_error():
+    with pytest.raises(ConfigError, match='配置文件格式错误'):
+        parse('no section header')
+
+
+def test_reloadable_values_are_read_when_used(monkeypatch, tmp_path):
+    outbox = Outbox(spool_dir=str(tmp_path), sender=lambda *args, **kwargs: True)
+    predictor = SessionPredictor('test', path=str(tmp_path / 'sessions.json'))
+    pool = session_utils.PooledSession('test')
+    table = iface_utils.InterfaceTable()
+
+    monkeypatch.setattr(settings.email, 'coalesce_window', 42.0)
+    monkeypatch.setattr(settings.email, 'retry_max', 7.0)
+    monkeypatch.setattr(settings.session, 'min_samples', 9)
+    monkeypatch.setattr(settings.network, 'keepalive_idle', 11.0)
+    monkeypatch.setattr(settings.network, 'iface_cache_ttl', 13.0)
+
+    assert (outbox.coalesce_window, outbox.retry_max) == (42.0, 7.0)
+    assert predictor.min_samples == 9
+    assert pool.idle_timeout == 11.0
+    assert table.ttl == 13.0
+    # 显式传入的值不随配置变化
+    assert Outbox(spool_dir=str(tmp_path), coalesce_window=0).coalesce_window == 0
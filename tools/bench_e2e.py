@@ -0,0 +1,309 @@
+"""端到端基准：用本地 ePortal / SMTP 模拟器驱动真实的检查流水线 (main.job)，按脚本制造断网场景。
+
+测量:
+  - 断网检测耗时 (time-to-detect): 故障发生到状态机进入 offline
+  - 重连耗时 (time-to-reconnect): 故障发生 (网关故障场景为网关恢复) 到状态机回到 online
+  - 通知延迟: 回到 online 到 SMTP 模拟器收到通知邮件
+  - 探测吞吐: 两种 HTTP 后端下每秒完成的探测轮数
+  - 故障期间发往网关的登录请求数 (无效登录)
+
+场景:
+  expiry  网关把本机踢下线 (会话过期)，其余一切正常
+  outage  网关故障 (所有请求 502) --outage 秒后恢复，会话在故障中丢失
+  slow    网关每个请求延迟 --slow-latency 秒时的会话过期
+
+检查间隔、重试间隔和登录后验证延迟都缩短到秒级，结果用于比较调度器、探测和登录逻辑的改动，
+不代表真实环境中的绝对时间。不需要 src/config.ini：基准在临时目录生成配置 (通过 SNAF_CONFIG)。
+
+用法 (在仓库根目录):
+    python tools/bench_e2e.py                          # 全部场景各 5 次
+    python tools/bench_e2e.py --scenario outage --runs 10 --outage 8
+    python tools/bench_e2e.py --json bench.jsonl --max-reconnect-s 6
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(TOOLS_DIR), 'src')
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from simulators import PortalSimulator, SmtpSink  # noqa: E402
+
+SCENARIOS = ('expiry', 'outage', 'slow')
+
+CONFIG_TEMPLATE = """
+[Credentials]
+username = bench
+password = bench
+
+[Network]
+login_url = {portal}/eportal/portal/login
+status_url = {portal}/drcom/chkstatus
+probes = portal=auto, http204={portal}/generate_204
+probe_quorum = 2
+probe_timeout = {probe_timeout}
+probe_backend = {backend}
+
+[Email]
+sender_email = snaf@bench.local
+sender_password = bench
+receiver_email = admin@bench.local
+smtp_server = {smtp_host}
+smtp_port = {smtp_port}
+smtp_security = plain
+spool_dir = {tmp}/spool
+sink_dir = {tmp}/mail_sink
+retry_base = 1
+coalesce_window = 0
+
+[dev]
+log_level = {log_level}
+
+[schedule]
+link_watch = false
+config_reload = 0
+
+[session]
+predict = false
+history_file = {tmp}/session_history.json
+
+[login]
+jitter = {jitter}
+bucket_size = 100
+
+[history]
+db_file = {tmp}/history.db
+"""
+
+
+class Recorder:
+    """记录状态机的每次转换，并等待指定状态出现。"""
+
+    def __init__(self):
+        self.events = []
+        self._cond = threading.Condition()
+
+    def on_transition(self, old_state, new_state, timestamp):
+        with self._cond:
+            self.events.append((new_state.value, timestamp))
+            self._cond.notify_all()
+
+    def wait_for(self, state, after, timeout):
+        """返回 after 之后第一次进入 state 的时间，超时返回 None。"""
+        def found():
+            return next((ts for value, ts in self.events if value == state and ts >= after), None)
+        with self._cond:
+            self._cond.wait_for(lambda: found() is not None, timeout)
+            return found()
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix='snaf-bench-')
+        self.portal = PortalSimulator(seed=1).start()
+        self.sink = SmtpSink().start()
+        config = os.path.join(self.tmp, 'config.ini')
+        with open(config, 'w', encoding='utf-8') as f:
+            f.write(CONFIG_TEMPLATE.format(portal=self.portal.base_url, smtp_host=self.sink.address[0],
+                                           smtp_port=self.sink.address[1], tmp=self.tmp, backend=args.backend,
+                                           probe_timeout=args.probe_timeout, jitter=args.jitter,
+                                           log_level='INFO' if args.verbose else 'WARNING'))
+        os.environ['SNAF_CONFIG'] = config
+
+        # 导入真实的程序模块 (读取上面的临时配置)
+        self.snaf = importlib.import_module('main')
+        from settings import settings
+        from iface_utils import get_interfaces
+        from retry_policy import create_policy
+        self.settings = settings
+        self.probe_utils = importlib.import_module('probe_utils')
+
+        # 本机没有校园网地址：把本机第一个非回环地址当作校园网地址，模拟器把来自回环的请求视为该地址
+        addresses = [i.address for i in get_interfaces() if i.up and not i.address.startswith('127.')]
+        campus_ip = addresses[0] if addresses else '127.0.0.1'
+        if not addresses:
+            settings.schedule.diagnose = False  # 只有回环接口时诊断会判为链路断开
+        settings.network.campus_prefix = campus_ip
+        self.portal.default_ip = campus_ip
+
+        schedule = types.SimpleNamespace(interval=args.interval / 60, high_frequency_interval=args.retry_interval,
+                                         high_frequency_duration=60)
+        self.snaf.policy = create_policy('high_frequency', schedule)
+        self.snaf.VERIFY_DELAY = args.verify_delay
+        self.recorder = Recorder()
+        self.snaf.state.add_listener(self.recorder.on_transition)
+
+    def start(self):
+        snaf = self.snaf
+        snaf.outbox.start()
+        threading.Thread(target=snaf.scheduler.run_forever, name='bench-scheduler', daemon=True).start()
+        snaf.scheduler.trigger(snaf.CHECK_TASK, snaf.job)
+        if self.recorder.wait_for('online', 0, self.args.timeout) is None:
+            sys.exit("初始登录未能在超时内完成，请用 --verbose 查看日志。")
+        self.sink.wait_for(1, self.args.timeout)  # 首次连接成功通知
+
+    def close(self):
+        snaf = self.snaf
+        snaf.scheduler.stop()
+        snaf.outbox.stop()
+        if snaf.history is not None:
+            snaf.history.close()
+        self.portal.stop()
+        self.sink.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _wait_online(self, after):
+        return self.recorder.wait_for('online', after, self.args.timeout)
+
+    def _notify_latency(self, mails_before, online_at):
+        if not self.sink.wait_for(mails_before + 1, self.args.timeout):
+            return None
+        return self.sink.messages[mails_before].received - online_at
+
+    def _measure(self, fault, recover=None):
+        """执行一次故障：fault() 制造故障，recover() (可选) 在进入 offline 后等待并恢复。"""
+        time.sleep(self.args.settle)
+        mails = len(self.sink.messages)
+        logins = self.portal.stats['/eportal/portal/login']
+        start = time.time()
+        fault()
+        offline_at = self.recorder.wait_for('offline', start, self.args.timeout)
+        if offline_at is None:
+            return None
+        restored = start
+        if recover is not None:
+            restored = recover()
+        futile = self.portal.stats['/eportal/portal/login'] - logins
+        online_at = self._wait_online(restored)
+        if online_at is None:
+            return None
+        return {
+            'detect_s': offline_at - start,
+            'reconnect_s': online_at - restored,
+            'notify_s': self._notify_latency(mails, online_at),
+            'logins': futile if recover is not None else self.portal.stats['/eportal/portal/login'] - logins,
+        }
+
+    def scenario_expiry(self):
+        return self._measure(self.portal.expire)
+
+    def scenario_outage(self):
+        def recover():
+            time.sleep(self.args.outage)
+            self.portal.set_outage(None)
+            return time.time()
+        return self._measure(self.portal.set_outage, recover)
+
+    def scenario_slow(self):
+        self.portal.latency = self.args.slow_latency
+        try:
+            return self._measure(self.portal.expire)
+        finally:
+            self.portal.latency = 0.0
+
+    def probe_throughput(self, backend, seconds):
+        """在线状态下连续执行探测轮，返回 (每秒轮数, 每秒探测数)。"""
+        self.settings.network.probe_backend = backend
+        probes = self.probe_utils.PROBES
+        rounds = 0
+        deadline = time.perf_counter() + seconds
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            self.probe_utils.run_probes(probes)
+            rounds += 1
+        elapsed = time.perf_counter() - start
+        return rounds / elapsed, rounds * len(probes) / elapsed
+
+
+def summarize(samples, key):
+    values = sorted(s[key] for s in samples if s is not None and s[key] is not None)
+    if not values:
+        return None
+    return {'median': statistics.median(values), 'p90': values[min(len(values) - 1, int(len(values) * 0.9))],
+            'max': values[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snaf 端到端基准 (本地 ePortal / SMTP 模拟器)')
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--runs', type=int, default=5, help='每个场景重复次数')
+    parser.add_argument('--interval', type=float, default=3, help='在线时的检查间隔 (秒)')
+    parser.add_argument('--retry-interval', type=float, default=1, help='断网时的重试间隔 (秒)')
+    parser.add_argument('--verify-delay', type=float, default=0.5, help='登录后等待验证的秒数')
+    parser.add_argument('--outage', type=float, default=5, help='outage 场景的网关故障持续秒数')
+    parser.add_argument('--slow-latency', type=float, default=1.0, help='slow 场景的网关延迟 (秒)')
+    parser.add_argument('--settle', type=float, default=0.5, help='每次故障前等待的秒数')
+    parser.add_argument('--jitter', type=float, default=0, help='[login] jitter (秒)')
+    parser.add_argument('--backend', choices=('requests', 'stdlib'), default='stdlib', help='场景中使用的探测后端')
+    parser.add_argument('--probe-timeout', type=float, default=1.0)
+    parser.add_argument('--probe-seconds', type=float, default=3, help='每种后端的探测吞吐测量秒数，0 表示跳过')
+    parser.add_argument('--timeout', type=float, default=60, help='等待单个状态变化的上限 (秒)')
+    parser.add_argument('--max-reconnect-s', type=float, help='各场景重连耗时中位数的预算 (秒)')
+    parser.add_argument('--json', metavar='FILE', help='把结果追加到 JSON lines 文件')
+    parser.add_argument('--verbose', action='store_true', help='输出程序的 INFO 日志')
+    args = parser.parse_args()
+
+    bench = Bench(args)
+    results = {}
+    try:
+        bench.start()
+        scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+        for name in scenarios:
+            samples = [getattr(bench, f"scenario_{name}")() for _ in range(args.runs)]
+            failed = sum(1 for s in samples if s is None)
+            results[name] = {key: summarize(samples, key) for key in ('detect_s', 'reconnect_s', 'notify_s', 'logins')}
+            results[name]['failed'] = failed
+        if args.probe_seconds > 0:
+            for backend in ('stdlib', 'requests'):
+                rounds, probes = bench.probe_throughput(backend, args.probe_seconds)
+                results[f"probe_{backend}"] = {'rounds_per_s': rounds, 'probes_per_s': probes}
+        peak_logins = bench.portal.max_in_flight
+    finally:
+        bench.close()
+
+    labels = {'detect_s': '检测', 'reconnect_s': '重连', 'notify_s': '通知'}
+    for name in SCENARIOS:
+        if name not in results:
+            continue
+        row = results[name]
+        parts = []
+        for key, label in labels.items():
+            stats = row[key]
+            parts.append(f"{label} {stats['median']:.2f}/{stats['p90']:.2f}/{stats['max']:.2f}s" if stats else f"{label} -")
+        logins = row['logins']
+        parts.append(f"登录请求 {logins['median']:.0f}/{logins['max']:.0f}" if logins else "登录请求 -")
+        print(f"{name:7s} (中位数/p90/最大, {args.runs} 次, 失败 {row['failed']}): {'  '.join(parts)}")
+    for backend in ('stdlib', 'requests'):
+        row = results.get(f"probe_{backend}")
+        if row:
+            print(f"探测吞吐 [{backend}]: {row['rounds_per_s']:.0f} 轮/秒, {row['probes_per_s']:.0f} 探测/秒")
+    print(f"网关同时处理的登录请求峰值: {peak_logins}")
+
+    if args.json:
+        record = {'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args), 'results': results}
+        with open(args.json, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    failures = [f"{name} 有 {row['failed']} 次未能完成" for name, row in results.items() if row.get('failed')]
+    if args.max_reconnect_s is not None:
+        failures += [f"{name} 重连中位数 {row['reconnect_s']['median']:.2f}s 超出预算 {args.max_reconnect_s:.2f}s"
+                     for name, row in results.items()
+                     if row.get('reconnect_s') and row['reconnect_s']['median'] > args.max_reconnect_s]
+    for failure in failures:
+        print(f"失败: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""启动耗时与常驻内存基准。
+
+在独立的子进程中冷启动导入 main (与打包后的程序启动时做的事情相同：读取配置、初始化日志、
+发件箱、事件库等)，测量从进程创建到导入完成的时间和稳定后的 RSS，并列出已加载的重量级模块。
+给出预算时超出即以非零状态退出，可放进打包前的检查流程里跟踪回归。
+
+用法 (在仓库根目录):
+    python tools/bench_startup.py                          # 默认 5 次，输出中位数
+    python tools/bench_startup.py --backend stdlib --probe # 精简模式，并执行一次真实探测
+    python tools/bench_startup.py --max-start-ms 600 --max-rss-mb 30 --lean
+    python tools/bench_startup.py --importtime 15          # 列出累计耗时最高的 15 个导入
+    python tools/bench_startup.py --json bench.jsonl       # 追加一行 JSON 结果，便于长期对比
+
+注意: 导入 main 会像正常启动一样在 src 目录下创建 logs/、spool/ 等文件，需要 src/config.ini。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# 精简模式下启动时不应加载的模块
+HEAVY_MODULES = ('requests', 'urllib3', 'charset_normalizer', 'idna', 'certifi',
+                 'smtplib', 'email.mime.text', 'ssl', 'http.client', 'sqlite3')
+LEAN_FORBIDDEN = ('requests', 'urllib3', 'charset_normalizer', 'smtplib', 'email.mime.text')
+
+# 子进程执行的代码：导入 main，可选执行一次探测，等待片刻后报告 RSS 和已加载模块
+CHILD = r'''
+import json, os, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, os.getcwd())
+import settings
+if {backend!r}:
+    settings.settings.network.probe_backend = {backend!r}
+import main
+import_ms = (time.perf_counter() - t0) * 1000
+if {probe!r}:
+    import probe_utils
+    probe_utils.run_probes()
+time.sleep({settle!r})
+
+
+def rss_bytes():
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+print(json.dumps({{'import_ms': import_ms, 'rss': rss_bytes(), 'modules': len(sys.modules),
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}), flush=True)
+'''
+
+
+def run_once(args):
+    code = CHILD.format(backend=args.backend, probe=args.probe, settle=args.settle, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=SRC_DIR, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    line = proc.stdout.readline()
+    start_ms = (time.perf_counter() - start) * 1000 - args.settle * 1000
+    proc.wait()
+    if not line:
+        sys.exit(f"子进程没有输出结果 (退出码 {proc.returncode})，请确认 {SRC_DIR}/config.ini 存在且有效。")
+    result = json.loads(line)
+    result['start_ms'] = start_ms
+    return result
+
+
+def import_profile(top):
+    """用 -X importtime 列出累计耗时最高的导入。"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=SRC_DIR,
+                          capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snaf 启动耗时与内存基准')
+    parser.add_argument('--runs', type=int, default=5, help='冷启动次数 (取中位数)')
+    parser.add_argument('--backend', choices=('requests', 'stdlib'), default=None,
+                        help='覆盖 [Network] probe_backend')
+    parser.add_argument('--probe', action='store_true', help='导入后执行一次真实探测再测内存')
+    parser.add_argument('--settle', type=float, default=1.0, help='测量 RSS 前等待的秒数')
+    parser.add_argument('--max-start-ms', type=float, help='冷启动耗时预算 (毫秒)')
+    parser.add_argument('--max-rss-mb', type=float, help='常驻内存预算 (MB)')
+    parser.add_argument('--lean', action='store_true', help='要求启动时不加载 requests/smtplib 等模块')
+    parser.add_argument('--importtime', type=int, metavar='N', help='额外列出累计耗时最高的 N 个导入')
+    parser.add_argument('--json', metavar='FILE', help='把结果追加到 JSON lines 文件')
+    args = parser.parse_args()
+
+    results = [run_once(args) for _ in range(args.runs)]
+    start_ms = statistics.median(r['start_ms'] for r in results)
+    import_ms = statistics.median(r['import_ms'] for r in results)
+    rss_mb = statistics.median(r['rss'] for r in results) / 1024 / 1024
+    heavy = results[-1]['heavy']
+
+    print(f"冷启动 (进程创建到导入完成): {start_ms:.0f} ms  (其中导入 main: {import_ms:.0f} ms, {args.runs} 次中位数)")
+    print(f"常驻内存 (RSS): {rss_mb:.1f} MB, 已加载模块 {results[-1]['modules']} 个")
+    print(f"已加载的重量级模块: {', '.join(heavy) or '无'}")
+    if args.importtime:
+        print("累计导入耗时最高的模块:")
+        import_profile(args.importtime)
+
+    if args.json:
+        record = {'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'backend': args.backend, 'probe': args.probe,
+                  'start_ms': round(start_ms, 1), 'import_ms': round(import_ms, 1), 'rss_mb': round(rss_mb, 2),
+                  'heavy': heavy}
+        with open(args.json, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    failures = []
+    if args.max_start_ms is not None and start_ms > args.max_start_ms:
+        failures.append(f"冷启动 {start_ms:.0f} ms 超出预算 {args.max_start_ms:.0f} ms")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB 超出预算 {args.max_rss_mb:.1f} MB")
+    if args.lean:
+        loaded = [m for m in LEAN_FORBIDDEN if m in heavy]
+        if loaded:
+            failures.append(f"精简模式下启动时加载了: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"失败: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""重连策略离线模拟器：用记录下来的断网历史在虚拟时间中回放不同的检查/重连参数。
+
+从事件库 (history.db)、旧版日志 (logs/app.log*) 或断网轨迹文件中还原每次断网，再按检查流水线
+(探测 -> 诊断 -> 登录准入 -> 登录 -> 验证) 的决策逻辑在虚拟时间中重放：使用真实的
+ConnectionStateMachine、create_policy 和 LoginAdmission (虚拟时钟 + 固定随机种子)，
+不发出任何网络请求，一个月的历史只需不到一秒。输出每组参数的预期断网时间、检测延迟、
+探测次数、发往 Portal 的登录请求数和邮件数，用数据而不是在生产机器上试验来选择参数。
+
+断网事件的模型 (轨迹文件每行一个 JSON 对象):
+    {"start": "2026-09-01 08:00:00", "recover": "2026-09-01 08:03:00", "login": true}
+    start   - 断网开始时间 (ISO 格式或 Unix 秒)
+    recover - login=true 时为 Portal 开始接受登录的时间 (会话过期等情况与 start 相同)；
+              login=false 时为网络自行恢复的时间 (上游故障，登录无济于事)
+从历史还原时，断网开始取最后一次成功检查与第一次失败检查的中点；成功登录之前有失败登录时，
+Portal 恢复时间取最后一次失败与第一次成功登录的中点，没有成功登录而自行恢复的断网记为 login=false。
+
+用法 (在仓库根目录):
+    python tools/policy_sim.py                                   # 读取 src/history.db，对比当前配置和四种策略
+    python tools/policy_sim.py --log src/logs/app.log*           # 从旧版日志还原
+    python tools/policy_sim.py --synthetic 30                    # 没有历史时生成 30 天的模拟断网
+    python tools/policy_sim.py --variant high_frequency:interval=5,high_frequency_interval=15 \\
+                               --variant backoff:backoff_base=5,diagnose=false
+    python tools/policy_sim.py --export-trace trace.jsonl        # 导出还原的断网轨迹，可手工修改后用 --trace 回放
+    python tools/policy_sim.py --trace trace.jsonl --json sim.jsonl
+
+变体写成 策略名[:键=值,...]，键为 [schedule] 中的选项 (interval 单位为分钟，与 config.ini 相同)。
+"""
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+import types
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+sys.path.insert(0, SRC_DIR)
+if not os.environ.get('SNAF_CONFIG') and not os.path.exists(os.path.join(SRC_DIR, 'config.ini')):
+    os.environ['SNAF_CONFIG'] = os.path.join(ROOT_DIR, 'config.ini')  # 只读取 [schedule]/[login] 等参数
+
+from settings import settings  # noqa: E402
+from logger_config import logger  # noqa: E402
+from event_store import EventStore  # noqa: E402
+from retry_policy import ConnectionState, ConnectionStateMachine, create_policy  # noqa: E402
+from login_admission import LoginAdmission  # noqa: E402
+from network_utils import PortalCode, PortalResult  # noqa: E402
+import probe_utils  # noqa: E402
+
+VERIFY_DELAY = 5  # 与 main.VERIFY_DELAY 相同
+POLICIES = ('high_frequency', 'backoff', 'capped', 'aggressive')
+
+
+class Incident(types.SimpleNamespace):
+    """一次断网：start (秒)、recover (秒)、login (是否需要登录才能恢复)。"""
+
+
+# --- 还原断网历史 --- START
+def incidents_from_events(events):
+    """从按时间排序的 [(ts_ms, kind, ok)] (kind 为 probe/login) 还原断网事件。"""
+    incidents = []
+    last_ok = None
+    outage = None  # 进行中的断网: dict
+    for ts_ms, kind, ok in events:
+        ts = ts_ms / 1000
+        if kind == 'probe':
+            if ok:
+                if outage is not None:
+                    incidents.append(_close(outage, ts))
+                    outage = None
+                last_ok = ts
+            elif outage is None:
+                start = ts if last_ok is None else (last_ok + ts) / 2
+                outage = {'start': start, 'last_fail': ts, 'last_login_fail': None, 'login_ok': None}
+            else:
+                outage['last_fail'] = ts
+        elif kind == 'login' and outage is not None:
+            if ok and outage['login_ok'] is None:
+                outage['login_ok'] = ts
+            elif not ok and outage['login_ok'] is None:
+                outage['last_login_fail'] = ts
+    return incidents
+
+
+def _close(outage, ts):
+    if outage['login_ok'] is not None:
+        failed = outage['last_login_fail']
+        recover = outage['start'] if failed is None else (failed + outage['login_ok']) / 2
+        return Incident(start=outage['start'], recover=recover, login=True)
+    return Incident(start=outage['start'], recover=(outage['last_fail'] + ts) / 2, login=False)
+
+
+def _parse_time(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return time.mktime(time.strptime(value[:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S'))
+
+
+def load_trace(path):
+    incidents = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                incidents.append(Incident(start=_parse_time(entry['start']), recover=_parse_time(entry['recover']),
+                                          login=bool(entry.get('login', True))))
+    return incidents
+
+
+def export_trace(incidents, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for incident in incidents:
+            f.write(json.dumps({'start': _format(incident.start), 'recover': _format(incident.recover),
+                                'login': incident.login}, ensure_ascii=False) + '\n')
+
+
+def synthetic(days, seed, session_hours=24, outages_per_day=1.0):
+    """生成 days 天的模拟断网：会话每 session_hours 小时左右过期 (需要登录)，
+    另有泊松分布的网关故障 (一半需要登录，Portal 数分钟后恢复) 和上游故障 (自行恢复)。"""
+    rng = random.Random(seed)
+    start = time.time() - days * 86400
+    incidents = []
+    t = start + rng.uniform(0, session_hours * 3600)
+    while t < start + days * 86400:
+        incidents.append(Incident(start=t, recover=t, login=True))
+        t += session_hours * 3600 * rng.uniform(0.9, 1.1)
+    t = start
+    while True:
+        t += rng.expovariate(outages_per_day / 86400)
+        if t >= start + days * 86400:
+            break
+        length = rng.lognormvariate(math.log(180), 1.0)
+        incidents.append(Incident(start=t, recover=t + length, login=rng.random() < 0.5))
+    return _merge(incidents), (start, start + days * 86400)
+
+
+def _merge(incidents):
+    """按开始时间排序，重叠的断网合并为一次 (任一需要登录则合并后也需要登录)。"""
+    merged = []
+    for incident in sorted(incidents, key=lambda i: i.start):
+        if merged and incident.start <= max(merged[-1].recover, merged[-1].start):
+            last = merged[-1]
+            last.recover = max(last.recover, incident.recover)
+            last.login = last.login or incident.login
+        else:
+            merged.append(Incident(**vars(incident)))
+    return merged
+# --- 还原断网历史 --- END
+
+
+# --- 虚拟时间回放 --- START
+class VirtualClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def base_schedule():
+    return {k: v for k, v in vars(settings.schedule).items() if not k.startswith('_')}
+
+
+def parse_variant(spec):
+    """'策略名[:键=值,...]' -> (标签, 策略名, [schedule] 参数)。"""
+    name, _, overrides = spec.partition(':')
+    if name not in POLICIES:
+        raise ValueError(f"未知的重连策略: {name} (可选: {', '.join(POLICIES)})")
+    schedule = base_schedule()
+    for item in filter(None, (s.strip() for s in overrides.split(','))):
+        key, sep, raw = item.partition('=')
+        if not sep or key not in schedule:
+            raise ValueError(f"无法识别的 [schedule] 参数: {item}")
+        current = schedule[key]
+        if isinstance(current, bool):
+            schedule[key] = raw.strip().lower() in ('1', 'true', 'yes', 'on')
+        else:
+            schedule[key] = type(current)(raw)
+    schedule['retry_policy'] = name
+    return spec, name, schedule
+
+
+class Replay:
+    """在虚拟时间中按检查流水线的决策逻辑重放一组断网，统计代价。
+
+    与 main.job() 的对应关系：在线 -> 按 online_delay 检查；断网 -> 记录断网 (通知进入发件箱)，
+    诊断判断登录无用时跳过登录，否则经过登录准入后登录，成功后 VERIFY_DELAY 秒验证；
+    发件箱在断网期间暂存通知，恢复后合并为一封邮件发送。
+    """
+
+    def __init__(self, incidents, window, policy_name, schedule, seed):
+        self.incidents = incidents
+        self.window = window
+        self.diagnose = schedule['diagnose']
+        self.clock = VirtualClock(window[0])
+        self.state = ConnectionStateMachine(clock=self.clock)
+        self.policy = create_policy(policy_name, types.SimpleNamespace(**schedule), rng=random.Random(seed))
+        self.admission = LoginAdmission(clock=self.clock, rng=random.Random(seed + 1))
+        self.probes_per_check = len(probe_utils.PROBES)
+        self.checks = self.logins = self.failed_logins = self.emails = self.notifications = 0
+        self.pending_notifications = 0
+        self.downtime = 0.0
+        self.detect = []     # 断网开始 -> 发现
+        self.restore = []    # 断网开始 -> 网络实际恢复
+        self.undetected = 0  # 两次检查之间自行恢复、没有被发现的断网
+
+    def _notify(self):
+        self.notifications += 1
+        self.pending_notifications += 1
+
+    def _flush(self):
+        if self.pending_notifications:
+            self.emails += 1  # 恢复时发件箱把断网期间的通知合并成一封
+            self.pending_notifications = 0
+
+    def _restored(self, incident, at):
+        self.downtime += at - incident.start
+        self.restore.append(at - incident.start)
+
+    def run(self):
+        end = self.window[1]
+        index, active, detected = 0, None, False
+        t = self.window[0]
+        while t < end:
+            self.clock.now = t
+            # 激活到 t 为止已经开始的断网；两次检查之间已自行恢复的断网不会被发现
+            while active is None and index < len(self.incidents) and self.incidents[index].start <= t:
+                incident = self.incidents[index]
+                index += 1
+                if not incident.login and incident.recover <= t:
+                    self._restored(incident, incident.recover)
+                    self.undetected += 1
+                else:
+                    active, detected = incident, False
+            if active is not None and not active.login and active.recover <= t:
+                self._restored(active, active.recover)
+                active = None
+            t, restored = self._check(t, active, detected)
+            if restored:
+                active = None
+            elif active is not None:
+                detected = True
+        return self
+
+    def _check(self, t, active, detected):
+        """执行一次检查，返回 (下一次检查的时间, 本次是否通过登录恢复了网络)。"""
+        self.checks += 1
+        if active is None:
+            if self.state.is_offline:
+                self._notify()  # 网络已恢复 (无需重新登录)
+                self._notify()  # 连接成功
+                self._flush()
+                self.admission.reset()
+            self.state.transition(ConnectionState.ONLINE)
+            return t + self.policy.online_delay(), False
+
+        if not detected:
+            self.detect.append(t - active.start)
+            self._notify()  # 断开通知，暂存在发件箱
+        self.state.transition(ConnectionState.OFFLINE)
+        portal_up = active.login and t >= active.recover
+        if self.diagnose and not portal_up:
+            return t + self._retry_delay(), False  # 诊断为网关不可达或上游故障，跳过登录
+        wait, _ = self.admission.acquire()
+        if wait > 0:
+            return t + wait, False
+        self.state.transition(ConnectionState.LOGGING_IN)
+        self.logins += 1
+        if not portal_up:
+            self.failed_logins += 1
+            self.admission.release(PortalResult(PortalCode.NETWORK_ERROR, '网关不可达', None, None))
+            self.state.transition(ConnectionState.OFFLINE)
+            return t + self._retry_delay(), False
+        self.admission.release(PortalResult(PortalCode.SUCCESS, '', None, None))
+        self._restored(active, t)
+        # VERIFY_DELAY 秒后的验证检查确认恢复，重连通知与断网期间的通知合并发送
+        self.state.transition(ConnectionState.VERIFYING)
+        self.clock.now = t + VERIFY_DELAY
+        self.checks += 1
+        self.state.transition(ConnectionState.ONLINE)
+        self.admission.reset()
+        self._notify()
+        self._flush()
+        return t + VERIFY_DELAY + self.policy.online_delay(), True
+
+    def _retry_delay(self):
+        return self.admission.spread(self.policy.next_delay(self.state.attempts, self.state.offline_for()))
+
+    def summary(self, label):
+        return {
+            'variant': label,
+            'downtime_min': round(self.downtime / 60, 1),
+            'detect_p50_s': _percentile(self.detect, 50),
+            'detect_p95_s': _percentile(self.detect, 95),
+            'restore_p95_s': _percentile(self.restore, 95),
+            'checks': self.checks,
+            'probes': self.checks * self.probes_per_check,
+            'logins': self.logins,
+            'failed_logins': self.failed_logins,
+            'emails': self.emails,
+            'undetected': self.undetected,
+        }
+# --- 虚拟时间回放 --- END
+
+
+def _percentile(values, percentile):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))], 1)
+
+
+def _format(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+
+
+def load_incidents(args):
+    """按命令行参数读取断网历史，返回 (断网列表, (开始, 结束))。"""
+    if args.synthetic:
+        return synthetic(args.synthetic, args.seed)
+    if args.trace:
+        incidents = _merge(load_trace(args.trace))
+    else:
+        if args.log:
+            store = EventStore(':memory:')
+            paths = [p for pattern in args.log for p in glob.glob(pattern)]
+            store.import_logs(paths)
+        elif os.path.exists(args.db):
+            store = EventStore(args.db)
+        else:
+            raise SystemExit(f"找不到事件库 {args.db}，可改用 --log、--trace 或 --synthetic。")
+        events = store.events(days=args.days)
+        store.close()
+        incidents = _merge(incidents_from_events(events))
+        if events:
+            return incidents, (events[0][0] / 1000, events[-1][0] / 1000)
+    if not incidents:
+        return [], (0.0, 0.0)
+    return incidents, (incidents[0].start, max(i.recover for i in incidents) + 3600)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='用记录的断网历史离线对比检查/重连参数')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--db', default=settings.history.db_file, help='事件库路径 (默认 [history] db_file)')
+    source.add_argument('--log', nargs='+', help='旧版日志文件 (支持通配符和 .gz)')
+    source.add_argument('--trace', help='断网轨迹文件 (JSON 行)')
+    source.add_argument('--synthetic', type=float, metavar='DAYS', help='生成 DAYS 天的模拟断网')
+    parser.add_argument('--days', type=float, default=None, help='只回放最近 N 天的历史')
+    parser.add_argument('--variant', action='append', default=[], help='策略名[:键=值,...]，可重复')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子 (抖动和模拟断网)')
+    parser.add_argument('--export-trace', metavar='FILE', help='把还原的断网轨迹写入文件')
+    parser.add_argument('--json', metavar='FILE', help='把每个变体的结果追加为一行 JSON')
+    args = parser.parse_args(argv)
+    logger.setLevel(logging.ERROR)  # 回放中的状态变化和准入判定不写日志
+
+    incidents, window = load_incidents(args)
+    if not incidents:
+        print('没有可回放的断网记录。')
+        return 1
+    if args.export_trace:
+        export_trace(incidents, args.export_trace)
+
+    current = settings.schedule.retry_policy
+    variants = args.variant or [current] + [name for name in POLICIES if name != current]
+    try:
+        variants = [parse_variant(spec) for spec in variants]
+    except ValueError as e:
+        parser.error(str(e))
+
+    days = (window[1] - window[0]) / 86400
+    ideal = sum(i.recover - i.start for i in incidents)
+    print(f"回放 {_format(window[0])} -> {_format(window[1])} ({days:.1f} 天)，{len(incidents)} 次断网 "
+          f"(需要登录 {sum(i.login for i in incidents)} 次)，不可避免的断网时间 {ideal / 60:.1f} 分钟")
+    width = max(len(label) for label, _, _ in variants)
+    header = ('断网(分钟)', '发现p50/p95(秒)', '恢复p95(秒)', '检查', '探测', '登录(失败)', '邮件')
+    print(f"{'变体':<{width}}  " + '  '.join(f"{h:>12}" for h in header))
+    for label, name, schedule in variants:
+        started = time.perf_counter()
+        result = Replay(incidents, window, name, schedule, args.seed).run().summary(label)
+        result['sim_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"{label:<{width}}  " + '  '.join(f"{v:>12}" for v in (
+            result['downtime_min'], f"{result['detect_p50_s']}/{result['detect_p95_s']}",
+            result['restore_p95_s'], result['checks'], result['probes'],
+            f"{result['logins']}({result['failed_logins']})", result['emails'])))
+        if args.json:
+            with open(args.json, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(result, days=round(days, 2)), ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
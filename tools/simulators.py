@@ -0,0 +1,331 @@
+"""本地 ePortal 与 SMTP 模拟器。
+
+PortalSimulator 模拟 Dr.COM ePortal 的登录/注销/状态查询接口 (返回 dr1003(...) / dr1002(...) JSONP)
+和外网 generate_204 探测地址，可配置响应延迟、随机 502、"已经在线" 答复、会话过期和网关故障。
+SmtpSink 是一个接受任意认证的最小 SMTP 服务器，记录收到的每封邮件及时间。
+二者只使用标准库，供 tools/bench_e2e.py 驱动，也可以单独运行，把 config.ini 指向它们手工调试:
+
+    python tools/simulators.py --portal-port 8080 --smtp-port 2525 --latency 0.2 --error-rate 0.1
+
+对应的 config.ini:
+    login_url = http://127.0.0.1:8080/eportal/portal/login
+    status_url = http://127.0.0.1:8080/drcom/chkstatus
+    probes = portal=auto, http204=http://127.0.0.1:8080/generate_204
+    smtp_server = 127.0.0.1 / smtp_port = 2525 / smtp_security = plain
+"""
+import argparse
+import base64
+import collections
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Dr.COM 的常见答复
+LOGIN_OK = {'result': '1', 'msg': 'Portal协议认证成功！'}
+LOGOUT_OK = {'result': '1', 'msg': 'Radius注销成功！'}
+BAD_PASSWORD = {'result': '0', 'msg': base64.b64encode(b'ldap auth error').decode(), 'ret_code': 1}
+
+
+class PortalSimulator:
+    """Dr.COM ePortal 的本地替身。
+
+    会话按登录请求中的 wlan_user_ip 记录；状态查询和 generate_204 按请求来源地址判断是否在线，
+    来源是本机回环地址时使用 default_ip (基准测试中为本机的 "校园网地址")。
+    以下属性可在运行中修改，用于编排故障场景:
+        latency      每个请求的额外延迟 (秒)
+        error_rate   登录请求随机返回 502 的概率
+        outage       不为 None 时所有请求返回该 HTTP 状态码 (模拟网关故障)
+        session_ttl  会话寿命 (秒)，None 表示不过期
+        accounts     {账号: 密码}，为 None 时接受任意账号
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, session_ttl=None,
+                 accounts=None, default_ip=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.accounts = accounts
+        self.default_ip = default_ip
+        self.outage = None
+        self.rng = random.Random(seed)
+        self.sessions = {}  # ip -> (账号, 登录时间)
+        self.stats = collections.Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0  # 同时处理中的登录请求数峰值
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='portal-sim', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- 场景编排 ---
+    def expire(self, ip=None):
+        """让指定 IP (默认全部) 的会话立即下线，模拟 Portal 定时踢人。"""
+        with self._lock:
+            if ip is None:
+                self.sessions.clear()
+            else:
+                self.sessions.pop(ip, None)
+
+    def set_outage(self, status=502, drop_sessions=True):
+        """网关故障: 所有请求返回 status；status 为 None 时恢复。"""
+        with self._lock:
+            self.outage = status
+            if status is not None and drop_sessions:
+                self.sessions.clear()
+
+    def online(self, ip):
+        with self._lock:
+            session = self.sessions.get(ip)
+            if session is None:
+                return None
+            if self.session_ttl is not None and time.time() - session[1] >= self.session_ttl:
+                del self.sessions[ip]
+                self.stats['expired'] += 1
+                return None
+            return session[0]
+
+    # --- 请求处理 ---
+    def _login(self, query):
+        ip = query.get('wlan_user_ip', '')
+        account = query.get('user_account', '').rsplit(',', 1)[-1]
+        if self.rng.random() < self.error_rate:
+            self.stats['login_502'] += 1
+            return 502, None
+        if self.accounts is not None and self.accounts.get(account) != query.get('user_password'):
+            self.stats['login_rejected'] += 1
+            return 200, BAD_PASSWORD
+        if self.online(ip):
+            self.stats['login_already_online'] += 1
+            return 200, {'result': '0', 'msg': f'IP: {ip} 已经在线！', 'ret_code': 2}
+        with self._lock:
+            self.sessions[ip] = (account, time.time())
+        self.stats['login_ok'] += 1
+        return 200, LOGIN_OK
+
+    def _logout(self, query):
+        self.expire(query.get('wlan_user_ip'))
+        self.stats['logout'] += 1
+        return 200, LOGOUT_OK
+
+    def _status(self, ip):
+        account = self.online(ip)
+        if account is None:
+            return 200, {'result': 0, 'v46ip': ip}
+        return 200, {'result': 1, 'uid': account, 'v46ip': ip}
+
+    def _handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # 支持长连接，探测后端会复用连接
+            wbufsize = -1  # 响应头和响应体合并发送，避免 Nagle 与延迟确认叠加出 40 ms 的停顿
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body=b'', headers=()):
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+                client_ip = self.client_address[0]
+                if client_ip.startswith('127.') and simulator.default_ip:
+                    client_ip = simulator.default_ip
+                simulator.stats[parts.path] += 1
+                is_login = parts.path.endswith('/login')
+                if is_login:
+                    with simulator._lock:
+                        simulator.in_flight += 1
+                        simulator.max_in_flight = max(simulator.max_in_flight, simulator.in_flight)
+                try:
+                    if simulator.latency:
+                        time.sleep(simulator.latency)
+                    if simulator.outage is not None:
+                        return self._reply(simulator.outage, b'Bad Gateway')
+                    if parts.path == '/generate_204':
+                        if simulator.online(client_ip):
+                            return self._reply(204)
+                        # 未认证时被网关劫持到认证页
+                        return self._reply(302, headers=[('Location', f"{simulator.base_url}/a79.htm")])
+                    if is_login:
+                        status, payload = simulator._login(query)
+                    elif parts.path.endswith('/logout'):
+                        status, payload = simulator._logout(query)
+                    elif parts.path == '/drcom/chkstatus':
+                        status, payload = simulator._status(client_ip)
+                    else:
+                        return self._reply(200, b'<html>ePortal</html>', [('Content-Type', 'text/html')])
+                    if payload is None:
+                        return self._reply(status, b'Bad Gateway')
+                    callback = query.get('callback', 'dr1003')
+                    body = f"{callback}({json.dumps(payload, ensure_ascii=False)});".encode('utf-8')
+                    self._reply(status, body, [('Content-Type', 'application/javascript; charset=utf-8')])
+                finally:
+                    if is_login:
+                        with simulator._lock:
+                            simulator.in_flight -= 1
+
+        return Handler
+
+
+Mail = collections.namedtuple('Mail', ['received', 'sender', 'recipients', 'data'])
+
+
+class SmtpSink:
+    """最小的本地 SMTP 服务器：支持 EHLO/AUTH (任意凭据)/MAIL/RCPT/DATA/NOOP/RSET/QUIT，不支持 TLS
+    (客户端使用 smtp_security = plain)。收到的邮件保存在 messages 中，received 为 time.time()。
+
+    latency 为每条命令的额外延迟 (秒)，reject 为真时 DATA 结束后返回 451 临时失败。
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.reject = False
+        self.messages = []
+        self._cond = threading.Condition()
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                sink._session(self.rfile, self.wfile)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait_for(self, count, timeout):
+        """等待累计收到 count 封邮件，返回是否在 timeout 秒内收到。"""
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def _session(self, rfile, wfile):
+        def reply(line):
+            wfile.write(line.encode('ascii') + b'\r\n')
+            wfile.flush()
+
+        reply('220 snaf-sink ESMTP')
+        sender, recipients = None, []
+        while True:
+            line = rfile.readline()
+            if not line:
+                return
+            if self.latency:
+                time.sleep(self.latency)
+            command = line.decode('utf-8', errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                reply('250-snaf-sink')
+                reply('250-AUTH PLAIN LOGIN')
+                reply('250 8BITMIME')
+            elif verb == 'HELO':
+                reply('250 snaf-sink')
+            elif verb == 'AUTH':
+                mechanism = command.split()[1].upper() if len(command.split()) > 1 else ''
+                if mechanism == 'LOGIN':
+                    # 用户名和密码可能在 AUTH 行中给出，也可能分别作为后续行
+                    if len(command.split()) < 3:
+                        reply('334 VXNlcm5hbWU6')
+                        rfile.readline()
+                    reply('334 UGFzc3dvcmQ6')
+                    rfile.readline()
+                elif len(command.split()) < 3:
+                    reply('334 ')
+                    rfile.readline()
+                reply('235 2.7.0 Authentication successful')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip().split()[0].strip('<>'), []
+                reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                reply('250 OK')
+            elif verb == 'DATA':
+                reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                if self.reject:
+                    reply('451 4.3.0 Temporary failure')
+                    continue
+                with self._cond:
+                    self.messages.append(Mail(time.time(), sender, recipients, b''.join(lines)))
+                    self._cond.notify_all()
+                reply('250 OK queued')
+            elif verb in ('NOOP', 'RSET'):
+                reply('250 OK')
+            elif verb == 'QUIT':
+                reply('221 Bye')
+                return
+            else:
+                reply('502 Command not implemented')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 ePortal / SMTP 模拟器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--portal-port', type=int, default=8080)
+    parser.add_argument('--smtp-port', type=int, default=2525)
+    parser.add_argument('--latency', type=float, default=0.0, help='Portal 每个请求的额外延迟 (秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='登录请求随机返回 502 的概率')
+    parser.add_argument('--session-ttl', type=float, help='会话寿命 (秒)，默认不过期')
+    parser.add_argument('--client-ip', help='来自本机回环地址的请求视为该 IP (应与 campus_prefix 匹配)')
+    args = parser.parse_args()
+
+    portal = PortalSimulator(args.host, args.portal_port, latency=args.latency, error_rate=args.error_rate,
+                             session_ttl=args.session_ttl, default_ip=args.client_ip).start()
+    sink = SmtpSink(args.host, args.smtp_port).start()
+    print(f"ePortal 模拟器: {portal.base_url}/eportal/portal/login  状态: {portal.base_url}/drcom/chkstatus")
+    print(f"SMTP 模拟器: {sink.address[0]}:{sink.address[1]} (smtp_security = plain)")
+    print("Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"会话 {len(portal.sessions)} 个, 邮件 {len(sink.messages)} 封, 请求统计 {dict(portal.stats)}")
+    except KeyboardInterrupt:
+        portal.stop()
+        sink.stop()
+
+
+if __name__ == '__main__':
+    main()